@@ -9,11 +9,13 @@ https://docs.djangoproject.com/en/1.7/ref/settings/
 """
 
 from django.conf import global_settings
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
 import dj_database_url
 import multiprocessing
+import tempfile
 
 BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
@@ -84,6 +86,8 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'hub.middleware.OtherFormBuilderRedirectMiddleware',
+    'kpi.middleware.PermissionCacheMiddleware',
+    'kpi.middleware.CommitHookMiddleware',
     # 'users.middleware.EmailModelBackend',
 )
 
@@ -112,6 +116,19 @@ ALLOWED_ANONYMOUS_PERMISSIONS = (
     'kpi.view_collection',
     'kpi.view_asset',
 )
+# Recalculate the inherited permissions of collection subtrees with a handful
+# of set-based SQL statements (one per tree level) instead of object by object
+SET_BASED_PERMISSION_RECALCULATION = os.environ.get(
+    'SET_BASED_PERMISSION_RECALCULATION', 'False') == 'True'
+# Recalculate the permissions of collection descendants in a Celery task,
+# keyed by tree, sent once the request that changed them has committed.
+# Requests for the same tree made within the delay (in seconds) are
+# coalesced, which requires a cache shared by all processes; see CACHES.
+# Ignored when CELERY_ALWAYS_EAGER is set
+ASYNC_PERMISSION_RECALCULATION = os.environ.get(
+    'ASYNC_PERMISSION_RECALCULATION', 'False') == 'True'
+ASYNC_PERMISSION_RECALCULATION_DELAY = int(os.environ.get(
+    'ASYNC_PERMISSION_RECALCULATION_DELAY', 5))
 
 
 # Database
@@ -125,6 +142,21 @@ for db in DATABASES.values():
     if db['ENGINE'] == 'django.contrib.gis.db.backends.postgis':
         db['ENGINE'] = 'django.db.backends.postgresql_psycopg2'
 
+# Cache
+# https://docs.djangoproject.com/en/1.8/ref/settings/#caches
+# XForm compilation and asynchronous permission recalculation coordinate
+# processes through the cache, which must then be shared by all of them, e.g. memcached or
+# `django.core.cache.backends.db.DatabaseCache` (see `createcachetable`). The
+# default keeps a separate cache in each process
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'DJANGO_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -259,7 +291,81 @@ assert ENKETO_VERSION in ['legacy', 'express']
 ENKETO_PREVIEW_URI = 'webform/preview' if ENKETO_VERSION == 'legacy' else 'preview'
 # The number of hours to keep a kobo survey preview (generated for enketo)
 # around before purging it.
-KOBO_SURVEY_PREVIEW_EXPIRATION = os.environ.get('KOBO_SURVEY_PREVIEW_EXPIRATION', 24)
+KOBO_SURVEY_PREVIEW_EXPIRATION = int(os.environ.get(
+    'KOBO_SURVEY_PREVIEW_EXPIRATION', 24))
+# Asset snapshots tied to a version are purged when more than this many exist
+# for the same asset, oldest first. 0 means no limit
+ASSET_SNAPSHOT_KEEP_LATEST = int(os.environ.get(
+    'ASSET_SNAPSHOT_KEEP_LATEST', 5))
+# When more than this many snapshots exist in total, the least recently
+# accessed ones are purged. 0 means no limit
+ASSET_SNAPSHOT_MAX_COUNT = int(os.environ.get(
+    'ASSET_SNAPSHOT_MAX_COUNT', 100000))
+# Snapshots are deleted this many at a time, and at most
+# ASSET_SNAPSHOT_PURGE_MAX_BATCHES batches are deleted per purge
+ASSET_SNAPSHOT_PURGE_BATCH_SIZE = int(os.environ.get(
+    'ASSET_SNAPSHOT_PURGE_BATCH_SIZE', 500))
+ASSET_SNAPSHOT_PURGE_MAX_BATCHES = int(os.environ.get(
+    'ASSET_SNAPSHOT_PURGE_MAX_BATCHES', 20))
+# Check the XForm of every new asset snapshot with the ODK validator. This
+# requires Java and is the only part of generating a snapshot that writes to
+# the filesystem
+ASSET_SNAPSHOT_VALIDATION = os.environ.get(
+    'ASSET_SNAPSHOT_VALIDATION', 'True') == 'True'
+# Return new snapshots right away and validate them in a Celery task, which
+# records the outcome in the snapshot's `details`. Ignored when
+# CELERY_ALWAYS_EAGER is set
+DEFERRED_ASSET_SNAPSHOT_VALIDATION = os.environ.get(
+    'DEFERRED_ASSET_SNAPSHOT_VALIDATION', 'False') == 'True'
+# How long, in seconds, to remember the outcome of validating an XForm
+XFORM_VALIDATION_CACHE_TIMEOUT = int(os.environ.get(
+    'XFORM_VALIDATION_CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+# Compile XForms for asset snapshots in a pool of this many processes per
+# host. `manage.py run_xform_compiler`, which uwsgi.ini starts, runs the
+# pool and serves the web and Celery processes at XFORM_COMPILER_ADDRESS,
+# either `host:port` or the path of a Unix socket. Processes that can't
+# reach it use a pool of their own, except Celery workers, which compile
+# inline
+XFORM_COMPILER_PROCESSES = int(os.environ.get('XFORM_COMPILER_PROCESSES', 2))
+XFORM_COMPILER_ADDRESS = os.environ.get(
+    'XFORM_COMPILER_ADDRESS', '/tmp/kpi_xform_compiler.sock')
+# Seconds to wait for a compilation before giving up
+XFORM_COMPILER_TIMEOUT = int(os.environ.get('XFORM_COMPILER_TIMEOUT', 300))
+# Cache the XLS, XLSX, ssjson, and Markdown table exports of each asset
+# version. Set the backend to 'kpi.utils.artifact_cache.DummyArtifactCache'
+# to disable caching
+EXPORT_ARTIFACT_CACHE_BACKEND = os.environ.get(
+    'EXPORT_ARTIFACT_CACHE_BACKEND',
+    'kpi.utils.artifact_cache.FileSystemArtifactCache'
+)
+EXPORT_ARTIFACT_CACHE_OPTIONS = {
+    'directory': os.environ.get(
+        'EXPORT_ARTIFACT_CACHE_DIR',
+        os.path.join(tempfile.gettempdir(), 'kpi_export_artifacts')
+    ),
+    # In bytes; the least recently used exports are evicted beyond this
+    'max_size': int(os.environ.get(
+        'EXPORT_ARTIFACT_CACHE_MAX_SIZE', 256 * 1024 * 1024)),
+}
+# Store the `content` of new asset versions as deltas against the latest
+# keyframe, i.e. a version stored in full. Existing history can be converted
+# with the `compress_asset_versions` management command
+ASSET_VERSION_DELTA_STORAGE = os.environ.get(
+    'ASSET_VERSION_DELTA_STORAGE', 'False') == 'True'
+# Store every Nth version of an asset as a keyframe
+ASSET_VERSION_KEYFRAME_INTERVAL = int(os.environ.get(
+    'ASSET_VERSION_KEYFRAME_INTERVAL', 10))
+# Collapse runs of asset versions that are older than this many days and
+# have neither been deployed nor snapshotted into the newest of each run.
+# Runs daily when ASSET_VERSION_COMPACTION is enabled; see also the
+# `compact_asset_versions` management command
+ASSET_VERSION_COMPACTION = os.environ.get(
+    'ASSET_VERSION_COMPACTION', 'False') == 'True'
+ASSET_VERSION_COMPACTION_MIN_AGE_DAYS = int(os.environ.get(
+    'ASSET_VERSION_COMPACTION_MIN_AGE_DAYS', 30))
+# Compact the versions of this many assets per transaction
+ASSET_VERSION_COMPACTION_BATCH_SIZE = int(os.environ.get(
+    'ASSET_VERSION_COMPACTION_BATCH_SIZE', 100))
 
 ENKETO_API_TOKEN = os.environ.get('ENKETO_API_TOKEN', 'enketorules')
 # http://apidocs.enketo.org/v2/
@@ -269,6 +375,11 @@ ENKETO_SURVEY_ENDPOINT = 'api/v2/survey/all'
 if os.environ.get('SKIP_CELERY', 'False') == 'True':
     # helpful for certain debugging
     CELERY_ALWAYS_EAGER = True
+elif ASYNC_PERMISSION_RECALCULATION and \
+        CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+    raise ImproperlyConfigured(
+        'ASYNC_PERMISSION_RECALCULATION requires a cache shared by all '
+        'processes; set DJANGO_CACHE_BACKEND')
 
 # Celery defaults to having as many workers as there are cores. To avoid
 # excessive resource consumption, don't spawn more than 6 workers by default
@@ -293,6 +404,11 @@ CELERYBEAT_SCHEDULE = {
     #    'task': 'kpi.tasks.update_search_index',
     #    'schedule': timedelta(hours=12)
     #},
+    # Enforce the asset snapshot expiration policies
+    'purge-asset-snapshots': {
+        'task': 'kpi.tasks.purge_asset_snapshots',
+        'schedule': timedelta(hours=1),
+    },
 }
 
 if 'KOBOCAT_URL' in os.environ:
@@ -302,6 +418,12 @@ if 'KOBOCAT_URL' in os.environ:
         'schedule': timedelta(minutes=30),
     }
 
+if ASSET_VERSION_COMPACTION:
+    CELERYBEAT_SCHEDULE['compact-asset-versions'] = {
+        'task': 'kpi.tasks.compact_asset_versions',
+        'schedule': timedelta(days=1),
+    }
+
 '''
 Distinct projects using Celery need their own queues. Example commands for
 RabbitMQ queue creation:
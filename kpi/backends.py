@@ -1,7 +1,9 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import AnonymousUser
 from django.conf import settings
-from .models.object_permission import get_anonymous_user, perm_parse
+from .models.object_permission import (
+    get_anonymous_user, is_anonymous_user_id, perm_parse)
+from .utils.permission_cache import get_permission_cache
 
 class ObjectPermissionBackend(ModelBackend):
     @staticmethod
@@ -13,7 +15,7 @@ class ObjectPermissionBackend(ModelBackend):
         if isinstance(user_obj, AnonymousUser):
             is_anonymous = True
             user_obj = get_anonymous_user()
-        elif user_obj.pk == settings.ANONYMOUS_USER_ID:
+        elif is_anonymous_user_id(user_obj.pk):
             is_anonymous = True
         return user_obj, is_anonymous
 
@@ -51,6 +53,10 @@ class ObjectPermissionBackend(ModelBackend):
         if not user_obj.is_active:
             # Inactive users are denied immediately
             return False
+        permission_cache = get_permission_cache()
+        if permission_cache is not None:
+            # Answer from memory; the cache mirrors the object-level test
+            return permission_cache.has_perm(user_obj, perm, obj)
         # Trust the object-level test to handle anonymous users correctly
         return obj.has_perm(user_obj, perm)
 
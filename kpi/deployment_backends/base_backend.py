@@ -1,15 +1,50 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
 
 class BaseDeploymentBackend:
     def __init__(self, asset):
         self.asset = asset
 
     def store_data(self, vals={}):
+        # Avoid a circular import
+        from ..models.asset_deployment_event import AssetDeploymentEvent
+        previous_state = self._event_state()
         self.asset._deployment_data.update(vals)
         # should we automatically save?
         self.asset.save()
+        version_id, backend, identifier, active = self._event_state()
+        if (version_id, backend, identifier, active) != previous_state:
+            AssetDeploymentEvent.objects.create(
+                asset=self.asset,
+                version_id=version_id,
+                backend=backend,
+                identifier=identifier,
+                active=active,
+                timestamp=self._event_timestamp(),
+            )
+
+    def _event_state(self):
+        ''' The deployment details recorded by an AssetDeploymentEvent '''
+        return self.version, self.backend, self.identifier or '', self.active
+
+    def _event_timestamp(self):
+        ''' The deployment's `timestamp` as a datetime, or the current time
+        if the backend doesn't provide one '''
+        timestamp = self.timestamp
+        if isinstance(timestamp, basestring):
+            try:
+                timestamp = parse_datetime(timestamp)
+            except ValueError:
+                timestamp = None
+        if timestamp is None:
+            return timezone.now()
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, timezone.utc)
+        return timestamp
 
     @property
     def backend(self):
@@ -26,3 +61,7 @@ class BaseDeploymentBackend:
     @property
     def version(self):
         return self.asset._deployment_data.get('version', None)
+
+    @property
+    def timestamp(self):
+        return None
@@ -15,6 +15,7 @@ class MockDeploymentBackend(BaseDeploymentBackend):
                 'backend': 'mock',
                 'identifier': 'mock://%s' % self.asset.uid,
                 'active': active,
+                'version': self.asset.version_id,
             })
 
     def set_active(self, active):
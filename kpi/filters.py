@@ -9,7 +9,8 @@ from haystack.query import SearchQuerySet
 from haystack.inputs import Raw
 from haystack.constants import ITERATOR_LOAD_PER_QUERY
 
-from .models.object_permission import get_objects_for_user, get_anonymous_user
+from .models.object_permission import (
+    get_database_user_id, get_objects_for_user, is_anonymous_user_id)
 
 
 class KpiObjectPermissionsFilter(object):
@@ -34,15 +35,15 @@ class KpiObjectPermissionsFilter(object):
         permission = self.perm_format % kwargs
 
         if user.is_anonymous():
-            user = get_anonymous_user()
             # Avoid giving anonymous users special treatment when viewing
             # public objects
             owned_and_explicitly_shared = queryset.none()
         else:
             owned_and_explicitly_shared = get_objects_for_user(
                 user, permission, queryset)
-        public = get_objects_for_user(
-            get_anonymous_user(), permission, queryset)
+        # get_objects_for_user() needs only the id of the anonymous user
+        public = get_objects_for_user(AnonymousUser(), permission, queryset)
+        user_id = get_database_user_id(user)
         if view.action != 'list':
             # Not a list, so discoverability doesn't matter
             return owned_and_explicitly_shared | public
@@ -69,13 +70,14 @@ class KpiObjectPermissionsFilter(object):
         # Of the discoverable objects, determine to which the user has
         # subscribed
         try:
-            subscribed = public.filter(usercollectionsubscription__user=user)
+            subscribed = public.filter(
+                usercollectionsubscription__user=user_id)
         except FieldError:
             try:
                 # The model does not have a subscription relation, but maybe
                 # its parent does
                 subscribed = public.filter(
-                    parent__usercollectionsubscription__user=user)
+                    parent__usercollectionsubscription__user=user_id)
             except FieldError:
                 # Neither the model or its parent has a subscription relation
                 subscribed = public.none()
@@ -126,14 +128,13 @@ class KpiAssignedObjectPermissionsFilter(filters.BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
         # TODO: omit objects for which the user has only a deny permission
         user = request.user
-        if isinstance(request.user, AnonymousUser):
-            user = get_anonymous_user()
         if user.is_superuser:
             # Superuser sees all
             return queryset
-        if user.pk == settings.ANONYMOUS_USER_ID:
+        user_id = get_database_user_id(user)
+        if is_anonymous_user_id(user_id):
             # Hide permissions for real users from anonymous users
-            return queryset.filter(user=user)
+            return queryset.filter(user_id=user_id)
         # A regular user sees permissions for objects to which they have access
         content_type_ids = queryset.values_list(
             'content_type', flat=True).distinct()
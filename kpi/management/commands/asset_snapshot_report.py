@@ -0,0 +1,54 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import Length
+
+from ...models import AssetSnapshot
+from ...utils.asset_snapshot_purge import (
+    plan_asset_snapshot_purge,
+    purge_asset_snapshots,
+)
+
+
+class Command(BaseCommand):
+    help = 'Report the size of the asset snapshot table and which ' \
+        'snapshots the expiration policies would purge'
+    option_list = BaseCommand.option_list + (
+        make_option('--purge',
+            action='store_true',
+            dest='purge',
+            default=False,
+            help='Purge the snapshots instead of only reporting them'),
+    )
+
+    def _write(self, label, value):
+        self.stdout.write(u'{:<32}{}'.format(label, value))
+
+    def handle(self, *args, **options):
+        snapshots = AssetSnapshot.objects.all()
+        stats = snapshots.aggregate(
+            xml_length=Sum(Length('xml')),
+            oldest=Min('date_created'),
+            newest=Max('date_created'),
+            last_accessed=Max('date_accessed'),
+        )
+        self._write('Snapshots', snapshots.count())
+        self._write('  source-only (previews)',
+                    snapshots.filter(asset_version_id=None).count())
+        self._write('  versioned',
+                    snapshots.exclude(asset_version_id=None).count())
+        self._write('Total XML characters', stats['xml_length'] or 0)
+        self._write('Oldest', stats['oldest'])
+        self._write('Newest', stats['newest'])
+        self._write('Last accessed', stats['last_accessed'])
+        if options['purge']:
+            self.stdout.write('Purged:')
+            results = purge_asset_snapshots()
+        else:
+            self.stdout.write('Would purge:')
+            results = plan_asset_snapshot_purge()
+        for policy, value in results.iteritems():
+            if isinstance(value, list):
+                value = len(value)
+            self._write(u'  {}'.format(policy), value)
@@ -0,0 +1,61 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...utils.save_benchmark import SaveBenchmark
+
+
+class Command(BaseCommand):
+    help = 'Time saving a large synthetic survey and print the results as ' \
+        'JSON. Nothing is saved to the database.'
+    option_list = BaseCommand.option_list + (
+        make_option('--rows',
+            action='store',
+            dest='rows',
+            type='int',
+            default=3000,
+            help='Number of questions'),
+        make_option('--languages',
+            action='store',
+            dest='languages',
+            type='int',
+            default=10,
+            help='Number of translations of each label and hint'),
+        make_option('--choices',
+            action='store',
+            dest='choices',
+            type='int',
+            default=5,
+            help='Number of choices of each select_one question'),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of times to run each kind of save'),
+        make_option('--output',
+            action='store',
+            dest='output',
+            default=None,
+            help='Write the results to this file instead of stdout'),
+    )
+
+    def handle(self, *args, **options):
+        benchmark = SaveBenchmark(
+            rows=options['rows'],
+            languages=options['languages'],
+            choices=options['choices'],
+            repeat=options['repeat'],
+        )
+        with transaction.atomic():
+            results = benchmark.run()
+            # Leave the database as we found it
+            transaction.set_rollback(True)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
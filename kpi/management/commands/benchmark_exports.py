@@ -0,0 +1,56 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...utils.export_benchmark import ExportBenchmark
+
+
+class Command(BaseCommand):
+    help = 'Time exporting a synthetic survey as XLS and XLSX, measure ' \
+        'the memory used, and print the results as JSON'
+    option_list = BaseCommand.option_list + (
+        make_option('--rows',
+            action='store',
+            dest='rows',
+            type='int',
+            default=3000,
+            help='Number of questions'),
+        make_option('--languages',
+            action='store',
+            dest='languages',
+            type='int',
+            default=40,
+            help='Number of translations of each label and hint'),
+        make_option('--choices',
+            action='store',
+            dest='choices',
+            type='int',
+            default=5,
+            help='Number of choices of each select_one question'),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of times to run each export'),
+        make_option('--output',
+            action='store',
+            dest='output',
+            default=None,
+            help='Write the results to this file instead of stdout'),
+    )
+
+    def handle(self, *args, **options):
+        benchmark = ExportBenchmark(
+            rows=options['rows'],
+            languages=options['languages'],
+            choices=options['choices'],
+            repeat=options['repeat'],
+        )
+        output = json.dumps(benchmark.run(), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,90 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from ...utils.permission_benchmark import PermissionBenchmark
+
+
+class Command(BaseCommand):
+    help = 'Time permission operations on a synthetic collection tree and ' \
+        'print the results as JSON. Nothing is saved to the database.'
+    option_list = BaseCommand.option_list + (
+        make_option('--depth',
+            action='store',
+            dest='depth',
+            type='int',
+            default=3,
+            help='Number of collection levels'),
+        make_option('--fan-out',
+            action='store',
+            dest='fan_out',
+            type='int',
+            default=3,
+            help='Number of child collections per collection'),
+        make_option('--assets-per-collection',
+            action='store',
+            dest='assets_per_collection',
+            type='int',
+            default=2,
+            help='Number of assets per collection'),
+        make_option('--collaborators',
+            action='store',
+            dest='collaborators',
+            type='int',
+            default=5,
+            help='Number of users granted access within the tree'),
+        make_option('--deny-rules',
+            action='store',
+            dest='deny_rules',
+            type='int',
+            default=2,
+            help='Number of grants to revoke further down the tree'),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of times to run each operation'),
+        make_option('--seed',
+            action='store',
+            dest='seed',
+            type='int',
+            default=0,
+            help='Seed for choosing where to grant and deny access'),
+        make_option('--set-based',
+            action='store_true',
+            dest='set_based',
+            default=False,
+            help='Enable SET_BASED_PERMISSION_RECALCULATION'),
+        make_option('--output',
+            action='store',
+            dest='output',
+            default=None,
+            help='Write the results to this file instead of stdout'),
+    )
+
+    def handle(self, *args, **options):
+        benchmark = PermissionBenchmark(
+            depth=options['depth'],
+            fan_out=options['fan_out'],
+            assets_per_collection=options['assets_per_collection'],
+            collaborators=options['collaborators'],
+            deny_rules=options['deny_rules'],
+            repeat=options['repeat'],
+            seed=options['seed'],
+        )
+        with override_settings(
+                SET_BASED_PERMISSION_RECALCULATION=options['set_based']):
+            with transaction.atomic():
+                results = benchmark.run()
+                # Leave the database as we found it
+                transaction.set_rollback(True)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
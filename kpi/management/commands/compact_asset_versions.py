@@ -0,0 +1,49 @@
+import datetime
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...utils.asset_version_compaction import compact_asset_versions
+
+
+class Command(BaseCommand):
+    help = 'Collapse runs of old asset versions that have neither been ' \
+        'deployed nor snapshotted into the newest version of each run'
+    option_list = BaseCommand.option_list + (
+        make_option('--min-age-days',
+            action='store',
+            dest='min_age_days',
+            type='int',
+            default=None,
+            help='Only collapse versions older than this. Defaults to '
+                 'ASSET_VERSION_COMPACTION_MIN_AGE_DAYS'),
+        make_option('--batch-size',
+            action='store',
+            dest='batch_size',
+            type='int',
+            default=None,
+            help='Number of assets to compact in each transaction. '
+                 'Defaults to ASSET_VERSION_COMPACTION_BATCH_SIZE'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Report what would be removed without changing anything'),
+    )
+
+    def handle(self, *args, **options):
+        min_age_days = options['min_age_days']
+        if min_age_days is None:
+            min_age_days = settings.ASSET_VERSION_COMPACTION_MIN_AGE_DAYS
+        stats = compact_asset_versions(
+            min_age=datetime.timedelta(days=min_age_days),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write('Would remove:')
+        else:
+            self.stdout.write('Removed:')
+        for label, value in stats.iteritems():
+            self.stdout.write(u'  {:<30}{}'.format(label, value))
@@ -0,0 +1,76 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from reversion.models import Version
+
+from ...models import Asset
+from ...models.asset_version import rewrite_versions
+
+
+class Command(BaseCommand):
+    help = 'Convert the existing version history of every asset to ' \
+        'keyframes and deltas, or back to complete versions'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action='store',
+            dest='batch_size',
+            type='int',
+            default=100,
+            help='Number of assets to convert in each transaction'),
+        make_option('--keyframe-interval',
+            action='store',
+            dest='keyframe_interval',
+            type='int',
+            default=None,
+            help='Store every Nth version in full. Defaults to '
+                 'ASSET_VERSION_KEYFRAME_INTERVAL'),
+        make_option('--decompress',
+            action='store_true',
+            dest='decompress',
+            default=False,
+            help='Store every version in full again'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Report the savings without changing anything'),
+    )
+
+    def handle(self, *args, **options):
+        if options['decompress']:
+            keyframe_interval = 1
+        elif options['keyframe_interval'] is not None:
+            keyframe_interval = options['keyframe_interval']
+        else:
+            keyframe_interval = settings.ASSET_VERSION_KEYFRAME_INTERVAL
+        batch_size = options['batch_size']
+        save = not options['dry_run']
+        asset_versions = Version.objects.filter(
+            content_type=ContentType.objects.get_for_model(Asset))
+        total_before = total_after = asset_count = 0
+        last_asset_id = 0
+        while True:
+            asset_ids = list(asset_versions.filter(
+                object_id_int__gt=last_asset_id
+            ).order_by('object_id_int').values_list(
+                'object_id_int', flat=True).distinct()[:batch_size])
+            if not asset_ids:
+                break
+            with transaction.atomic():
+                for asset_id in asset_ids:
+                    length_before, length_after = rewrite_versions(
+                        asset_versions.filter(object_id_int=asset_id),
+                        keyframe_interval,
+                        save=save
+                    )
+                    total_before += length_before
+                    total_after += length_after
+            asset_count += len(asset_ids)
+            last_asset_id = asset_ids[-1]
+            self.stdout.write(u'{} assets: {} -> {} characters'.format(
+                asset_count, total_before, total_after))
+        if options['dry_run']:
+            self.stdout.write('Dry run; nothing was changed')
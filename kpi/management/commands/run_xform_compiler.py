@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...utils.xform_compiler import serve
+
+
+class Command(BaseCommand):
+    help = 'Compile XForms for asset snapshots on behalf of every web and ' \
+        'Celery process on this host, in a pool of a fixed size'
+    option_list = BaseCommand.option_list + (
+        make_option('--address',
+            action='store',
+            dest='address',
+            default=None,
+            help='host:port or Unix socket path to listen on. Defaults to '
+                 'XFORM_COMPILER_ADDRESS'),
+        make_option('--processes',
+            action='store',
+            dest='processes',
+            type='int',
+            default=None,
+            help='Number of compiling processes. Defaults to '
+                 'XFORM_COMPILER_PROCESSES'),
+    )
+
+    def handle(self, *args, **options):
+        address = options['address'] or settings.XFORM_COMPILER_ADDRESS
+        processes = options['processes']
+        if processes is None:
+            processes = settings.XFORM_COMPILER_PROCESSES
+        self.stdout.write(u'Compiling XForms in {} processes at {}'.format(
+            processes, address))
+        serve(address, processes, settings.XFORM_COMPILER_TIMEOUT)
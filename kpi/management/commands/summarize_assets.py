@@ -1,15 +1,85 @@
+import multiprocessing
+import time
+from optparse import make_option
+
 from django.core.management.base import BaseCommand, CommandError
-from kpi.models import Asset
+from django.db import connections
+
+from ...utils.asset_summaries import (
+    _summarize_asset_chunk,
+    asset_pk_chunks,
+    summarize_asset_chunk,
+)
 
-def _set_auto_field_update(kls, field_name, val):
-    field = filter(lambda f: f.name == field_name, kls._meta.fields)[0]
-    field.auto_now = val
-    field.auto_now_add = val
 
 class Command(BaseCommand):
+    help = 'Recompute the summary of every asset. Only summaries are ' \
+        'written: no versions are created, and neither permissions nor ' \
+        'the search index are updated.'
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+            action='store',
+            dest='chunk_size',
+            type='int',
+            default=500,
+            help='Number of assets to load and update at a time'),
+        make_option('--processes',
+            action='store',
+            dest='processes',
+            type='int',
+            default=1,
+            help='Number of processes that summarize chunks in parallel'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Count the summaries that would change without writing '
+                 'them'),
+    )
+
     def handle(self, *args, **options):
-        _set_auto_field_update(Asset, 'date_modified', False)
-        assets = Asset.objects.all()
-        for asset in assets:
-            asset.save()
-        _set_auto_field_update(Asset, 'date_modified', True)
+        chunk_size = options['chunk_size']
+        processes = options['processes']
+        dry_run = options['dry_run']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if processes < 1:
+            raise CommandError('--processes must be at least 1')
+        chunks = [(first_pk, last_pk, dry_run)
+                  for first_pk, last_pk in asset_pk_chunks(chunk_size)]
+        start = time.time()
+        if processes == 1:
+            results = (summarize_asset_chunk(*chunk) for chunk in chunks)
+        else:
+            # Each worker must open its own database connection rather than
+            # share the one inherited from this process
+            for connection in connections.all():
+                connection.close()
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(_summarize_asset_chunk, chunks)
+        examined = changed = 0
+        try:
+            for chunk_examined, chunk_changed in results:
+                examined += chunk_examined
+                changed += chunk_changed
+                elapsed = time.time() - start
+                self.stdout.write(
+                    u'{} assets, {} summaries {}, {:.1f} assets/s'.format(
+                        examined,
+                        changed,
+                        'to change' if dry_run else 'changed',
+                        examined / elapsed if elapsed else 0,
+                    )
+                )
+        finally:
+            if processes > 1:
+                pool.close()
+                pool.join()
+        if dry_run:
+            self.stdout.write(
+                u'Dry run: {} of {} summaries would change'.format(
+                    changed, examined))
+        else:
+            self.stdout.write(
+                u'Updated {} of {} summaries in {:.1f}s'.format(
+                    changed, examined, time.time() - start))
@@ -0,0 +1,38 @@
+from .utils.commit_hooks import (
+    activate_commit_hooks, deactivate_commit_hooks)
+from .utils.permission_cache import (
+    activate_permission_cache, deactivate_permission_cache)
+
+
+class PermissionCacheMiddleware(object):
+    '''
+    Give each request its own permission cache, so that repeated has_perm()
+    checks on the same objects are answered from memory
+    '''
+    def process_request(self, request):
+        activate_permission_cache()
+
+    def process_response(self, request, response):
+        deactivate_permission_cache()
+        return response
+
+    def process_exception(self, request, exception):
+        deactivate_permission_cache()
+
+
+class CommitHookMiddleware(object):
+    '''
+    Run the callbacks registered with kpi.utils.commit_hooks.on_commit()
+    during a request once the response is ready, by which time the view's
+    transactions have been committed
+    '''
+    def process_request(self, request):
+        activate_commit_hooks()
+
+    def process_response(self, request, response):
+        deactivate_commit_hooks()
+        return response
+
+    def process_exception(self, request, exception):
+        # The view's changes may have been rolled back
+        deactivate_commit_hooks(run=False)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.conf import settings
+
+# The bits of `UserObjectAccess.permissions` as of this migration. Later
+# changes to the live code must not change what this migration does
+ACCESS_BITS = {
+    'view': 1,
+    'change': 2,
+}
+
+
+def calculate_access_masks(permission_rows):
+    ''' Reconcile grant and deny permissions into access bitmasks. Expects an
+    iterable of (object_id, user_id, codename, deny) tuples, all for the same
+    content type, and returns a dictionary of
+    `{(object_id, user_id): bitmask}`. Permissions for the anonymous user are
+    limited to those allowed by settings.ALLOWED_ANONYMOUS_PERMISSIONS. '''
+    grants = set()
+    denies = set()
+    for object_id, user_id, codename, deny in permission_rows:
+        if deny:
+            denies.add((object_id, user_id, codename))
+        else:
+            grants.add((object_id, user_id, codename))
+    anonymous_codenames = set(
+        perm.split('.', 1)[-1]
+        for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS
+    )
+    masks = defaultdict(int)
+    for object_id, user_id, codename in grants.difference(denies):
+        if user_id == settings.ANONYMOUS_USER_ID and (
+                codename not in anonymous_codenames):
+            continue
+        bit = ACCESS_BITS.get(codename.split('_', 1)[0])
+        if bit is None:
+            # Not an assignable permission; nothing to record
+            continue
+        masks[(object_id, user_id)] |= bit
+    return masks
+
+
+def populate_access_index(apps, schema_editor):
+    ObjectPermission = apps.get_model('kpi', 'ObjectPermission')
+    UserObjectAccess = apps.get_model('kpi', 'UserObjectAccess')
+    db_alias = schema_editor.connection.alias
+    rows_by_content_type = defaultdict(list)
+    permission_rows = ObjectPermission.objects.using(db_alias).values_list(
+        'content_type_id', 'object_id', 'user_id', 'permission__codename',
+        'deny'
+    )
+    for content_type_id, object_id, user_id, codename, deny in \
+            permission_rows.iterator():
+        rows_by_content_type[content_type_id].append(
+            (object_id, user_id, codename, deny))
+    for content_type_id, rows in rows_by_content_type.iteritems():
+        masks = calculate_access_masks(rows)
+        UserObjectAccess.objects.using(db_alias).bulk_create([
+            UserObjectAccess(
+                user_id=user_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+                permissions=mask
+            ) for (object_id, user_id), mask in masks.iteritems()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('kpi', '0014_discoverable_subscribable_collections'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserObjectAccess',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('permissions', models.PositiveIntegerField(default=0)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='userobjectaccess',
+            unique_together=set([('user', 'content_type', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='userobjectaccess',
+            index_together=set([('content_type', 'object_id')]),
+        ),
+        migrations.RunPython(
+            populate_access_index,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0015_userobjectaccess'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assetsnapshot',
+            name='source_hash',
+            field=models.CharField(max_length=40, blank=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_date_created(apps, schema_editor):
+    AssetSnapshot = apps.get_model('kpi', 'AssetSnapshot')
+    AssetSnapshot.objects.using(schema_editor.connection.alias).update(
+        date_accessed=models.F('date_created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0016_assetsnapshot_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assetsnapshot',
+            name='date_accessed',
+            field=models.DateTimeField(default=django.utils.timezone.now, db_index=True),
+        ),
+        migrations.RunPython(copy_date_created, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_current_version_id(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Version = apps.get_model('reversion', 'Version')
+    Asset = apps.get_model('kpi', 'Asset')
+    db_alias = schema_editor.connection.alias
+    try:
+        asset_content_type = ContentType.objects.using(db_alias).get(
+            app_label='kpi', model='asset')
+    except ContentType.DoesNotExist:
+        # A new database has no versions to copy
+        return
+    latest_versions = Version.objects.using(db_alias).filter(
+        content_type=asset_content_type
+    ).values('object_id_int').annotate(latest=models.Max('pk'))
+    for row in latest_versions.iterator():
+        Asset.objects.using(db_alias).filter(pk=row['object_id_int']).update(
+            current_version_id=row['latest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reversion', '0002_auto_20141216_1509'),
+        ('kpi', '0017_assetsnapshot_date_accessed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='current_version_id',
+            field=models.IntegerField(null=True, editable=False),
+        ),
+        migrations.RunPython(
+            populate_current_version_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import json
+
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import django.utils.timezone
+
+
+def _deployment_data(serialized_data):
+    ''' Extract `_deployment_data` from the JSON serialization of an asset
+    stored by reversion '''
+    try:
+        fields = json.loads(serialized_data)[0]['fields']
+    except (ValueError, LookupError):
+        return {}
+    deployment_data = fields.get('_deployment_data') or {}
+    if isinstance(deployment_data, basestring):
+        # JSONField values may be serialized as strings
+        try:
+            deployment_data = json.loads(deployment_data)
+        except ValueError:
+            return {}
+    return deployment_data
+
+
+def _deployment_timestamp(deployment_data, default):
+    ''' The time the deployment backend reported for `deployment_data`, like
+    KobocatDeploymentBackend.timestamp, or `default` '''
+    backend_response = deployment_data.get('backend_response') or {}
+    timestamp = backend_response.get('date_modified')
+    if isinstance(timestamp, basestring):
+        try:
+            timestamp = parse_datetime(timestamp)
+        except ValueError:
+            timestamp = None
+    if timestamp is None:
+        return default
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, timezone.utc)
+    return timestamp
+
+
+def populate_deployment_events(apps, schema_editor):
+    ''' Recover what can be known about past deployments from the versions
+    of each deployed asset '''
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Version = apps.get_model('reversion', 'Version')
+    Asset = apps.get_model('kpi', 'Asset')
+    AssetDeploymentEvent = apps.get_model('kpi', 'AssetDeploymentEvent')
+    db_alias = schema_editor.connection.alias
+    try:
+        asset_content_type = ContentType.objects.using(db_alias).get(
+            app_label='kpi', model='asset')
+    except ContentType.DoesNotExist:
+        asset_content_type = None
+    deployed_assets = Asset.objects.using(db_alias).exclude(
+        _deployment_data='{}').only('pk', '_deployment_data', 'date_modified')
+    for asset in deployed_assets.iterator():
+        # {deployed version id: (deployment data, timestamp)}, oldest first
+        deployments = {}
+        if asset_content_type is not None:
+            versions = Version.objects.using(db_alias).filter(
+                content_type=asset_content_type, object_id_int=asset.pk
+            ).order_by('pk').values_list(
+                'serialized_data', 'revision__date_created')
+            for serialized_data, date_created in versions.iterator():
+                deployment_data = _deployment_data(serialized_data)
+                version_id = deployment_data.get('version')
+                if 'backend' in deployment_data and \
+                        version_id not in deployments:
+                    deployments[version_id] = (
+                        deployment_data,
+                        _deployment_timestamp(deployment_data, date_created)
+                    )
+        if 'backend' in asset._deployment_data:
+            # The current state of the deployment, which keeps the time its
+            # version was first deployed if that is known
+            version_id = asset._deployment_data.get('version')
+            if version_id in deployments:
+                timestamp = deployments[version_id][1]
+            else:
+                timestamp = _deployment_timestamp(
+                    asset._deployment_data, asset.date_modified)
+            deployments[version_id] = (asset._deployment_data, timestamp)
+        AssetDeploymentEvent.objects.using(db_alias).bulk_create([
+            AssetDeploymentEvent(
+                asset_id=asset.pk,
+                version_id=version_id,
+                backend=deployment_data['backend'],
+                identifier=deployment_data.get('identifier') or '',
+                active=bool(deployment_data.get('active')),
+                timestamp=timestamp,
+            ) for version_id, (deployment_data, timestamp) in sorted(
+                deployments.items(), key=lambda item: item[1][1])
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reversion', '0002_auto_20141216_1509'),
+        ('kpi', '0018_asset_current_version_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetDeploymentEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('version_id', models.IntegerField(null=True)),
+                ('backend', models.CharField(max_length=50)),
+                ('identifier', models.CharField(default='', max_length=255, blank=True)),
+                ('active', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('asset', models.ForeignKey(related_name='deployment_events', to='kpi.Asset')),
+            ],
+            options={
+                'ordering': ('timestamp', 'pk'),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='assetdeploymentevent',
+            index_together=set([('asset', 'version_id')]),
+        ),
+        migrations.RunPython(
+            populate_deployment_events, migrations.RunPython.noop),
+    ]
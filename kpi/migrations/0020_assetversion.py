@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reversion', '0002_auto_20141216_1509'),
+        ('kpi', '0019_assetdeploymentevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetVersion',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+            },
+            bases=('reversion.version',),
+        ),
+    ]
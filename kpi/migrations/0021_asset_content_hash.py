@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0020_assetversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='content_hash',
+            field=models.CharField(default='', max_length=40, editable=False, blank=True),
+        ),
+    ]
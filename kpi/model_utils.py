@@ -9,7 +9,7 @@ from django.conf import settings
 from taggit.models import Tag, TaggedItem
 from .models import Asset
 from .models import Collection
-from .models.object_permission import perm_parse
+from .models.object_permission import perm_parse, is_anonymous_user_id
 from .haystack_utils import update_object_in_search_index
 
 '''
@@ -175,7 +175,7 @@ def grant_all_model_level_perms(
     if content_types and not permissions_to_assign.exists():
         raise Exception('No permissions found! You may need to migrate your '
             'database. Searched for content types {}.'.format(content_types))
-    if user.pk == settings.ANONYMOUS_USER_ID:
+    if is_anonymous_user_id(user.pk):
         # The user is anonymous, so pare down the permissions to only those
         # that the configuration allows for anonymous users
         q_query = Q()
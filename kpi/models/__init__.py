@@ -2,7 +2,10 @@ from kpi.models.collection import Collection, CollectionChildrenQuerySet
 from kpi.models.collection import UserCollectionSubscription
 from kpi.models.asset import Asset
 from kpi.models.asset import AssetSnapshot
+from kpi.models.asset_deployment_event import AssetDeploymentEvent
+from kpi.models.asset_version import AssetVersion
 from kpi.models.object_permission import ObjectPermission, ObjectPermissionMixin
+from kpi.models.object_permission import UserObjectAccess
 from kpi.models.import_task import ImportTask
 from kpi.models.tag_uid import TagUid
 from kpi.models.authorized_application import AuthorizedApplication
@@ -1,26 +1,42 @@
-import re
 import six
 import copy
 import json
+import hashlib
+import datetime
 
 from django.contrib.contenttypes.fields import GenericRelation
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned
 from django.db import models
 from django.db import transaction
+# `settings` is a common local variable name in this module
+from django.conf import settings as django_settings
 from django.dispatch import receiver
+from django.utils import timezone
 from jsonfield import JSONField
 from taggit.managers import TaggableManager, _TaggableManager
 from taggit.utils import require_instance_manager
 from taggit.models import Tag
 from reversion import revisions as reversion
+from reversion.signals import post_revision_commit
 
 from formpack.utils.flatten_content import flatten_content
 from formpack.utils.expand_content import expand_content
-from .object_permission import ObjectPermission, ObjectPermissionMixin
+from .asset_version import AssetVersionAdapter, get_asset_versions
+from .object_permission import (
+    ObjectPermission,
+    ObjectPermissionMixin,
+    UserObjectAccess,
+)
 from ..fields import KpiUidField
+from ..utils.artifact_cache import get_artifact_cache
 from ..utils.asset_content_analyzer import AssetContentAnalyzer
+from ..utils.commit_hooks import on_commit
+from ..utils.instrumentation import increment_counter
 from ..utils.kobo_to_xlsform import to_xlsform_structure
 from ..utils.random_id import random_id
+from ..utils.spreadsheet_export import export_spreadsheet
+from ..utils.xform_compiler import get_xform_compiler
 from ..deployment_backends.mixin import DeployableMixin
 
 
@@ -89,66 +105,49 @@ class XlsExportable(object):
         _flattened_content = flatten_content(self.content)
         return to_xlsform_structure(_flattened_content)
 
+    def _xlsform_sheets(self, extra_rows=None, extra_settings=None,
+                        overwrite_settings=False):
+        if extra_rows is None:
+            extra_rows = {}
+        ss_dict = self.valid_xlsform_content()
+        # The extra rows and settings should persist within the export
+        # *only*. Copying the sheets and the settings row that are about to
+        # change is enough to achieve this isolation
+        for extra_row_sheet_name, extra_row in extra_rows.iteritems():
+            extra_row_sheet = list(ss_dict.get(extra_row_sheet_name, []))
+            extra_row_sheet.append(extra_row)
+            ss_dict[extra_row_sheet_name] = extra_row_sheet
+        if extra_settings:
+            settings_sheet = list(ss_dict.get('settings', []))
+            if not len(settings_sheet):
+                settings_sheet.append({})
+            settings_row = dict(settings_sheet[0])
+            for setting_name, setting_value in extra_settings.iteritems():
+                if not overwrite_settings:
+                    assert setting_name not in settings_row, (
+                        u'Setting `{}` already exists, but '
+                        u'`overwrite_settings` is False'.format(
+                            setting_name)
+                        )
+                settings_row[setting_name] = setting_value
+            settings_sheet[0] = settings_row
+            ss_dict['settings'] = settings_sheet
+        return ss_dict
+
     def to_xls_io(self, extra_rows=None, extra_settings=None,
-                  overwrite_settings=False):
+                  overwrite_settings=False, xlsx=False):
         ''' To append rows to one or more sheets, pass `extra_rows` as a
         dictionary of dictionaries in the following format:
             `{'sheet name': {'column name': 'cell value'}`
         Extra settings may be included as a dictionary of
-            `{'setting name': 'setting value'}` '''
-        if extra_rows is None:
-            extra_rows = {}
-        import xlwt
-        import StringIO
+            `{'setting name': 'setting value'}`
+        Returns a temporary file containing XLS, or XLSX if `xlsx=True` '''
         try:
-            def _add_contents_to_sheet(sheet, contents):
-                cols = []
-                for row in contents:
-                    for key in row.keys():
-                        if key not in cols:
-                            cols.append(key)
-                for ci, col in enumerate(cols):
-                    sheet.write(0, ci, col)
-                for ri, row in enumerate(contents):
-                    for ci, col in enumerate(cols):
-                        val = row.get(col, None)
-                        if val:
-                            sheet.write(ri +1, ci, val)
-            # The extra rows and settings should persist within this function
-            # and its return value *only*. Calling deepcopy() is required to
-            # achive this isolation.
-            ss_dict = copy.deepcopy(self.valid_xlsform_content())
-            for extra_row_sheet_name, extra_row in extra_rows.iteritems():
-                extra_row_sheet = ss_dict.get(extra_row_sheet_name, [])
-                extra_row_sheet.append(extra_row)
-                ss_dict[extra_row_sheet_name] = extra_row_sheet
-            if extra_settings:
-                for setting_name, setting_value in extra_settings.iteritems():
-                    settings_sheet = ss_dict.get('settings', [{}])
-                    if not len(settings_sheet):
-                        settings_sheet.append({})
-                    settings_row = settings_sheet[0]
-                    if not overwrite_settings:
-                        assert setting_name not in settings_row, (
-                            u'Setting `{}` already exists, but '
-                            u'`overwrite_settings` is False'.format(
-                                setting_name)
-                            )
-                    settings_row[setting_name] = setting_value
-
-            workbook = xlwt.Workbook()
-            for sheet_name in ss_dict.keys():
-                # pyxform.xls2json_backends adds "_header" items for each sheet....
-                if not re.match(r".*_header$", sheet_name):
-                    cur_sheet = workbook.add_sheet(sheet_name)
-                    _add_contents_to_sheet(cur_sheet, ss_dict[sheet_name])
+            return export_spreadsheet(self._xlsform_sheets(
+                extra_rows, extra_settings, overwrite_settings), xlsx=xlsx)
         except Exception as e:
             raise Exception("asset.content improperly formatted for XLS "
                             "export: %s" % repr(e))
-        string_io = StringIO.StringIO()
-        workbook.save(string_io)
-        string_io.seek(0)
-        return string_io
 
     def to_versioned_xls_io(self):
         ''' Records the version in the `settings` sheet and as a `calculate`
@@ -168,7 +167,23 @@ class XlsExportable(object):
         )
 
 
-@reversion.register
+def _rows_by_kuid(rows):
+    ''' Map the `$kuid` of each row to the row, or return None if `rows`
+    is None or its rows can't all be told apart that way '''
+    if rows is None:
+        return None
+    rows_by_kuid = {}
+    for row in rows:
+        if not isinstance(row, dict) or not row.get('$kuid'):
+            return None
+        rows_by_kuid[row['$kuid']] = row
+    if len(rows_by_kuid) != len(rows):
+        # Duplicate `$kuid`s
+        return None
+    return rows_by_kuid
+
+
+@reversion.register(adapter_cls=AssetVersionAdapter)
 class Asset(ObjectPermissionMixin,
             TagStringMixin,
             DeployableMixin,
@@ -191,6 +206,16 @@ class Asset(ObjectPermissionMixin,
     # _deployment_data should be accessed through the `deployment` property
     # provided by `DeployableMixin`
     _deployment_data = JSONField(default={})
+    # The id of the newest reversion Version, kept up to date by
+    # update_current_version_id(). Use the `version_id` property instead
+    current_version_id = models.IntegerField(null=True, editable=False)
+    # Fingerprint of `content` as of the last save, which decides whether the
+    # next save needs a new version. Comparing against this instead of a
+    # copy taken in `__init__()` lets read-only code skip loading `content`.
+    # Empty for assets not saved since it was added, whose content is then
+    # normalized and summarized in full by the next save
+    content_hash = models.CharField(
+        max_length=40, blank=True, default='', editable=False)
 
 
     permissions = GenericRelation(ObjectPermission)
@@ -222,13 +247,10 @@ class Asset(ObjectPermissionMixin,
         'change_collection': 'change_asset'
     }
 
-    def __init__(self, *args, **kwargs):
-        r = super(Asset, self).__init__(*args, **kwargs)
-        # Mind the depth
-        self._initial_content_json = json.dumps(self.content)
-
     def versions(self):
-        return reversion.get_for_object(self)
+        ''' AssetVersions of this asset, newest first. Their content is
+        reconstructed transparently when stored as a delta '''
+        return get_asset_versions(self)
 
     def versioned_data(self):
         return [v.field_dict for v in self.versions()]
@@ -248,32 +270,97 @@ class Asset(ObjectPermissionMixin,
                 del settings['form_title']
                 self.content['settings'] = [settings]
 
-    def _populate_summary(self):
+    def _normalize_content(self):
+        ''' Drop survey rows without a type and choices without a name,
+        assign `$kuid`s, expand the content with formpack, apply the asset
+        type's rules for settings, and summarize the survey; see
+        _summarize_survey(). Returns the hash of the result '''
         if self.content is None:
             self.content = {}
             self.summary = {}
-            return
-        analyzer = AssetContentAnalyzer(**self.content)
-        self.summary = analyzer.summary
+            return asset_content_hash(self.content)
+        if 'survey' in self.content:
+            self._strip_empty_rows_and_assign_kuids(
+                self.content['survey'], required_key='type')
+            expand_content(self.content)
+        if 'choices' in self.content:
+            self._strip_empty_rows_and_assign_kuids(
+                self.content['choices'], required_key='name')
+        if 'settings' in self.content:
+            if self.asset_type != 'survey':
+                del self.content['settings']
+            else:
+                self._pull_form_title_from_settings()
+        self.summary = self._summarize_survey(self.content.get('survey'))
+        return asset_content_hash(self.content)
+
+    def _stored_content(self):
+        ''' The content as it is in the database, or None '''
+        if not self.pk:
+            return None
+        stored_content = Asset.objects.filter(pk=self.pk).values_list(
+            'content', flat=True).first()
+        if isinstance(stored_content, basestring):
+            stored_content = json.loads(stored_content)
+        if not isinstance(stored_content, dict):
+            return None
+        return stored_content
+
+    def _summarize_survey(self, survey):
+        ''' Update the summary with only the survey rows that changed since
+        the last save, matched by `$kuid`, or summarize the whole survey if
+        there is no previous summary to update '''
+        survey = survey or []
+        stored_rows = None
+        # Without a `content_hash`, the stored content and summary may
+        # predate this code
+        if self.content_hash and self.summary:
+            stored_content = self._stored_content()
+            if stored_content is not None:
+                stored_rows = _rows_by_kuid(stored_content.get('survey'))
+        rows = _rows_by_kuid(survey)
+        if stored_rows is not None and rows is not None:
+            previous_rows = dict(
+                (kuid, row) for kuid, row in stored_rows.iteritems()
+                if rows.get(kuid) != row
+            )
+            changed_rows = dict(
+                (kuid, row) for kuid, row in rows.iteritems()
+                if stored_rows.get(kuid) != row
+            )
+            return AssetContentAnalyzer.update_summary(
+                self.summary, survey, previous_rows, changed_rows)
+        analyzer = AssetContentAnalyzer()
+        for row in survey:
+            analyzer.add_row(row)
+        return analyzer.get_summary()
+
+    def _content_is_normalized(self):
+        ''' Whether the content is unchanged since it was last normalized
+        and saved, in which case normalizing it again would not change it
+        or its summary '''
+        if self.content is None or self.summary is None or \
+                not self.content_hash:
+            return False
+        if 'settings' in self.content and self.asset_type != 'survey':
+            # The asset type has changed
+            return False
+        return self.content_hash == asset_content_hash(self.content)
 
     def save(self, *args, **kwargs):
-        # populate summary
-        if self.content is not None:
-            if 'survey' in self.content:
-                self._strip_empty_rows(
-                    self.content['survey'], required_key='type')
-                self._assign_kuids(self.content['survey'])
-                expand_content(self.content)
-            if 'choices' in self.content:
-                self._strip_empty_rows(
-                    self.content['choices'], required_key='name')
-                self._assign_kuids(self.content['choices'])
-            if 'settings' in self.content:
-                if self.asset_type != 'survey':
-                    del self.content['settings']
-                else:
-                    self._pull_form_title_from_settings()
-        self._populate_summary()
+        previous_content_hash = self.content_hash
+        if not previous_content_hash and self.pk:
+            # Last saved before content hashes were recorded. The content is
+            # normalized again, but only deserves a new version if that
+            # changes it
+            stored_content = self._stored_content()
+            if stored_content is not None:
+                previous_content_hash = asset_content_hash(stored_content)
+        if self._content_is_normalized():
+            # Nothing to do for e.g. an autosave without changes
+            new_content_hash = self.content_hash
+        else:
+            new_content_hash = self._normalize_content()
 
         # infer asset_type only between question and block
         if self.asset_type in ['question', 'block']:
@@ -283,27 +370,29 @@ class Asset(ObjectPermissionMixin,
             elif row_count > 1:
                 self.asset_type = 'block'
 
-        new_content_json = json.dumps(self.content)
-        if self._initial_content_json != new_content_json or (
-                not self.pk or not self.versions().exists()
+        self.content_hash = new_content_hash
+        if previous_content_hash != new_content_hash or (
+                not self.pk or (self.current_version_id is None and
+                                not self.versions().exists())
         ):
             # Create a new version if the content has been changed, or if no
             # version exists yet
             with reversion.create_revision():
                 super(Asset, self).save(*args, **kwargs)
-            # Reset `_initial_content` since the change has been written to the
-            # database
-            self._initial_content = new_content_json
+            # Exports of the previous version are no longer needed
+            get_artifact_cache().invalidate(self.uid)
         else:
             super(Asset, self).save(*args, **kwargs)
 
-    def _strip_empty_rows(self, arr, required_key='type'):
-        arr[:] = [row for row in arr if required_key in row]
-
-    def _assign_kuids(self, arr):
+    def _strip_empty_rows_and_assign_kuids(self, arr, required_key='type'):
+        rows = []
         for row in arr:
+            if required_key not in row:
+                continue
             if '$kuid' not in row:
                 row['$kuid'] = random_id(9)
+            rows.append(row)
+        arr[:] = rows
 
     def get_ancestors_or_none(self):
         # ancestors are ordered from farthest to nearest
@@ -314,33 +403,113 @@ class Asset(ObjectPermissionMixin,
 
     @property
     def version_id(self):
-        # Whoa! The `first()` version is the newest!
-        return reversion.get_for_object(self).first().id
-
-    def get_export(self, regenerate=True, version_id=False):
+        if self.current_version_id is None:
+            # Whoa! The `first()` version is the newest!
+            self.current_version_id = reversion.get_for_object(
+                self).first().id
+        return self.current_version_id
+
+    def get_export(self, regenerate=False, version_id=False):
+        ''' Return an AssetSnapshot of the given version, by default the
+        latest. An existing snapshot is reused unless its source, the form
+        title, or the installed version of pyxform have changed since it was
+        made. Pass `regenerate=True` to force pyxform to run again '''
         if not version_id:
             version_id = self.version_id
-
-        AssetSnapshot.objects.filter(asset=self,
-                                     asset_version_id=version_id).delete()
-
-        (snapshot, _created) = AssetSnapshot.objects.get_or_create(
-            asset=self,
-            asset_version_id=self.version_id)
+        snapshot = AssetSnapshot(asset=self, asset_version_id=version_id)
+        existing_snapshots = AssetSnapshot.objects.filter(
+            asset=self, asset_version_id=version_id)
+        if not regenerate:
+            source_hash = snapshot.get_source_hash()
+            existing_snapshot = existing_snapshots.filter(
+                source_hash=source_hash).first()
+            if existing_snapshot is not None:
+                existing_snapshot.record_access()
+                return existing_snapshot
+            # Anything else for this version is out of date
+            existing_snapshots = existing_snapshots.exclude(
+                source_hash=source_hash)
+        existing_snapshots.delete()
+        snapshot.save(regenerate=regenerate)
         return snapshot
 
     def __unicode__(self):
         return u'{} ({})'.format(self.name, self.uid)
 
 
+def asset_content_hash(content):
+    ''' Fingerprint the content of an asset; see `Asset.content_hash` '''
+    return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
+
+def snapshot_source_hash(source, form_title, note):
+    ''' Identify everything that goes into the XML of an AssetSnapshot: the
+    normalized source, the form title and note added during export, and the
+    version of pyxform that does the work '''
+    import pyxform
+    return hashlib.sha1(json.dumps({
+        'source': source,
+        'form_title': form_title,
+        'note': note,
+        'pyxform': pyxform.__version__,
+    }, sort_keys=True)).hexdigest()
+
+
+def xform_validation_cache_key(xml):
+    if isinstance(xml, unicode):
+        xml = xml.encode('utf-8')
+    return 'xform_validation:{}'.format(hashlib.sha1(xml).hexdigest())
+
+
+def _run_odk_validate(xml):
+    ''' The validator only reads files, so this is the one step of
+    generating a snapshot that touches the filesystem '''
+    import tempfile
+    from pyxform.odk_validate import check_xform
+    with tempfile.NamedTemporaryFile(suffix='.xml') as named_tmp:
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        named_tmp.write(xml)
+        named_tmp.flush()
+        return check_xform(named_tmp.name)
+
+
+def validate_xform(xml, warnings):
+    ''' Check `xml` with the ODK validator, appending any warnings to
+    `warnings` and raising ODKValidateError if the form is invalid. The
+    outcome is cached by the hash of `xml` for
+    settings.XFORM_VALIDATION_CACHE_TIMEOUT seconds; other errors, e.g. a
+    missing Java runtime, are not cached '''
+    from pyxform.odk_validate import ODKValidateError
+    cache_key = xform_validation_cache_key(xml)
+    result = cache.get(cache_key)
+    if result is None:
+        increment_counter('xform_validation.cache_miss')
+        try:
+            result = {'warnings': _run_odk_validate(xml)}
+        except ODKValidateError, e:
+            result = {'warnings': [], 'error': unicode(e)}
+        cache.set(cache_key, result,
+                  django_settings.XFORM_VALIDATION_CACHE_TIMEOUT)
+    else:
+        increment_counter('xform_validation.cache_hit')
+    warnings.extend(result['warnings'])
+    if 'error' in result:
+        raise ODKValidateError(result['error'])
+
+
 class AssetSnapshot(models.Model, XlsExportable):
     '''
     This model serves as a cache of the XML that was exported by the installed
     version of pyxform.
 
-    TODO: come up with a policy to clear this cache out.
-    DO NOT: depend on these snapshots existing for more than a day until a policy is set.
+    Snapshots are purged periodically; see kpi.utils.asset_snapshot_purge.
+    DO NOT: depend on source-only snapshots existing for longer than
+    settings.KOBO_SURVEY_PREVIEW_EXPIRATION.
     '''
+    # Write `date_accessed` at most this often
+    ACCESS_RECORDING_INTERVAL = datetime.timedelta(hours=1)
+
     xml = models.TextField()
     source = JSONField(null=True)
     details = JSONField(default={})
@@ -349,17 +518,28 @@ class AssetSnapshot(models.Model, XlsExportable):
     asset_version_id = models.IntegerField(null=True)
     date_created = models.DateTimeField(auto_now_add=True)
     uid = KpiUidField(uid_prefix='s')
+    # See snapshot_source_hash()
+    source_hash = models.CharField(max_length=40, blank=True, db_index=True)
+    date_accessed = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __init__(self, *args, **kwargs):
         if (kwargs.get('asset', None) is not None and
                 'asset_version_id' not in kwargs):
             asset = kwargs.get('asset')
-            kwargs['asset_version_id'] = reversion.get_for_object(asset).last().pk
+            kwargs['asset_version_id'] = asset.version_id
         return super(AssetSnapshot, self).__init__(*args, **kwargs)
 
     def generate_xml_from_source(self, source, **opts):
-        import pyxform
-        import tempfile
+        ''' Build the XForm in memory with the shared XFormCompiler. Unless
+        `validate=False` is passed or settings.ASSET_SNAPSHOT_VALIDATION is
+        disabled, it is then checked by the ODK validator; see
+        validate_xform(). When validation is deferred and its outcome isn't
+        cached, `details['validation']` is set to `pending` instead; see
+        complete_validation() '''
+        validate = opts.get('validate')
+        if validate is None:
+            validate = django_settings.ASSET_SNAPSHOT_VALIDATION
+        defer_validation = self._defer_validation()
         summary = {}
         warnings = []
         default_name = None
@@ -380,33 +560,33 @@ class AssetSnapshot(models.Model, XlsExportable):
 
         # form_title is now always stored in the model
         # (removed from the settings sheet until export)
-        default_form_title= (hasattr(self.asset, 'name') and self.asset.name) or 'Untitled'
-        settings.setdefault('form_title', default_form_title)
+        settings.setdefault('form_title', self._default_form_title())
 
         if opts.get('include_note'):
             source['survey'].insert(0, {'type': 'note',
                                     'label': opts['include_note']})
         source['settings'] = [settings]
         try:
-            dict_repr = pyxform.xls2json.workbook_to_json(
-                source, default_name, default_language, warnings)
-
-            for k in (u'name', u'id_string', u'sms_keyword'):
-                dict_repr.setdefault(k, default_id_string)
-                if not isinstance(dict_repr[k], basestring):
-                    dict_repr[k]= default_id_string
-
-            survey = pyxform.builder.create_survey_element_from_dict(dict_repr)
-            with tempfile.NamedTemporaryFile(suffix='.xml') as named_tmp:
-                survey.print_xform_to_file(
-                    path=named_tmp.name, validate=True, warnings=warnings)
-                named_tmp.seek(0)
-                self.xml = named_tmp.read()
+            xml, compile_warnings = get_xform_compiler().compile(
+                self.source_hash or None, source, default_name,
+                default_language, default_id_string
+            )
+            warnings.extend(compile_warnings)
+            validated = False
+            if validate:
+                if defer_validation and cache.get(
+                        xform_validation_cache_key(xml)) is None:
+                    summary[u'validation'] = u'pending'
+                else:
+                    validate_xform(xml, warnings)
+                    validated = True
+            self.xml = xml
             summary.update({
                 u'default_name': default_name,
                 u'id_string': 'random',
                 u'default_language': default_language,
                 u'warnings': warnings,
+                u'validated': validated,
             })
             summary['status'] = 'success'
         except Exception, e:
@@ -417,33 +597,135 @@ class AssetSnapshot(models.Model, XlsExportable):
             })
         self.details = summary
 
+    @staticmethod
+    def _defer_validation():
+        return django_settings.DEFERRED_ASSET_SNAPSHOT_VALIDATION and \
+            not getattr(django_settings, 'CELERY_ALWAYS_EAGER', False)
+
+    def _schedule_validation(self):
+        # Avoid a circular import
+        from ..tasks import validate_asset_snapshot
+        enqueue = lambda: validate_asset_snapshot.delay(self.uid)
+        # The worker must be able to see the snapshot. If there is no way to
+        # wait for that, validate now
+        if not on_commit(enqueue):
+            self.complete_validation()
+
+    def complete_validation(self):
+        ''' Run a validation that was deferred when this snapshot was
+        generated, and record the outcome in `details` '''
+        details = self.details
+        if details.get('validation') != 'pending':
+            return
+        del details['validation']
+        warnings = details.setdefault(u'warnings', [])
+        try:
+            validate_xform(self.xml, warnings)
+            details[u'validated'] = True
+        except Exception, e:
+            details.pop('status', None)
+            details.update({
+                u'error_type': type(e).__name__,
+                u'error': unicode(e),
+            })
+        AssetSnapshot.objects.filter(pk=self.pk).update(details=details)
+
+    def record_access(self):
+        ''' Note that this snapshot was used, for the least-recently-used
+        purge policy '''
+        now = timezone.now()
+        if self.date_accessed is not None and \
+                now - self.date_accessed < self.ACCESS_RECORDING_INTERVAL:
+            return
+        self.date_accessed = now
+        AssetSnapshot.objects.filter(pk=self.pk).update(date_accessed=now)
+
     def get_version(self):
         if self.asset_version_id is None:
             return None
-        return reversion.get_for_object(
-            self.asset).get(id=self.asset_version_id)
+        return self.asset.versions().get(id=self.asset_version_id)
 
     def _valid_source(self):
         return to_xlsform_structure(self.source)
 
-    def save(self, *args, **kwargs):
-        version = self.get_version()
-        if self.source is None:
-            self.source = version.object.to_ss_structure()
-        _valid_source = self._valid_source()
-        note = False
+    def _default_form_title(self):
+        return (hasattr(self.asset, 'name') and self.asset.name) or 'Untitled'
+
+    def _note(self):
         if self.asset and self.asset.asset_type in ['question', 'block'] and \
                 len(self.asset.summary['languages']) == 0:
             asset_type = self.asset.asset_type
             note = 'Note: This item is a ASSET_TYPE and ' + \
                     'must be included in a form before deploying'
-            note = note.replace('ASSET_TYPE', asset_type)
-        self.generate_xml_from_source(_valid_source, include_note=note)
-        return super(AssetSnapshot, self).save(*args, **kwargs)
+            return note.replace('ASSET_TYPE', asset_type)
+        return False
+
+    def _prepare_source(self):
+        ''' Load the source from the asset version if necessary and return
+        it in the form that will be passed to pyxform, along with the note
+        to include '''
+        if getattr(self, '_prepared_source', None) is None:
+            if self.source is None:
+                historical_asset = self.get_version().object_version.object
+                self.source = historical_asset.to_ss_structure()
+            # `_valid_source()` modifies `source`, so only call it once
+            self._prepared_source = (self._valid_source(), self._note())
+        return self._prepared_source
+
+    def get_source_hash(self):
+        _valid_source, note = self._prepare_source()
+        return snapshot_source_hash(
+            _valid_source, self._default_form_title(), note)
+
+    def save(self, *args, **kwargs):
+        ''' Reuse the XML of an existing snapshot with the same source hash
+        instead of running pyxform, unless `regenerate=True` is passed '''
+        regenerate = kwargs.pop('regenerate', False)
+        _valid_source, note = self._prepare_source()
+        self.source_hash = snapshot_source_hash(
+            _valid_source, self._default_form_title(), note)
+        cached_snapshot = None
+        if not regenerate:
+            cached_snapshot = AssetSnapshot.objects.filter(
+                source_hash=self.source_hash
+            ).exclude(pk=self.pk).only(
+                'xml', 'details', 'date_accessed'
+            ).order_by('-date_created').first()
+        if cached_snapshot is not None and \
+                cached_snapshot.details.get('status') == 'success' and (
+                    # Snapshots from before validation became optional were
+                    # always validated
+                    cached_snapshot.details.get('validated', True) or
+                    cached_snapshot.details.get('validation') == 'pending' or
+                    not django_settings.ASSET_SNAPSHOT_VALIDATION
+                ):
+            self.xml = cached_snapshot.xml
+            self.details = cached_snapshot.details
+            cached_snapshot.record_access()
+        else:
+            self.generate_xml_from_source(_valid_source, include_note=note)
+        result = super(AssetSnapshot, self).save(*args, **kwargs)
+        if self.details.get('validation') == 'pending':
+            self._schedule_validation()
+        return result
+
+
+@receiver(post_revision_commit)
+def update_current_version_id(sender, instances, versions, **kwargs):
+    ''' Record the id of each asset's new version on the asset itself so
+    that reading `Asset.version_id` needs no query '''
+    for instance, version in zip(instances, versions):
+        if not isinstance(instance, Asset):
+            continue
+        instance.current_version_id = version.pk
+        Asset.objects.filter(pk=instance.pk).update(
+            current_version_id=version.pk)
 
 
 @receiver(models.signals.post_delete, sender=Asset)
 def post_delete_asset(sender, instance, **kwargs):
     # Remove all permissions associated with this object
     ObjectPermission.objects.filter_for_object(instance).delete()
+    UserObjectAccess.objects.filter_for_object(instance).delete()
     # No recalculation is necessary since children will also be deleted
+    get_artifact_cache().invalidate(instance.uid)
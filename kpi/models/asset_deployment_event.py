@@ -0,0 +1,19 @@
+from django.db import models
+from django.utils import timezone
+
+
+class AssetDeploymentEvent(models.Model):
+    ''' A record of each change to an asset's deployment, written by
+    BaseDeploymentBackend.store_data(), so that the deployment history can
+    be read without deserializing every reversion Version of the asset '''
+    asset = models.ForeignKey('kpi.Asset', related_name='deployment_events')
+    # The reversion Version that was deployed, if known
+    version_id = models.IntegerField(null=True)
+    backend = models.CharField(max_length=50)
+    identifier = models.CharField(max_length=255, blank=True, default='')
+    active = models.BooleanField(default=False)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = (('asset', 'version_id'),)
+        ordering = ('timestamp', 'pk')
@@ -0,0 +1,188 @@
+import json
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.utils.encoding import force_text
+from reversion import revisions as reversion
+from reversion.models import Version
+
+from ..utils.content_delta import apply_delta, make_delta
+
+# Key of the object that replaces `content` in the serialized data of a
+# version stored as a delta
+DELTA_MARKER = '$kpi_delta'
+
+
+def _stored_content(data):
+    ''' Return the `content` of deserialized version data as stored, i.e.
+    possibly a delta marker '''
+    content = data[0]['fields'].get('content')
+    if isinstance(content, basestring):
+        content = json.loads(content)
+    return content
+
+
+def _set_content(data, content):
+    # Mimic `JSONField.value_to_string()`
+    data[0]['fields']['content'] = None if content is None else \
+        json.dumps(content)
+
+
+def get_delta_reference(serialized_data):
+    ''' Return `{'keyframe': keyframe version pk, 'delta': delta}` if the
+    serialized data stores `content` as a delta, otherwise None '''
+    if DELTA_MARKER not in serialized_data:
+        # Cheap test that avoids parsing most keyframes
+        return None
+    content = _stored_content(json.loads(serialized_data))
+    if isinstance(content, dict) and DELTA_MARKER in content:
+        return content[DELTA_MARKER]
+    return None
+
+
+def expand_serialized_data(serialized_data, keyframe_contents=None):
+    ''' Return serialized data with the complete `content`, reconstructing
+    it from the keyframe if necessary. Pass a dictionary as
+    `keyframe_contents` to reuse keyframes across calls '''
+    reference = get_delta_reference(serialized_data)
+    if reference is None:
+        return serialized_data
+    if keyframe_contents is None:
+        keyframe_contents = {}
+    keyframe_id = reference['keyframe']
+    if keyframe_id not in keyframe_contents:
+        keyframe_data = Version.objects.values_list(
+            'serialized_data', flat=True).get(pk=keyframe_id)
+        keyframe_contents[keyframe_id] = _stored_content(
+            json.loads(keyframe_data))
+    data = json.loads(serialized_data)
+    _set_content(data, apply_delta(
+        keyframe_contents[keyframe_id], reference['delta']))
+    return json.dumps(data)
+
+
+def rebuild_content(content):
+    ''' Return `content`, or the complete content if it is a delta marker.
+    Lets a version stored as a delta be deserialized by reversion itself,
+    e.g. by `Version.revert()` or the admin, rather than through
+    AssetVersion; see the post_init receiver in kpi.signals '''
+    if not isinstance(content, dict) or DELTA_MARKER not in content:
+        return content
+    reference = content[DELTA_MARKER]
+    keyframe_data = Version.objects.values_list(
+        'serialized_data', flat=True).get(pk=reference['keyframe'])
+    return apply_delta(
+        _stored_content(json.loads(keyframe_data)), reference['delta'])
+
+
+def compress_serialized_data(serialized_data, keyframe_id, keyframe_content):
+    ''' Return serialized data that stores `content` as a delta against the
+    given keyframe, or None if that would not be any smaller '''
+    data = json.loads(serialized_data)
+    content = _stored_content(data)
+    _set_content(data, {DELTA_MARKER: {
+        'keyframe': keyframe_id,
+        'delta': make_delta(keyframe_content, content),
+    }})
+    compressed = json.dumps(data)
+    if len(compressed) >= len(serialized_data):
+        return None
+    return compressed
+
+
+class AssetVersion(Version):
+    ''' A reversion Version of an Asset. Unless it is a keyframe, its
+    `content` is stored as a delta against the most recent keyframe, and
+    `object_version` (and therefore `field_dict`) reconstructs it '''
+    class Meta:
+        proxy = True
+
+    @property
+    def object_version(self):
+        data = force_text(
+            expand_serialized_data(self.serialized_data).encode('utf8'))
+        return list(serializers.deserialize(
+            self.format, data, ignorenonexistent=True))[0]
+
+    @property
+    def is_keyframe(self):
+        return get_delta_reference(self.serialized_data) is None
+
+
+def get_asset_versions(asset):
+    ''' Like `reversion.get_for_object()`, newest first, but returns
+    AssetVersion instances '''
+    return AssetVersion.objects.filter(
+        content_type=ContentType.objects.get_for_model(asset),
+        object_id_int=asset.pk,
+    ).select_related('revision').order_by('-pk')
+
+
+class AssetVersionAdapter(reversion.VersionAdapter):
+    ''' Stores new versions of an asset as deltas when
+    settings.ASSET_VERSION_DELTA_STORAGE is enabled, writing a complete
+    keyframe every settings.ASSET_VERSION_KEYFRAME_INTERVAL versions '''
+    def get_serialized_data(self, obj):
+        serialized_data = super(
+            AssetVersionAdapter, self).get_serialized_data(obj)
+        interval = settings.ASSET_VERSION_KEYFRAME_INTERVAL
+        if not settings.ASSET_VERSION_DELTA_STORAGE or interval <= 1 or \
+                obj.pk is None:
+            return serialized_data
+        versions = get_asset_versions(obj)
+        latest = versions.values_list('pk', 'serialized_data').first()
+        if latest is None:
+            return serialized_data
+        latest_id, latest_data = latest
+        reference = get_delta_reference(latest_data)
+        if reference is None:
+            keyframe_id = latest_id
+            keyframe_content = _stored_content(json.loads(latest_data))
+        else:
+            keyframe_id = reference['keyframe']
+            if versions.filter(pk__gt=keyframe_id).count() + 1 >= interval:
+                return serialized_data
+            keyframe_content = _stored_content(json.loads(
+                versions.values_list('serialized_data', flat=True).get(
+                    pk=keyframe_id)
+            ))
+        return compress_serialized_data(
+            serialized_data, keyframe_id, keyframe_content) or serialized_data
+
+
+def rewrite_versions(versions, keyframe_interval, save=True):
+    ''' Re-encode the versions of one object, oldest first, so that every
+    `keyframe_interval`th version is a keyframe and the others are deltas
+    against the latest keyframe. An interval of 1 or less stores every
+    version in full. Returns the total length of the serialized data before
+    and after. Pass `save=False` to only calculate the lengths '''
+    # Contents of the keyframes as they were before rewriting; a delta always
+    # refers to an older version, which has already been read
+    keyframe_contents = {}
+    keyframe_id = keyframe_content = None
+    since_keyframe = 0
+    length_before = length_after = 0
+    rows = versions.order_by('pk').values_list('pk', 'serialized_data')
+    for version_id, stored_data in rows:
+        full_data = expand_serialized_data(stored_data, keyframe_contents)
+        if full_data is stored_data:
+            keyframe_contents[version_id] = _stored_content(
+                json.loads(stored_data))
+        new_data = None
+        if keyframe_id is not None and since_keyframe + 1 < keyframe_interval:
+            new_data = compress_serialized_data(
+                full_data, keyframe_id, keyframe_content)
+        if new_data is None:
+            new_data = full_data
+            keyframe_id = version_id
+            keyframe_content = _stored_content(json.loads(full_data))
+            since_keyframe = 0
+        else:
+            since_keyframe += 1
+        if save and new_data != stored_data:
+            Version.objects.filter(pk=version_id).update(
+                serialized_data=new_data)
+        length_before += len(stored_data)
+        length_after += len(new_data)
+    return length_before, length_after
@@ -15,7 +15,11 @@ from asset import (
     KpiTaggableManager,
     TagStringMixin,
 )
-from object_permission import ObjectPermission, ObjectPermissionMixin
+from object_permission import (
+    ObjectPermission,
+    ObjectPermissionMixin,
+    UserObjectAccess,
+)
 from ..haystack_utils import update_object_in_search_index
 from ..fields import KpiUidField
 
@@ -120,6 +124,7 @@ class Collection(ObjectPermissionMixin, TagStringMixin, MPTTModel):
 def post_delete_collection(sender, instance, **kwargs):
     # Remove all permissions associated with this object
     ObjectPermission.objects.filter_for_object(instance).delete()
+    UserObjectAccess.objects.filter_for_object(instance).delete()
     # No recalculation is necessary since children will also be deleted
 
 
@@ -1,20 +1,28 @@
 from django.apps import apps
-from django.db import models, transaction
+from django.db import (
+    connection, connections, models, transaction, IntegrityError)
 from django.core.exceptions import ValidationError, ImproperlyConfigured
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User, AnonymousUser, Permission
 from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import _get_queryset
+from collections import defaultdict
 import copy
+import logging
 import re
 
 from ..fields import KpiUidField
+from ..utils.commit_hooks import on_commit
+from ..utils.permission_cache import invalidate_permission_cache
+from ..utils.permission_registry import permission_registry
+from ..utils.instrumentation import increment_counter
 
 
 def perm_parse(perm, obj=None):
     if obj is not None:
-        obj_app_label = ContentType.objects.get_for_model(obj).app_label
+        obj_app_label = obj._meta.app_label
     else:
         obj_app_label = None
     try:
@@ -27,12 +35,148 @@ def perm_parse(perm, obj=None):
         codename = perm
     return app_label, codename
 
+# Effective permissions are recorded in `UserObjectAccess` as a bitmask. The
+# keys are the prefixes of the assignable codenames, e.g. `view_asset` and
+# `view_collection` both use the `view` bit
+ACCESS_BITS = {
+    'view': 1,
+    'change': 2,
+}
+
+def access_mask_for_codenames(codenames):
+    ''' Return the bitmask that represents all the given codenames. Raises
+    KeyError if any codename is not recorded in the access index. '''
+    mask = 0
+    for codename in codenames:
+        mask |= ACCESS_BITS[codename.split('_', 1)[0]]
+    return mask
+
+def masks_including(required_mask):
+    ''' Return every possible access bitmask that includes all the bits of
+    `required_mask`, for use with a `permissions__in` lookup '''
+    all_bits = sum(ACCESS_BITS.values())
+    return [mask for mask in range(all_bits + 1)
+            if mask & required_mask == required_mask]
+
+def calculate_access_masks(permission_rows):
+    ''' Reconcile grant and deny permissions into access bitmasks. Expects an
+    iterable of (object_id, user_id, codename, deny) tuples, all for the same
+    content type, and returns a dictionary of
+    `{(object_id, user_id): bitmask}`. Permissions for the anonymous user are
+    limited to those allowed by settings.ALLOWED_ANONYMOUS_PERMISSIONS. '''
+    grants = set()
+    denies = set()
+    for object_id, user_id, codename, deny in permission_rows:
+        if deny:
+            denies.add((object_id, user_id, codename))
+        else:
+            grants.add((object_id, user_id, codename))
+    anonymous_codenames = set(
+        perm_parse(perm)[1] for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS)
+    masks = defaultdict(int)
+    for object_id, user_id, codename in grants.difference(denies):
+        if is_anonymous_user_id(user_id) and (
+                codename not in anonymous_codenames):
+            continue
+        try:
+            masks[(object_id, user_id)] |= access_mask_for_codenames(
+                [codename])
+        except KeyError:
+            # Not an assignable permission; nothing to record
+            continue
+    return masks
+
+def rebuild_access_index(content_type_id, object_ids, chunk_size=500):
+    ''' Replace the `UserObjectAccess` rows for the given objects with ones
+    calculated from their current `ObjectPermission`s '''
+    object_ids = list(object_ids)
+    # Stay well below the maximum number of SQLite query parameters
+    for start in range(0, len(object_ids), chunk_size):
+        chunk = object_ids[start:start + chunk_size]
+        permission_rows = ObjectPermission.objects.filter(
+            content_type_id=content_type_id, object_id__in=chunk
+        ).values_list('object_id', 'user_id', 'permission_id', 'deny')
+        masks = calculate_access_masks(
+            (object_id, user_id, permission_registry.get_codename(
+                permission_id), deny)
+            for object_id, user_id, permission_id, deny in permission_rows
+        )
+        UserObjectAccess.objects.filter(
+            content_type_id=content_type_id, object_id__in=chunk).delete()
+        UserObjectAccess.objects.bulk_create([
+            UserObjectAccess(
+                user_id=user_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+                permissions=mask
+            ) for (object_id, user_id), mask in masks.iteritems()
+        ])
+
+def sync_inherited_permissions(pks_by_content_type, desired_permissions):
+    ''' Make the inherited ObjectPermissions of the objects listed in
+    `pks_by_content_type`, a dictionary of `{content_type_id: [object_id]}`,
+    match `desired_permissions`, a list of unsaved ObjectPermissions. Only
+    missing rows are inserted and only stale rows deleted, so rows that are
+    already correct keep their uids. Returns a dictionary of row counts:
+    `{'inserted': ..., 'deleted': ..., 'kept': ...}` '''
+    stats = {'inserted': 0, 'deleted': 0, 'kept': 0}
+    if not pks_by_content_type:
+        return stats
+    missing = {}
+    for permission in desired_permissions:
+        missing[(permission.content_type_id, permission.object_id,
+                 permission.user_id, permission.permission_id)] = permission
+    existing_query = models.Q()
+    for content_type_id, pks in pks_by_content_type.iteritems():
+        existing_query |= models.Q(
+            content_type_id=content_type_id, object_id__in=pks)
+    stale_pks = []
+    for row in ObjectPermission.objects.filter(
+            existing_query, inherited=True).values_list(
+                'pk', 'content_type_id', 'object_id', 'user_id',
+                'permission_id', 'deny'
+            ):
+        key = row[1:5]
+        if row[5] or key not in missing:
+            # Inherited permissions are never denials
+            stale_pks.append(row[0])
+        else:
+            del missing[key]
+            stats['kept'] += 1
+    # Stay well below the maximum number of SQLite query parameters
+    for start in range(0, len(stale_pks), 500):
+        ObjectPermission.objects.filter(
+            pk__in=stale_pks[start:start + 500]).delete()
+    uid_field = ObjectPermission._meta.get_field('uid')
+    for permission in missing.itervalues():
+        permission.uid = uid_field.generate_uid()
+    ObjectPermission.objects.bulk_create(missing.values())
+    stats['inserted'] = len(missing)
+    stats['deleted'] = len(stale_pks)
+    return stats
+
+def record_inherited_permission_changes(stats):
+    ''' Report the row counts of a recalculation to the log and to
+    kpi.utils.instrumentation '''
+    for key, value in stats.iteritems():
+        increment_counter('inherited_permissions.{}'.format(key), value)
+    logging.debug(
+        u'Recalculated inherited permissions: {inserted} inserted, '
+        u'{deleted} deleted, {kept} kept'.format(**stats)
+    )
+
+def permission_recalculation_cache_key(model, tree_id):
+    ''' The cache key that marks a tree as having a permission recalculation
+    already enqueued '''
+    return 'kpi:pending-permission-recalculation:{}.{}:{}'.format(
+        model._meta.app_label, model._meta.model_name, tree_id)
+
 def get_all_objects_for_user(user, klass):
     ''' Return all objects of type klass to which user has been assigned any
     permission. '''
     return klass.objects.filter(pk__in=ObjectPermission.objects.filter(
         user=user,
-        content_type=ContentType.objects.get_for_model(klass)
+        content_type_id=permission_registry.get_content_type_id(klass)
     ).values_list('object_id', flat=True))
 
 def get_objects_for_user(user, perms, klass=None):
@@ -70,8 +214,11 @@ def get_objects_for_user(user, perms, klass=None):
             codename = perm
         codenames.add(codename)
         if app_label is not None:
-            new_ctype = ContentType.objects.get(app_label=app_label,
-                permission__codename=codename)
+            new_ctype = ContentType.objects.get_for_id(
+                permission_registry.get_permission_content_type_id(
+                    permission_registry.get_permission_id(app_label, codename)
+                )
+            )
             if ctype is not None and ctype != new_ctype:
                 raise ValidationError("Computed ContentTypes do not match "
                     "(%s != %s)" % (ctype, new_ctype))
@@ -96,17 +243,33 @@ def get_objects_for_user(user, perms, klass=None):
     # match which means: ctype.model_class() == queryset.model
     # we should also have ``codenames`` list
 
-    # Check if the user is anonymous. The
-    # django.contrib.auth.models.AnonymousUser object doesn't work for
-    # queries, and it's nice to be able to pass in request.user blindly.
-    if user.is_anonymous():
-        user = get_anonymous_user()
+    # The django.contrib.auth.models.AnonymousUser object doesn't work for
+    # queries, and it's nice to be able to pass in request.user blindly
+    user_id = get_database_user_id(user)
+
+    try:
+        required_mask = access_mask_for_codenames(codenames)
+    except KeyError:
+        # At least one permission is not recorded in the access index
+        pass
+    else:
+        # Let the database join against the access index instead of
+        # materializing a (potentially huge) list of primary keys here
+        accessible_object_ids = UserObjectAccess.objects.filter(
+            user_id=user_id,
+            content_type=ctype,
+            permissions__in=masks_including(required_mask)
+        ).values('object_id')
+        return queryset.filter(pk__in=accessible_object_ids)
 
     # Now we should extract list of pk values for which we would filter queryset
+    permission_ids = permission_registry.get_permission_ids(ctype.pk)
     user_obj_perms_queryset = (ObjectPermission.objects
-        .filter(user=user)
-        .filter(permission__content_type=ctype)
-        .filter(permission__codename__in=codenames)
+        .filter(user_id=user_id)
+        .filter(content_type_id=ctype.pk)
+        # Unknown codenames match nothing, as they would by codename
+        .filter(permission_id__in=[permission_ids[codename]
+            for codename in codenames if codename in permission_ids])
         .filter(deny=False))
 
     if len(codenames) > 1:
@@ -120,8 +283,38 @@ def get_objects_for_user(user, perms, klass=None):
 
     return objects
 
+# The field values of the User that represents AnonymousUser, cached for the
+# life of the process by get_anonymous_user()
+_anonymous_user_values = None
+
+
+def is_anonymous_user_id(user_id):
+    ''' Is `user_id` the primary key of the User that represents
+    AnonymousUser? Saves fetching the User just to compare it '''
+    return user_id == settings.ANONYMOUS_USER_ID
+
+
+def get_database_user_id(user):
+    ''' Return the primary key to use in queries for `user`, which may be
+    AnonymousUser, without fetching the User that represents it '''
+    if user.is_anonymous():
+        return settings.ANONYMOUS_USER_ID
+    return user.pk
+
+
+def clear_anonymous_user_cache():
+    global _anonymous_user_values
+    _anonymous_user_values = None
+
+
 def get_anonymous_user():
-    ''' Return a real User in the database to represent AnonymousUser. '''
+    ''' Return a real User in the database to represent AnonymousUser. The
+    row is read (or created) once per process; afterwards, a fresh instance
+    is built from memory on every call, so callers may modify it freely '''
+    global _anonymous_user_values
+    cached_values = _anonymous_user_values
+    if cached_values is not None:
+        return User.from_db(*cached_values)
     try:
         user = User.objects.get(pk=settings.ANONYMOUS_USER_ID)
     except User.DoesNotExist:
@@ -130,9 +323,22 @@ def get_anonymous_user():
             'ANONYMOUS_DEFAULT_USERNAME_VALUE',
             'AnonymousUser'
         )
-        user = User.objects.create(
-            pk=settings.ANONYMOUS_USER_ID,
-            username=username
+        try:
+            with transaction.atomic():
+                user = User.objects.create(
+                    pk=settings.ANONYMOUS_USER_ID,
+                    username=username
+                )
+        except IntegrityError:
+            # Another process created the user first
+            user = User.objects.get(pk=settings.ANONYMOUS_USER_ID)
+    if not connections[user._state.db].in_atomic_block:
+        # Only remember a row that can no longer be rolled back
+        field_names = [field.attname for field in User._meta.concrete_fields]
+        _anonymous_user_values = (
+            user._state.db,
+            field_names,
+            [getattr(user, field_name) for field_name in field_names]
         )
     return user
 
@@ -141,9 +347,9 @@ class ObjectPermissionManager(models.Manager):
     def _rewrite_query_args(self, method, content_object, **kwargs):
         ''' Rewrite content_object into object_id and content_type, then pass
         those together with **kwargs to the given method. '''
-        content_type = ContentType.objects.get_for_model(content_object)
         kwargs['object_id'] = content_object.pk
-        kwargs['content_type'] = content_type
+        kwargs['content_type_id'] = permission_registry.get_content_type_id(
+            content_object)
         return method(**kwargs)
 
     def get_for_object(self, content_object, **kwargs):
@@ -200,7 +406,8 @@ class ObjectPermission(models.Model):
             'object_id', 'content_type')
 
     def save(self, *args, **kwargs):
-        if self.permission.content_type_id is not self.content_type_id:
+        if permission_registry.get_permission_content_type_id(
+                self.permission_id) != self.content_type_id:
             raise ValidationError('The content type of the permission does '
                 'not match that of the object.')
         super(ObjectPermission, self).save(*args, **kwargs)
@@ -217,6 +424,382 @@ class ObjectPermission(models.Model):
         )
 
 
+class UserObjectAccess(models.Model):
+    ''' A denormalized index of the effective permissions each user has on
+    each object, kept up to date by ObjectPermissionMixin. `permissions` is a
+    bitmask of ACCESS_BITS. Only assignable permissions are recorded here;
+    calculated permissions, e.g. share_ and delete_, are not. '''
+    user = models.ForeignKey('auth.User')
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    permissions = models.PositiveIntegerField(default=0)
+    objects = ObjectPermissionManager()
+
+    class Meta:
+        unique_together = ('user', 'content_type', 'object_id')
+        index_together = (('content_type', 'object_id'),)
+
+
+# SQL expressions that generate a fresh `KpiUidField` value for every row of
+# an `INSERT ... SELECT`, keyed by `connection.vendor`. Databases not listed
+# here always use the object-by-object recalculation
+SQL_UID_EXPRESSIONS = {
+    'postgresql': "'{prefix}' || substr(md5(random()::text || "
+                  "clock_timestamp()::text), 1, {length})",
+    'sqlite': "'{prefix}' || substr(lower(hex(randomblob(16))), 1, {length})",
+}
+
+
+class SubtreePermissionRecalculator(object):
+    ''' Set-based equivalent of
+    ObjectPermissionMixin.recalculate_descendants_perms() for MPTT collection
+    trees. The descendants of `root` are selected by their `lft`/`rght`
+    range, and their inherited permissions are brought up to date with one
+    `DELETE` and one `INSERT ... SELECT` per tree level, plus one of each for
+    all the assets in the subtree, instead of one query per object. Like the
+    object-by-object recalculation, only stale rows are deleted and only
+    missing rows are inserted. '''
+    def __init__(self, root):
+        self.root = root
+        self.collection_model = type(root)
+        self.asset_model = root.assets.model
+        self.collection_ct = permission_registry.get_content_type_id(
+            self.collection_model)
+        self.asset_ct = permission_registry.get_content_type_id(
+            self.asset_model)
+        self.subtree_params = [root.tree_id, root.lft, root.rght]
+        qn = connection.ops.quote_name
+        self.tables = {
+            'collection': qn(self.collection_model._meta.db_table),
+            'asset': qn(self.asset_model._meta.db_table),
+            'objperm': qn(ObjectPermission._meta.db_table),
+            'access': qn(UserObjectAccess._meta.db_table),
+        }
+        uid_field = ObjectPermission._meta.get_field('uid')
+        self.uid_expression = SQL_UID_EXPRESSIONS[connection.vendor].format(
+            prefix=uid_field.uid_prefix,
+            length=uid_field.max_length - len(uid_field.uid_prefix)
+        )
+
+    @staticmethod
+    def is_supported():
+        return connection.vendor in SQL_UID_EXPRESSIONS
+
+    @staticmethod
+    def _in_list(column, values):
+        ''' Return SQL and parameters for `column IN (values)`, avoiding the
+        syntax error caused by an empty list '''
+        values = list(values)
+        if not values:
+            return '1 = 0', []
+        return '{} IN ({})'.format(
+            column, ', '.join(['%s'] * len(values))), values
+
+    def _permission_ids(self, content_type_id, codenames=None):
+        permission_ids = permission_registry.get_permission_ids(content_type_id)
+        if codenames is None:
+            return permission_ids
+        return {codename: permission_id for codename, permission_id
+                in permission_ids.iteritems() if codename in codenames}
+
+    def _anonymous_filter(self, alias, content_type_id):
+        ''' Exclude the anonymous user's permissions that are not listed in
+        settings.ALLOWED_ANONYMOUS_PERMISSIONS '''
+        codenames = [perm_parse(perm)[1]
+                     for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS]
+        allowed_sql, allowed_params = self._in_list(
+            '{}.permission_id'.format(alias),
+            self._permission_ids(content_type_id, codenames).values()
+        )
+        return (
+            '({alias}.user_id <> %s OR {allowed})'.format(
+                alias=alias, allowed=allowed_sql),
+            [settings.ANONYMOUS_USER_ID] + allowed_params
+        )
+
+    def _not_denied(self, alias):
+        ''' Exclude grants that are cancelled by a deny on the same object '''
+        return '''NOT EXISTS (
+            SELECT 1 FROM {objperm} denied
+            WHERE denied.content_type_id = {alias}.content_type_id
+                AND denied.object_id = {alias}.object_id
+                AND denied.user_id = {alias}.user_id
+                AND denied.permission_id = {alias}.permission_id
+                AND denied.deny = %s
+        )'''.format(alias=alias, **self.tables), [True]
+
+    def _descendant_collections(self, include_root=False):
+        ''' Return SQL and parameters selecting the primary keys of the
+        collections in the subtree '''
+        return '''SELECT c.id FROM {collection} c
+            WHERE c.tree_id = %s AND c.lft {gt} %s AND c.rght {lt} %s
+        '''.format(
+            gt='>=' if include_root else '>',
+            lt='<=' if include_root else '<',
+            **self.tables
+        ), list(self.subtree_params)
+
+    def _descendant_assets(self):
+        ''' Return SQL and parameters selecting the primary keys of the
+        assets anywhere in the subtree '''
+        return '''SELECT a.id FROM {asset} a
+            INNER JOIN {collection} c ON c.id = a.parent_id
+            WHERE c.tree_id = %s AND c.lft >= %s AND c.rght <= %s
+        '''.format(**self.tables), list(self.subtree_params)
+
+    def _execute(self, cursor, sql, params):
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+    def _collection_level(self, level):
+        ''' Return SQL and parameters selecting the primary keys of the
+        collections at `level` in the subtree '''
+        return '''SELECT c.id FROM {collection} c
+            WHERE c.tree_id = %s AND c.lft > %s AND c.rght < %s
+                AND c.level = %s
+        '''.format(**self.tables), self.subtree_params + [level]
+
+    def _owner_rows(self, model, content_type_id, object_ids_sql,
+                    object_ids_params):
+        ''' The owner of each object gets every assignable permission '''
+        assignable_sql, assignable_params = self._in_list(
+            'p.id',
+            self._permission_ids(
+                content_type_id, model.ASSIGNABLE_PERMISSIONS).values()
+        )
+        return '''
+            SELECT o.id AS object_id, o.owner_id AS user_id,
+                p.id AS permission_id
+            FROM {table} o CROSS JOIN {permission} p
+            WHERE o.owner_id IS NOT NULL AND {assignable}
+                AND o.id IN ({object_ids})
+        '''.format(
+            table=connection.ops.quote_name(model._meta.db_table),
+            permission=connection.ops.quote_name(Permission._meta.db_table),
+            assignable=assignable_sql,
+            object_ids=object_ids_sql
+        ), assignable_params + object_ids_params
+
+    def _collection_level_rows(self, level):
+        ''' The effective permissions of every collection at `level - 1`
+        are inherited by its children '''
+        anonymous_sql, anonymous_params = self._anonymous_filter(
+            'g', self.collection_ct)
+        not_denied_sql, not_denied_params = self._not_denied('g')
+        return '''
+            SELECT c.id AS object_id, g.user_id AS user_id,
+                g.permission_id AS permission_id
+            FROM {collection} c
+            INNER JOIN {objperm} g ON g.object_id = c.parent_id
+                AND g.content_type_id = %s
+            WHERE c.tree_id = %s AND c.lft > %s AND c.rght < %s
+                AND c.level = %s AND g.deny = %s
+                AND (c.owner_id IS NULL OR g.user_id <> c.owner_id)
+                AND {anonymous} AND {not_denied}
+        '''.format(
+            anonymous=anonymous_sql,
+            not_denied=not_denied_sql,
+            **self.tables
+        ), [self.collection_ct] + self.subtree_params + [level, False] + \
+            anonymous_params + not_denied_params
+
+    def _asset_rows(self):
+        ''' The effective permissions of every collection in the subtree are
+        inherited by its assets, translated by MAPPED_PARENT_PERMISSIONS '''
+        collection_perms = self._permission_ids(self.collection_ct)
+        asset_perms = self._permission_ids(self.asset_ct)
+        cases = []
+        case_params = []
+        for parent_codename, child_codename in \
+                self.asset_model.MAPPED_PARENT_PERMISSIONS.iteritems():
+            cases.append('WHEN %s THEN %s')
+            case_params.extend([
+                collection_perms[parent_codename], asset_perms[child_codename]
+            ])
+        mapped_sql, mapped_params = self._in_list(
+            'g.permission_id', case_params[::2])
+        anonymous_sql, anonymous_params = self._anonymous_filter(
+            'g', self.collection_ct)
+        not_denied_sql, not_denied_params = self._not_denied('g')
+        return '''
+            SELECT a.id AS object_id, g.user_id AS user_id,
+                CASE g.permission_id {cases} END AS permission_id
+            FROM {asset} a
+            INNER JOIN {collection} c ON c.id = a.parent_id
+            INNER JOIN {objperm} g ON g.object_id = a.parent_id
+                AND g.content_type_id = %s
+            WHERE c.tree_id = %s AND c.lft >= %s AND c.rght <= %s
+                AND g.deny = %s AND {mapped}
+                AND (a.owner_id IS NULL OR g.user_id <> a.owner_id)
+                AND {anonymous} AND {not_denied}
+        '''.format(
+            cases=' '.join(cases),
+            mapped=mapped_sql,
+            anonymous=anonymous_sql,
+            not_denied=not_denied_sql,
+            **self.tables
+        ), case_params + [self.collection_ct] + self.subtree_params + \
+            [False] + mapped_params + anonymous_params + not_denied_params
+
+    def _sync(self, cursor, content_type_id, object_ids_sql,
+              object_ids_params, desired_sql, desired_params):
+        ''' Make the inherited permissions of the given objects match the
+        (object_id, user_id, permission_id) rows selected by `desired_sql`,
+        deleting only stale rows and inserting only missing ones. Returns the
+        numbers of deleted and inserted rows '''
+        deleted = self._execute(cursor, '''
+            DELETE FROM {objperm} WHERE inherited = %s
+                AND content_type_id = %s AND object_id IN ({object_ids})
+                AND (deny = %s OR NOT EXISTS (
+                    SELECT 1 FROM ({desired}) d
+                    WHERE d.object_id = {objperm}.object_id
+                        AND d.user_id = {objperm}.user_id
+                        AND d.permission_id = {objperm}.permission_id
+                ))
+        '''.format(
+            object_ids=object_ids_sql,
+            desired=desired_sql,
+            **self.tables
+        ), [True, content_type_id] + object_ids_params + [True] +
+            desired_params
+        )
+        inserted = self._execute(cursor, '''
+            INSERT INTO {objperm} (uid, user_id, permission_id, deny,
+                inherited, object_id, content_type_id)
+            SELECT {uid}, d.user_id, d.permission_id, %s, %s, d.object_id, %s
+            FROM ({desired}) d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {objperm} e
+                WHERE e.content_type_id = %s AND e.object_id = d.object_id
+                    AND e.user_id = d.user_id
+                    AND e.permission_id = d.permission_id
+                    AND e.inherited = %s
+            )
+        '''.format(
+            uid=self.uid_expression,
+            desired=desired_sql,
+            **self.tables
+        ), [False, True, content_type_id] + desired_params +
+            [content_type_id, True]
+        )
+        return deleted, inserted
+
+    def _count_inherited(self, cursor, content_type_id, object_ids_sql,
+                         object_ids_params):
+        cursor.execute('''
+            SELECT COUNT(*) FROM {objperm} WHERE inherited = %s
+                AND content_type_id = %s AND object_id IN ({object_ids})
+        '''.format(object_ids=object_ids_sql, **self.tables),
+            [True, content_type_id] + object_ids_params
+        )
+        return cursor.fetchone()[0]
+
+    def _rebuild_access_index(self, cursor, content_type_id, object_ids_sql,
+                              object_ids_params):
+        ''' Set-based equivalent of rebuild_access_index(). Summing the
+        distinct bits of each (user, object) pair is the same as OR-ing them
+        '''
+        bits = []
+        bit_params = []
+        for codename, permission_id in self._permission_ids(
+                content_type_id).iteritems():
+            bit = ACCESS_BITS.get(codename.split('_', 1)[0])
+            if bit is not None:
+                bits.append('WHEN %s THEN %s')
+                bit_params.extend([permission_id, bit])
+        if bits:
+            mask_sql = 'SUM(DISTINCT CASE g.permission_id {} ELSE 0 END)'
+            mask_sql = mask_sql.format(' '.join(bits))
+        else:
+            mask_sql = '0'
+        anonymous_sql, anonymous_params = self._anonymous_filter(
+            'g', content_type_id)
+        not_denied_sql, not_denied_params = self._not_denied('g')
+        self._execute(cursor, '''
+            DELETE FROM {access} WHERE content_type_id = %s
+                AND object_id IN ({object_ids})
+        '''.format(object_ids=object_ids_sql, **self.tables),
+            [content_type_id] + object_ids_params
+        )
+        self._execute(cursor, '''
+            INSERT INTO {access} (user_id, content_type_id, object_id,
+                permissions)
+            SELECT g.user_id, g.content_type_id, g.object_id, {mask}
+            FROM {objperm} g
+            WHERE g.content_type_id = %s AND g.object_id IN ({object_ids})
+                AND g.deny = %s AND {anonymous} AND {not_denied}
+            GROUP BY g.user_id, g.content_type_id, g.object_id
+            HAVING {mask} > 0
+        '''.format(
+            mask=mask_sql,
+            object_ids=object_ids_sql,
+            anonymous=anonymous_sql,
+            not_denied=not_denied_sql,
+            **self.tables
+        ), bit_params + [content_type_id] + object_ids_params + [False] +
+            anonymous_params + not_denied_params + bit_params
+        )
+
+    @transaction.atomic
+    def recalculate(self):
+        ''' Returns a dictionary of row counts:
+        `{'inserted': ..., 'deleted': ..., 'kept': ...}` '''
+        collections_sql, collections_params = self._descendant_collections()
+        assets_sql, assets_params = self._descendant_assets()
+        max_level = self.collection_model.objects.filter(
+            tree_id=self.root.tree_id,
+            lft__gt=self.root.lft,
+            rght__lt=self.root.rght
+        ).aggregate(models.Max('level'))['level__max']
+        cursor = connection.cursor()
+        deleted = inserted = 0
+        # Each level inherits from the one above it, so go from the top down
+        if max_level is not None:
+            for level in range(self.root.level + 1, max_level + 1):
+                level_sql, level_params = self._collection_level(level)
+                owner_sql, owner_params = self._owner_rows(
+                    self.collection_model, self.collection_ct,
+                    level_sql, level_params
+                )
+                inherited_sql, inherited_params = \
+                    self._collection_level_rows(level)
+                level_deleted, level_inserted = self._sync(
+                    cursor, self.collection_ct, level_sql, level_params,
+                    u'{} UNION {}'.format(owner_sql, inherited_sql),
+                    owner_params + inherited_params
+                )
+                deleted += level_deleted
+                inserted += level_inserted
+        owner_sql, owner_params = self._owner_rows(
+            self.asset_model, self.asset_ct, assets_sql, assets_params)
+        inherited_sql, inherited_params = self._asset_rows()
+        assets_deleted, assets_inserted = self._sync(
+            cursor, self.asset_ct, assets_sql, assets_params,
+            u'{} UNION {}'.format(owner_sql, inherited_sql),
+            owner_params + inherited_params
+        )
+        deleted += assets_deleted
+        inserted += assets_inserted
+        total = self._count_inherited(
+            cursor, self.collection_ct, collections_sql, collections_params
+        ) + self._count_inherited(
+            cursor, self.asset_ct, assets_sql, assets_params)
+        stats = {
+            'inserted': inserted,
+            'deleted': deleted,
+            'kept': total - inserted,
+        }
+        if inserted or deleted:
+            self._rebuild_access_index(
+                cursor, self.collection_ct, collections_sql,
+                collections_params
+            )
+            self._rebuild_access_index(
+                cursor, self.asset_ct, assets_sql, assets_params)
+        return stats
+
+
 class ObjectPermissionMixin(object):
     ''' A mixin class that adds the methods necessary for object-level
     permissions to a model (either models.Model or MPTTModel). The model must
@@ -228,6 +811,30 @@ class ObjectPermissionMixin(object):
     e.g.
         class MyAwesomeModel(ObjectPermissionMixin, models.Model)
     '''
+    # Only changes to these fields affect inherited permissions
+    PERMISSION_TRACKED_FIELDS = ('owner_id', 'parent_id')
+
+    def __init__(self, *args, **kwargs):
+        super(ObjectPermissionMixin, self).__init__(*args, **kwargs)
+        self._reset_permission_tracked_fields()
+
+    def _get_permission_tracked_fields(self):
+        # Read `__dict__` directly so that deferred fields are not loaded from
+        # the database. A deferred field never compares equal to anything, so
+        # it always counts as changed
+        return {field: self.__dict__.get(field, object())
+                for field in self.PERMISSION_TRACKED_FIELDS}
+
+    def _reset_permission_tracked_fields(self):
+        self._permission_tracked_fields = \
+            self._get_permission_tracked_fields()
+
+    def permission_tracked_fields_changed(self):
+        ''' Has `owner` or `parent` changed since we were loaded or last
+        saved? '''
+        return self._permission_tracked_fields != \
+            self._get_permission_tracked_fields()
+
     def get_assignable_permissions(self):
         ''' The "versioned app registry" used during migrations apparently does
         not store non-database attributes, so this awful workaround is needed
@@ -241,33 +848,41 @@ class ObjectPermissionMixin(object):
 
     @transaction.atomic
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         # Make sure we exist in the database before proceeding
         super(ObjectPermissionMixin, self).save(*args, **kwargs)
+        if not adding and not self.permission_tracked_fields_changed():
+            # The modification is trivial, e.g. a collection was renamed or
+            # the content of an asset was edited
+            increment_counter('permission_recalculation.skipped')
+            return
+        # Moving an object can change its permissions and those of its
+        # descendants
+        invalidate_permission_cache()
         # Recalculate self and all descendants, re-fetching ourself first to
         # guard against stale MPTT values
         fresh_self = type(self).objects.get(pk=self.pk)
-        # TODO: Don't do this when the modification is trivial, e.g. a
-        # collection was renamed
         fresh_self._recalculate_inherited_perms()
-        fresh_self.recalculate_descendants_perms()
+        fresh_self._schedule_descendants_recalculation()
+        increment_counter('permission_recalculation.performed')
+        self._reset_permission_tracked_fields()
 
     def _filter_anonymous_perms(self, unfiltered_set):
         ''' Restrict a set of tuples in the format (user_id, permission_id) to
         only those permissions that apply to the content_type of this object
         and are listed in settings.ALLOWED_ANONYMOUS_PERMISSIONS. '''
-        content_type = ContentType.objects.get_for_model(self)
+        permission_ids = permission_registry.get_permission_ids(
+            permission_registry.get_content_type_id(self))
         # Translate settings.ALLOWED_ANONYMOUS_PERMISSIONS to primary keys
-        codenames = set()
+        allowed_permissions = set()
         for perm in settings.ALLOWED_ANONYMOUS_PERMISSIONS:
             app_label, codename = perm_parse(perm)
-            if app_label == content_type.app_label:
-                codenames.add(codename)
-        allowed_permissions = Permission.objects.filter(
-            content_type=content_type, codename__in=codenames
-        ).values_list('pk', flat=True)
+            if app_label == self._meta.app_label and \
+                    codename in permission_ids:
+                allowed_permissions.add(permission_ids[codename])
         filtered_set = copy.copy(unfiltered_set)
         for user_id, permission_id in unfiltered_set:
-            if user_id == settings.ANONYMOUS_USER_ID:
+            if is_anonymous_user_id(user_id):
                 if permission_id not in allowed_permissions:
                     filtered_set.remove((user_id, permission_id))
         return filtered_set
@@ -280,16 +895,20 @@ class ObjectPermissionMixin(object):
         current object. '''
         # Including calculated permissions means we can't just pass kwargs
         # through to filter(), but we'll map the ones we understand.
+        content_type_id = permission_registry.get_content_type_id(self)
         kwargs = {}
         if user is not None:
             kwargs['user'] = user
         if codename is not None:
             # share_ requires loading change_ from the database
             if codename.startswith('share_'):
-                kwargs['permission__codename'] = re.sub(
-                    '^share_', 'change_', codename, 1)
+                stored_codename = re.sub('^share_', 'change_', codename, 1)
             else:
-                kwargs['permission__codename'] = codename
+                stored_codename = codename
+            # A codename that doesn't belong to our content type becomes
+            # `permission_id=None`, which, as before, matches nothing
+            kwargs['permission_id'] = permission_registry.get_permission_ids(
+                content_type_id).get(stored_codename)
         grant_perms = set(ObjectPermission.objects.filter_for_object(self,
             deny=False, **kwargs).values_list('user_id', 'permission_id'))
         deny_perms = set(ObjectPermission.objects.filter_for_object(self,
@@ -301,14 +920,13 @@ class ObjectPermissionMixin(object):
             # Double-check that the list includes only permissions for
             # anonymous users that are allowed by the settings. Other
             # permissions would be denied by has_perm() anyway.
-            if user is None or user.pk == settings.ANONYMOUS_USER_ID:
+            if user is None or is_anonymous_user_id(user.pk):
                 return self._filter_anonymous_perms(effective_perms)
             else:
                 # Anonymous users weren't considered; no filtering is necessary
                 return effective_perms
 
         # Add on the calculated permissions
-        content_type = ContentType.objects.get_for_model(self)
         if codename in self.CALCULATED_PERMISSIONS:
             # A sepecific query for a calculated permission should not return
             # any explicitly assigned permissions, e.g. share_ should not
@@ -320,29 +938,26 @@ class ObjectPermissionMixin(object):
         if self.editors_can_change_permissions and (
             codename is None or codename.startswith('share_')):
             # Everyone with change_ should also get share_
-            change_permission = Permission.objects.get(
-                content_type=content_type,
-                codename__startswith='change_'
-            )
-            share_permission = Permission.objects.get(
-                content_type=content_type,
-                codename__startswith='share_'
-            )
+            change_permission_id = \
+                permission_registry.get_permission_id_by_prefix(
+                    content_type_id, 'change_')
+            share_permission_id = \
+                permission_registry.get_permission_id_by_prefix(
+                    content_type_id, 'share_')
             for user_id, permission_id in effective_perms_copy:
-                if permission_id == change_permission.pk:
-                    effective_perms.add((user_id, share_permission.pk))
+                if permission_id == change_permission_id:
+                    effective_perms.add((user_id, share_permission_id))
         # The owner has the delete_ permission
         if self.owner is not None and (
             user is None or user.pk == self.owner.pk) and (
             codename is None or codename.startswith('delete_')):
-            delete_permission = Permission.objects.get(
-                content_type=content_type,
-                codename__startswith='delete_'
-            )
-            effective_perms.add((self.owner.pk, delete_permission.pk))
+            delete_permission_id = \
+                permission_registry.get_permission_id_by_prefix(
+                    content_type_id, 'delete_')
+            effective_perms.add((self.owner.pk, delete_permission_id))
         # We may have calculated more permissions for anonymous users
         # than they are allowed to have. Remove them.
-        if user is None or user.pk == settings.ANONYMOUS_USER_ID:
+        if user is None or is_anonymous_user_id(user.pk):
             return self._filter_anonymous_perms(effective_perms)
         else:
             # Anonymous users weren't considered; no filtering is necessary
@@ -363,6 +978,15 @@ class ObjectPermissionMixin(object):
             # It's impossible for us to have descendants. Move along...
             return
 
+        if settings.SET_BASED_PERMISSION_RECALCULATION and hasattr(
+                self, '_mpttfield') and \
+                SubtreePermissionRecalculator.is_supported():
+            # Let the database do the work for the whole subtree at once
+            stats = SubtreePermissionRecalculator(self).recalculate()
+            record_inherited_permission_changes(stats)
+            return stats
+
+        stats = {'inserted': 0, 'deleted': 0, 'kept': 0}
         # Any potential parents found will be appended to this list
         parents = [self]
         while True:
@@ -382,31 +1006,10 @@ class ObjectPermissionMixin(object):
                     break
             children = getattr(parent, method)().only(
                 'pk', 'owner', 'parent')
-            # Delete stale permissions once per parent, instead of per-child
-            # TODO: Um, don't have two loops?
-            delete_pks_by_content_type = {}
-            for child in children:
-                content_type = ContentType.objects.get_for_model(child).pk
-                pk_list = delete_pks_by_content_type.get(content_type, [])
-                pk_list.append(child.pk)
-                delete_pks_by_content_type[content_type] = pk_list
-            delete_query = models.Q()
-            for content_type, pks in delete_pks_by_content_type.iteritems():
-                delete_query |= models.Q(
-                    content_type=content_type,
-                    object_id__in=pks
-                )
-            # filter(Q()) is like all(); make sure we don't delete with a query
-            # like that just because there are no children!
-            if len(delete_pks_by_content_type):
-                # This doesn't run as a single DELETE query. For once, MySQL
-                # wins? https://code.djangoproject.com/ticket/23576#comment:3
-                # TODO: Verify this is faster than having children delete
-                ObjectPermission.objects.filter(
-                    delete_query, inherited=True).delete()
             # Process each child individually, but only write to the database
             # once per parent
-            objects_to_create = []
+            pks_by_content_type = defaultdict(list)
+            desired_permissions = []
             for child in children:
                 for method in GET_CHILDREN_METHODS:
                     if hasattr(child, method):
@@ -414,115 +1017,137 @@ class ObjectPermissionMixin(object):
                         # check it later
                         parents.append(child)
                         break
+                pks_by_content_type[
+                    permission_registry.get_content_type_id(child)
+                ].append(child.pk)
                 # Recalculate the child's permissions
-                new_permissions = child._recalculate_inherited_perms(
+                desired_permissions.extend(child._recalculate_inherited_perms(
                     parent_effective_perms=parent_effective_perms,
-                    stale_already_deleted=True,
                     return_instead_of_creating=True
-                )
-                objects_to_create += new_permissions
-            ObjectPermission.objects.bulk_create(objects_to_create)
+                ))
+            changes = sync_inherited_permissions(
+                pks_by_content_type, desired_permissions)
+            for key, value in changes.iteritems():
+                stats[key] += value
+            if changes['inserted'] or changes['deleted']:
+                # Bring the access index up to date for all children at once
+                for content_type, pks in pks_by_content_type.iteritems():
+                    rebuild_access_index(content_type, pks)
+        record_inherited_permission_changes(stats)
+        return stats
+
+    def _schedule_descendants_recalculation(self):
+        ''' Call recalculate_descendants_perms() now or, if
+        settings.ASYNC_PERMISSION_RECALCULATION is enabled, enqueue a Celery
+        task to recalculate the whole tree once the current transaction has
+        committed. A task that is already waiting for the same tree makes
+        enqueuing another unnecessary. Without a way to wait for the commit,
+        e.g. inside a transaction outside of a request, the recalculation
+        happens now '''
+        if not settings.ASYNC_PERMISSION_RECALCULATION or getattr(
+                settings, 'CELERY_ALWAYS_EAGER', False) or not hasattr(
+                self, '_mpttfield'):
+            self.recalculate_descendants_perms()
+            return
+        model = type(self)
+        tree_id = self.tree_id
+        delay = settings.ASYNC_PERMISSION_RECALCULATION_DELAY
+        # Avoid a circular import
+        from ..tasks import recalculate_tree_permissions
+
+        def enqueue():
+            if not cache.add(
+                    permission_recalculation_cache_key(model, tree_id), True,
+                    # Don't wait forever if the task is lost
+                    delay + 600
+            ):
+                return
+            recalculate_tree_permissions.apply_async(
+                args=(model._meta.app_label, model._meta.model_name, tree_id),
+                countdown=delay
+            )
+        if not on_commit(enqueue):
+            self.recalculate_descendants_perms()
 
     def _recalculate_inherited_perms(
             self,
             parent_effective_perms=None,
-            stale_already_deleted=False,
-            return_instead_of_creating=False,
-            translate_perm={} # mutable default parameter serves as cache
+            return_instead_of_creating=False
     ):
         ''' Copy all of our parent's effective permissions to ourself,
         marking the copies as inherited permissions. The owner's rights are
-        also made explicit as "inherited" permissions. '''
-        # Start with a clean slate
-        if not stale_already_deleted:
-            ObjectPermission.objects.filter_for_object(
-                self,
-                inherited=True
-            ).delete()
-        content_type = ContentType.objects.get_for_model(self)
-        if return_instead_of_creating:
-            # Conditionally create this so that Python will raise an exception
-            # if we use it when we're not supposed to
-            objects_to_return = []
+        also made explicit as "inherited" permissions. Existing inherited
+        permissions that are still correct are left untouched. '''
+        content_type_id = permission_registry.get_content_type_id(self)
+        new_permissions = []
         # The owner gets every assignable permission
-        if self.owner is not None:
-            for perm in Permission.objects.filter(
-                content_type=content_type,
-                codename__in=self.get_assignable_permissions()
-            ):
+        if self.owner_id is not None:
+            permission_ids = permission_registry.get_permission_ids(
+                content_type_id)
+            for codename in self.get_assignable_permissions():
                 new_permission = ObjectPermission()
-                new_permission.content_object = self
+                new_permission.content_type_id = content_type_id
+                new_permission.object_id = self.pk
                 # `user_id` instead of `user` is another workaround for
                 # migrations
                 new_permission.user_id = self.owner_id
-                new_permission.permission = perm
+                new_permission.permission_id = permission_ids[codename]
                 new_permission.inherited = True
-                new_permission.uid = new_permission._meta.get_field(
-                    'uid').generate_uid()
-                if return_instead_of_creating:
-                    objects_to_return.append(new_permission)
-                else:
-                    new_permission.save()
+                new_permissions.append(new_permission)
         # Is there anything to inherit?
-        if self.parent is not None:
+        if self.parent_id is not None:
             # Get our parent's effective permissions from the database if they
             # were not passed in as an argument
             if parent_effective_perms is None:
                 parent_effective_perms = self.parent._get_effective_perms(
                     include_calculated=False)
+            parent_model = self._meta.get_field('parent').related_model
             # All our parent's effective permissions become our inherited
-            # permissions. Store translations in the translate_perm dictionary
-            # to minimize invocations of the Django machinery
+            # permissions. The registry holds precomputed translations for
+            # models that define MAPPED_PARENT_PERMISSIONS
             for user_id, permission_id in parent_effective_perms:
                 if user_id == self.owner_id:
                     # The owner already has every assignable permission
                     continue
                 if hasattr(self, 'MAPPED_PARENT_PERMISSIONS'):
-                    try:
-                        translated_id = translate_perm[permission_id]
-                    except KeyError:
-                        parent_perm = Permission.objects.get(pk=permission_id)
-                        try:
-                            translated_codename = \
-                                self.MAPPED_PARENT_PERMISSIONS[
-                                    parent_perm.codename]
-                        except KeyError:
-                            # We haven't been configured to inherit this
-                            # permission from our parent, so skip it
-                            continue
-                        translated_id = Permission.objects.get(
-                            content_type__app_label=\
-                                parent_perm.content_type.app_label,
-                            codename=translated_codename
-                        ).pk
-                        translate_perm[permission_id] = translated_id
-                    permission_id = translated_id
-                elif content_type != ContentType.objects.get_for_model(
-                        self.parent
-                ):
+                    permission_id = \
+                        permission_registry.translate_parent_permission(
+                            self, permission_id)
+                    if permission_id is None:
+                        # We haven't been configured to inherit this
+                        # permission from our parent, so skip it
+                        continue
+                elif content_type_id != \
+                        permission_registry.get_content_type_id(parent_model):
                     raise ImproperlyConfigured(
                         'Parent of {} is a {}, but the child has not defined '
                         'MAPPED_PARENT_PERMISSIONS.'.format(
-                            type(self), type(self.parent))
+                            type(self), parent_model)
                     )
                 new_permission = ObjectPermission()
-                new_permission.content_object = self
+                new_permission.content_type_id = content_type_id
+                new_permission.object_id = self.pk
                 new_permission.user_id = user_id
                 new_permission.permission_id = permission_id
                 new_permission.inherited = True
-                new_permission.uid = new_permission._meta.get_field(
-                    'uid').generate_uid()
-                if return_instead_of_creating:
-                    objects_to_return.append(new_permission)
-                else:
-                    new_permission.save()
+                new_permissions.append(new_permission)
         if return_instead_of_creating:
-            return objects_to_return
+            return new_permissions
+        changes = sync_inherited_permissions(
+            {content_type_id: [self.pk]}, new_permissions)
+        record_inherited_permission_changes(changes)
+        if changes['inserted'] or changes['deleted']:
+            self._update_access_index()
 
-    @transaction.atomic
-    def assign_perm(self, user_obj, perm, deny=False, defer_recalc=False):
-        ''' Assign user_obj the given perm on this object. To break
-        inheritance from a parent object, use deny=True. '''
+    def _update_access_index(self):
+        ''' Recalculate the `UserObjectAccess` rows for this object '''
+        rebuild_access_index(
+            permission_registry.get_content_type_id(self), [self.pk])
+
+    def _validate_assignment(self, user_obj, perm):
+        ''' Raise ValidationError unless user_obj may be assigned perm on
+        this object. Returns user_obj, translated from AnonymousUser if
+        necessary, along with the app label and codename of perm '''
         app_label, codename = perm_parse(perm, self)
         if codename not in self.get_assignable_permissions():
             # Some permissions are calculated and not stored in the database
@@ -530,7 +1155,7 @@ class ObjectPermissionMixin(object):
                 codename)
             )
         if isinstance(user_obj, AnonymousUser) or (
-            user_obj.pk == settings.ANONYMOUS_USER_ID
+            is_anonymous_user_id(user_obj.pk)
         ):
             # Is an anonymous user allowed to have this permission?
             fq_permission = '{}.{}'.format(app_label, codename)
@@ -541,17 +1166,23 @@ class ObjectPermissionMixin(object):
                 )
             # Get the User database representation for AnonymousUser
             user_obj = get_anonymous_user()
-        perm_model = Permission.objects.get(
-            content_type__app_label=app_label,
-            codename=codename
-        )
+        return user_obj, app_label, codename
+
+    @transaction.atomic
+    def assign_perm(self, user_obj, perm, deny=False, defer_recalc=False):
+        ''' Assign user_obj the given perm on this object. To break
+        inheritance from a parent object, use deny=True. '''
+        user_obj, app_label, codename = self._validate_assignment(
+            user_obj, perm)
+        permission_id = permission_registry.get_permission_id(
+            app_label, codename)
         existing_perms = ObjectPermission.objects.filter_for_object(
             self,
             user=user_obj,
         )
         identical_existing_perm = existing_perms.filter(
             inherited=False,
-            permission_id=perm_model.pk,
+            permission_id=permission_id,
             deny=deny,
         )
         if identical_existing_perm.exists():
@@ -559,15 +1190,16 @@ class ObjectPermissionMixin(object):
             return identical_existing_perm.first()
         # Remove any explicitly-defined contradictory grants or denials
         existing_perms.filter(user=user_obj,
-            permission_id=perm_model.pk,
+            permission_id=permission_id,
             deny=not deny,
             inherited=False
         ).delete()
+        invalidate_permission_cache()
         # Create the new permission
         new_permission = ObjectPermission.objects.create(
             content_object=self,
             user=user_obj,
-            permission_id=perm_model.pk,
+            permission_id=permission_id,
             deny=deny,
             inherited=False
         )
@@ -580,6 +1212,7 @@ class ObjectPermissionMixin(object):
             change_codename = re.sub('^view_', 'change_', codename)
             self.assign_perm(user_obj, change_codename,
                              deny=True, defer_recalc=True)
+        self._update_access_index()
         # We might have been called by ourself to assign a related
         # permission. In that case, don't recalculate here.
         if defer_recalc:
@@ -587,16 +1220,14 @@ class ObjectPermissionMixin(object):
         # Recalculate all descendants, re-fetching ourself first to guard
         # against stale MPTT values
         fresh_self = type(self).objects.get(pk=self.pk)
-        fresh_self.recalculate_descendants_perms()
+        fresh_self._schedule_descendants_recalculation()
         return new_permission
 
     def get_perms(self, user_obj):
         ''' Return a list of codenames of all effective grant permissions that
         user_obj has on this object. '''
         user_perm_ids = self._get_effective_perms(user=user_obj)
-        perm_ids = [x[1] for x in user_perm_ids]
-        return Permission.objects.filter(pk__in=perm_ids).values_list(
-            'codename', flat=True)
+        return [permission_registry.get_codename(x[1]) for x in user_perm_ids]
 
     def get_users_with_perms(self, attach_perms=False):
         ''' Return a QuerySet of all users with any effective grant permission
@@ -607,7 +1238,7 @@ class ObjectPermissionMixin(object):
             user_perm_dict = {}
             for user_id, perm_id in user_perm_ids:
                 perm_list = user_perm_dict.get(user_id, [])
-                perm_list.append(Permission.objects.get(pk=perm_id).codename)
+                perm_list.append(permission_registry.get_codename(perm_id))
                 user_perm_dict[user_id] = perm_list
             # Resolve user ids into actual user objects
             user_perm_dict = {User.objects.get(pk=key): value for (key, value)
@@ -625,7 +1256,7 @@ class ObjectPermissionMixin(object):
         if isinstance(user_obj, AnonymousUser):
             # Get the User database representation for AnonymousUser
             user_obj = get_anonymous_user()
-        if user_obj.pk == settings.ANONYMOUS_USER_ID:
+        if is_anonymous_user_id(user_obj.pk):
             is_anonymous = True
         # Treat superusers the way django.contrib.auth does
         if user_obj.is_active and user_obj.is_superuser:
@@ -668,11 +1299,13 @@ class ObjectPermissionMixin(object):
         all_permissions = ObjectPermission.objects.filter_for_object(
             self,
             user=user_obj,
-            permission__codename=codename,
+            permission_id=permission_registry.get_permission_id(
+                app_label, codename),
             deny=False
         )
         direct_permissions = all_permissions.filter(inherited=False)
         inherited_permissions = all_permissions.filter(inherited=True)
+        invalidate_permission_cache()
         # Revoking view implies revoking change
         if codename.startswith('view_'):
             change_codename = re.sub('^view_', 'change_', codename)
@@ -684,6 +1317,7 @@ class ObjectPermissionMixin(object):
             inherited_permissions.delete()
             # Add a deny permission to block future inheritance
             self.assign_perm(user_obj, perm, deny=True, defer_recalc=True)
+        self._update_access_index()
         # We might have been called by ourself to assign a related
         # permission. In that case, don't recalculate here.
         if defer_recalc:
@@ -691,4 +1325,134 @@ class ObjectPermissionMixin(object):
         # Recalculate all descendants, re-fetching ourself first to guard
         # against stale MPTT values
         fresh_self = type(self).objects.get(pk=self.pk)
-        fresh_self.recalculate_descendants_perms()
+        fresh_self._schedule_descendants_recalculation()
+
+    @staticmethod
+    def _implied_codenames(codename, deny):
+        ''' Granting change implies granting view, and denying view implies
+        denying change '''
+        codenames = set([codename])
+        if codename.startswith('change_') and not deny:
+            codenames.add(re.sub('^change_', 'view_', codename))
+        if codename.startswith('view_') and deny:
+            codenames.add(re.sub('^view_', 'change_', codename))
+        return codenames
+
+    def _bulk_create_direct_perms(self, user_permission_ids, deny):
+        ''' Create direct (i.e. not inherited) permissions for every
+        (user_id, permission_id) pair in user_permission_ids, replacing
+        contradictory grants or denials. Returns the new ObjectPermissions '''
+        if not user_permission_ids:
+            return []
+        content_type_id = permission_registry.get_content_type_id(self)
+        direct_perms = ObjectPermission.objects.filter(
+            content_type_id=content_type_id,
+            object_id=self.pk,
+            user_id__in=set(x[0] for x in user_permission_ids),
+            permission_id__in=set(x[1] for x in user_permission_ids),
+            inherited=False
+        )
+        existing = set(direct_perms.values_list(
+            'user_id', 'permission_id', 'deny'))
+        # Remove any explicitly-defined contradictory grants or denials
+        contradictory = models.Q()
+        for user_id, permission_id in user_permission_ids:
+            if (user_id, permission_id, not deny) in existing:
+                contradictory |= models.Q(
+                    user_id=user_id, permission_id=permission_id)
+        # filter(Q()) is like all(); make sure there's something to delete!
+        if contradictory:
+            direct_perms.filter(contradictory, deny=not deny).delete()
+        uid_field = ObjectPermission._meta.get_field('uid')
+        new_permissions = [
+            ObjectPermission(
+                content_type_id=content_type_id,
+                object_id=self.pk,
+                user_id=user_id,
+                permission_id=permission_id,
+                deny=deny,
+                inherited=False,
+                uid=uid_field.generate_uid()
+            ) for user_id, permission_id in user_permission_ids
+            if (user_id, permission_id, deny) not in existing
+        ]
+        ObjectPermission.objects.bulk_create(new_permissions)
+        return new_permissions
+
+    def _bulk_permission_change_done(self):
+        invalidate_permission_cache()
+        self._update_access_index()
+        # Recalculate all descendants once, re-fetching ourself first to guard
+        # against stale MPTT values
+        fresh_self = type(self).objects.get(pk=self.pk)
+        fresh_self._schedule_descendants_recalculation()
+
+    @transaction.atomic
+    def assign_perms_bulk(self, user_objs, perms, deny=False):
+        ''' Assign every perm in perms to every user in user_objs, with the
+        same implications as assign_perm(), but write to the database in bulk
+        and recalculate descendants only once. Returns a list of the newly
+        created ObjectPermissions '''
+        user_permission_ids = set()
+        for user_obj in user_objs:
+            for perm in perms:
+                user_obj, app_label, codename = self._validate_assignment(
+                    user_obj, perm)
+                for implied in self._implied_codenames(codename, deny):
+                    user_permission_ids.add((
+                        user_obj.pk,
+                        permission_registry.get_permission_id(
+                            app_label, implied)
+                    ))
+        new_permissions = self._bulk_create_direct_perms(
+            user_permission_ids, deny)
+        self._bulk_permission_change_done()
+        return new_permissions
+
+    @transaction.atomic
+    def remove_perms_bulk(self, user_objs, perms):
+        ''' Revoke every perm in perms from every user in user_objs, with the
+        same effects as remove_perm(), but write to the database in bulk and
+        recalculate descendants only once '''
+        user_ids = set()
+        permission_ids = set()
+        for user_obj in user_objs:
+            if isinstance(user_obj, AnonymousUser):
+                # Get the User database representation for AnonymousUser
+                user_obj = get_anonymous_user()
+            user_ids.add(user_obj.pk)
+        for perm in perms:
+            app_label, codename = perm_parse(perm, self)
+            if codename not in self.get_assignable_permissions():
+                # Some permissions are calculated and not stored in the
+                # database
+                raise ValidationError('{} cannot be removed explicitly.'.format(
+                    codename)
+                )
+            # Revoking view implies revoking change
+            codenames = self._implied_codenames(codename, deny=True)
+            for implied in codenames:
+                permission_ids.add(permission_registry.get_permission_id(
+                    app_label, implied))
+        grants = ObjectPermission.objects.filter(
+            content_type_id=permission_registry.get_content_type_id(self),
+            object_id=self.pk,
+            user_id__in=user_ids,
+            permission_id__in=permission_ids,
+            deny=False
+        )
+        # Inherited permissions must be blocked by deny permissions
+        deny_user_permission_ids = set()
+        for user_id, permission_id in grants.filter(
+                inherited=True).values_list('user_id', 'permission_id'):
+            codename = permission_registry.get_codename(permission_id)
+            for implied in self._implied_codenames(codename, deny=True):
+                deny_user_permission_ids.add((
+                    user_id,
+                    permission_registry.get_permission_id(
+                        self._meta.app_label, implied)
+                ))
+        # Delete both direct and inherited grants
+        grants.delete()
+        self._bulk_create_direct_perms(deny_user_permission_ids, deny=True)
+        self._bulk_permission_change_done()
@@ -1,7 +1,7 @@
-from django.contrib.auth.models import Permission
-from django.contrib.contenttypes.models import ContentType
 from rest_framework import permissions
 
+from .utils.permission_registry import permission_registry
+
 
 # FIXME: Move to `object_permissions` module.
 def get_perm_name(perm_name_prefix, model_instance):
@@ -26,10 +26,12 @@ def get_perm_name(perm_name_prefix, model_instance):
     if not perm_name_prefix[-1] == '_':
         perm_name_prefix+= '_'
 
-    perm_name= Permission.objects.get(
-        content_type=ContentType.objects.get_for_model(model_instance),
-        codename__startswith=perm_name_prefix
-    ).natural_key()[0]
+    perm_name= permission_registry.get_codename(
+        permission_registry.get_permission_id_by_prefix(
+            permission_registry.get_content_type_id(model_instance),
+            perm_name_prefix
+        )
+    )
 
     return perm_name
 
@@ -5,8 +5,11 @@ from rest_framework import renderers
 from rest_framework.response import Response
 from kpi.serializers import UserSerializer
 from kpi.models import AssetSnapshot
+from kpi.utils.artifact_cache import open_artifact, read_artifact
+from kpi.utils.spreadsheet_export import STREAM_CHUNK_SIZE
 import json
 import copy
+from wsgiref.util import FileWrapper
 
 
 class AssetJsonRenderer(renderers.JSONRenderer):
@@ -21,7 +24,9 @@ class SSJsonRenderer(renderers.JSONRenderer):
     def render(self, data, media_type=None, renderer_context=None):
         # this accessing of the model might be frowned upon, but I'd prefer to avoid
         # re-building the SS structure outside of the model for now.
-        return json.dumps(renderer_context['view'].get_object().to_ss_structure())
+        asset = renderer_context['view'].get_object()
+        return read_artifact(
+            asset, self.format, lambda: json.dumps(asset.to_ss_structure()))
 
 class XFormRenderer(renderers.BaseRenderer):
     media_type = 'application/xml'
@@ -39,12 +44,30 @@ class AssetSnapshotXFormRenderer(renderers.BaseRenderer):
 
     def render(self, data, media_type=None, renderer_context=None):
         asset_snapshot = renderer_context['view'].get_object()
+        asset_snapshot.record_access()
         return asset_snapshot.xml
 
 class XlsRenderer(renderers.BaseRenderer):
     media_type = 'application/xls'
     format = 'xls'
+    xlsx = False
+
+    def _open(self, asset):
+        return open_artifact(
+            asset, self.format, lambda: asset.to_xls_io(xlsx=self.xlsx))
 
     def render(self, data, media_type=None, renderer_context=None):
         asset = renderer_context['view'].get_object()
-        return asset.to_xls_io()
+        with self._open(asset) as xls_io:
+            return xls_io.read()
+
+    def stream(self, asset):
+        ''' Iterate over the exported spreadsheet in chunks, for use with a
+        StreamingHttpResponse. The file is closed once the response is '''
+        return FileWrapper(self._open(asset), STREAM_CHUNK_SIZE)
+
+class XlsxRenderer(XlsRenderer):
+    media_type = \
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    format = 'xlsx'
+    xlsx = True
@@ -1,8 +1,9 @@
+import copy
 import datetime
 import json
 from collections import OrderedDict
 
-from django.contrib.auth.models import User, Permission
+from django.contrib.auth.models import AnonymousUser, User, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import get_script_prefix, resolve, Resolver404
@@ -21,7 +22,10 @@ from .models import CollectionChildrenQuerySet
 from .models import UserCollectionSubscription
 from .models import ImportTask
 from .models import ObjectPermission
-from .models.object_permission import get_anonymous_user, get_objects_for_user
+from .models.object_permission import (
+    get_database_user_id,
+    get_objects_for_user,
+)
 from .models.asset import ASSET_TYPES
 from .models import TagUid
 from .models import OneTimeAuthenticationKey
@@ -170,26 +174,21 @@ class TagSerializer(serializers.ModelSerializer):
 
     def _get_assets(self, obj):
         request = self.context.get('request', None)
-        user = request.user
-        # Check if the user is anonymous. The
-        # django.contrib.auth.models.AnonymousUser object doesn't work for
-        # queries.
-        if user.is_anonymous():
-            user = get_anonymous_user()
+        # The django.contrib.auth.models.AnonymousUser object doesn't work for
+        # queries
+        owner_id = get_database_user_id(request.user)
         return [reverse('asset-detail', args=(sa.uid,), request=request)
-                for sa in Asset.objects.filter(tags=obj, owner=user).all()]
+                for sa in Asset.objects.filter(
+                    tags=obj, owner_id=owner_id).all()]
 
     def _get_collections(self, obj):
         request = self.context.get('request', None)
-        user = request.user
-        # Check if the user is anonymous. The
-        # django.contrib.auth.models.AnonymousUser object doesn't work for
-        # queries.
-        if user.is_anonymous():
-            user = get_anonymous_user()
+        # The django.contrib.auth.models.AnonymousUser object doesn't work for
+        # queries
+        owner_id = get_database_user_id(request.user)
         return [reverse('collection-detail', args=(coll.uid,), request=request)
-                for coll in Collection.objects.filter(tags=obj, owner=user)
-                .all()]
+                for coll in Collection.objects.filter(
+                    tags=obj, owner_id=owner_id).all()]
 
     def _get_tag_url(self, obj):
         request = self.context.get('request', None)
@@ -249,6 +248,23 @@ class ObjectPermissionSerializer(serializers.ModelSerializer):
         return content_object.assign_perm(user, perm)
 
 
+class BulkObjectPermissionSerializer(serializers.Serializer):
+    ''' Many users and permissions on a single object, for assigning or
+    removing permissions in bulk '''
+    content_object = GenericHyperlinkedRelatedField(
+        lookup_field='uid',
+        style={'base_template': 'input.html'} # Render as a simple text box
+    )
+    users = RelativePrefixHyperlinkedRelatedField(
+        view_name='user-detail',
+        lookup_field='username',
+        queryset=User.objects.all(),
+        many=True,
+    )
+    permissions = serializers.ListField(child=serializers.CharField())
+    deny = serializers.BooleanField(required=False, default=False)
+
+
 class AncestorCollectionsSerializer(serializers.HyperlinkedModelSerializer):
     url = serializers.HyperlinkedIdentityField(
         lookup_field='uid', view_name='collection-detail')
@@ -432,16 +448,10 @@ class AssetSerializer(serializers.HyperlinkedModelSerializer):
 
     def get_fields(self, *args, **kwargs):
         fields = super(AssetSerializer, self).get_fields(*args, **kwargs)
-        user = self.context['request'].user
-        # Check if the user is anonymous. The
-        # django.contrib.auth.models.AnonymousUser object doesn't work for
-        # queries.
-        if user.is_anonymous():
-            user = get_anonymous_user()
         if 'parent' in fields:
             # TODO: remove this restriction?
             fields['parent'].queryset = fields['parent'].queryset.filter(
-                owner=user)
+                owner_id=get_database_user_id(self.context['request'].user))
         # Honor requests to exclude fields
         # TODO: Actually exclude fields from tha database query! DRF grabs
         # all columns, even ones that are never named in `fields`
@@ -502,39 +512,37 @@ class AssetSerializer(serializers.HyperlinkedModelSerializer):
             return obj.deployment.version
 
     def get_deployed_versions(self, asset):
-        asset_deployments_by_version_id = OrderedDict()
         deployed_versioned_assets = []
-        # Record the current deployment, if any
-        if asset.has_deployment:
-            asset_deployments_by_version_id[asset.deployment.version] = \
-                asset.deployment
-            # The currently deployed version may be unknown, but we still want
-            # to pass its timestamp to the serializer
-            if asset.deployment.version == 0:
-                # Temporary attributes for later use by the serializer
-                asset._static_version_id = 0
-                asset._date_deployed = asset.deployment.timestamp
-                deployed_versioned_assets.append(asset)
-        # Record all previous deployments
-        for version in asset.versions():
-            historical_asset = version.object_version.object
-            if historical_asset.has_deployment:
-                asset_deployments_by_version_id[
-                    historical_asset.deployment.version
-                ] = historical_asset.deployment
-        # Annotate and list deployed asset versions
-        for version in asset.versions().filter(
-                id__in=asset_deployments_by_version_id.keys()):
-            historical_asset = version.object_version.object
+        # The currently deployed version may be unknown, but we still want
+        # to pass its timestamp to the serializer
+        if asset.has_deployment and asset.deployment.version == 0:
+            # Temporary attributes for later use by the serializer
+            asset._static_version_id = 0
+            asset._date_deployed = asset.deployment.timestamp
+            deployed_versioned_assets.append(asset)
+        # Find when each version was first deployed
+        date_deployed_by_version_id = {}
+        for version_id, timestamp in asset.deployment_events.exclude(
+                version_id=None).exclude(version_id=0).order_by(
+                    'pk').values_list('version_id', 'timestamp'):
+            date_deployed_by_version_id.setdefault(version_id, timestamp)
+        # Skip versions that have since been deleted, which could not be
+        # retrieved
+        existing_version_ids = asset.versions().filter(
+            pk__in=date_deployed_by_version_id.keys()
+        ).values_list('pk', flat=True)
+        # Annotate and list deployed asset versions, newest first. Only the
+        # annotations are serialized, so there's no need to deserialize the
+        # historical versions themselves
+        for version_id in sorted(existing_version_ids, reverse=True):
+            versioned_asset = copy.copy(asset)
             # Asset.version_id returns the *most recent* version of the asset;
-            # it has no way to know the version of the instance it's bound to.
-            # Record a _static_version_id here for the serializer to use
-            historical_asset._static_version_id = version.id
+            # record a _static_version_id here for the serializer to use
+            versioned_asset._static_version_id = version_id
             # Make the deployment timestamp available to the serializer
-            historical_asset._date_deployed = asset_deployments_by_version_id[
-                version.id].timestamp
-            # Store the annotated asset objects in a list for serialization
-            deployed_versioned_assets.append(historical_asset)
+            versioned_asset._date_deployed = date_deployed_by_version_id[
+                version_id]
+            deployed_versioned_assets.append(versioned_asset)
         return AssetVersionListSerializer(
             deployed_versioned_assets,
             many=True,
@@ -992,7 +1000,7 @@ class UserCollectionSubscriptionSerializer(serializers.ModelSerializer):
         super(UserCollectionSubscriptionSerializer, self).__init__(
             *args, **kwargs)
         self.fields['collection'].queryset = get_objects_for_user(
-            get_anonymous_user(),
+            AnonymousUser(),
             'view_collection',
             Collection.objects.filter(discoverable_when_public=True)
         )
@@ -2,8 +2,12 @@ from  django.db import models
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from taggit.models import Tag
-from .models import TagUid
+from .models import Asset, TagUid
+from .models.asset_version import DELTA_MARKER, rebuild_content
 from .model_utils import grant_default_model_level_perms
+from .models.object_permission import (
+    clear_anonymous_user_cache, is_anonymous_user_id)
+from .utils.permission_registry import permission_registry
 
 @receiver(models.signals.post_save, sender=User)
 def default_permissions_post_save(sender, instance, created, raw, **kwargs):
@@ -28,3 +32,27 @@ def tag_uid_post_save(sender, instance, created, raw, **kwargs):
     if raw or not created:
         return
     TagUid.objects.get_or_create(tag=instance)
+
+@receiver(models.signals.post_init, sender=Asset)
+def asset_post_init(sender, instance, **kwargs):
+    ''' Rebuild content that reversion deserialized from a version stored
+    as a delta, so that reverting it can't write the delta over the form '''
+    # Deferred content isn't in __dict__ and must stay unloaded
+    content = instance.__dict__.get('content')
+    if isinstance(content, dict) and DELTA_MARKER in content:
+        instance.content = rebuild_content(content)
+
+@receiver(models.signals.post_migrate)
+def permission_registry_post_migrate(sender, **kwargs):
+    ''' Migrating (and flushing the database, e.g. between tests) can create
+    permissions and content types with new primary keys '''
+    permission_registry.clear()
+    # Flushing deletes the anonymous user without sending post_delete
+    clear_anonymous_user_cache()
+
+@receiver(models.signals.post_save, sender=User)
+@receiver(models.signals.post_delete, sender=User)
+def anonymous_user_changed(sender, instance, **kwargs):
+    ''' Forget the cached anonymous user when its row changes '''
+    if is_anonymous_user_id(instance.pk):
+        clear_anonymous_user_cache()
@@ -1,7 +1,14 @@
 from __future__ import absolute_import
 from celery import shared_task
+from django.apps import apps
+from django.core.cache import cache
 from django.core.management import call_command
-from .models import ImportTask
+from django.db import transaction
+from .models import AssetSnapshot, ImportTask
+from .models.object_permission import permission_recalculation_cache_key
+from .utils.asset_snapshot_purge import purge_asset_snapshots as _purge
+from .utils.asset_version_compaction import \
+    compact_asset_versions as _compact
 
 @shared_task
 def update_search_index():
@@ -15,3 +22,43 @@ def import_in_background(import_task_uid):
 @shared_task
 def sync_kobocat_xforms(username=None, quiet=True):
     call_command('sync_kobocat_xforms', username=username, quiet=quiet)
+
+@shared_task
+def recalculate_tree_permissions(app_label, model_name, tree_id):
+    ''' Recalculate the inherited permissions of an entire MPTT tree. Many
+    requests for the same tree are coalesced into one run of this task; see
+    ObjectPermissionMixin._schedule_descendants_recalculation() '''
+    model = apps.get_model(app_label, model_name)
+    # Changes made while we're running need another run to be picked up
+    cache.delete(permission_recalculation_cache_key(model, tree_id))
+    with transaction.atomic():
+        try:
+            root = model.objects.get(tree_id=tree_id, parent=None)
+        except model.DoesNotExist:
+            # The tree has been deleted or merged into another one
+            return
+        root.recalculate_descendants_perms()
+
+@shared_task
+def purge_asset_snapshots():
+    ''' Enforce the asset snapshot expiration policies. Scheduled by
+    settings.CELERYBEAT_SCHEDULE '''
+    return _purge()
+
+@shared_task
+def compact_asset_versions():
+    ''' Collapse old, undeployed asset versions. Scheduled by
+    settings.CELERYBEAT_SCHEDULE when settings.ASSET_VERSION_COMPACTION is
+    enabled '''
+    return _compact()
+
+@shared_task
+def validate_asset_snapshot(snapshot_uid):
+    ''' Finish the deferred validation of a snapshot; see
+    settings.DEFERRED_ASSET_SNAPSHOT_VALIDATION '''
+    try:
+        snapshot = AssetSnapshot.objects.get(uid=snapshot_uid)
+    except AssetSnapshot.DoesNotExist:
+        # Already purged
+        return
+    snapshot.complete_validation()
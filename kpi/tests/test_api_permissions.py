@@ -310,3 +310,63 @@ class ApiPermissionsTestCase(KpiTestCase):
                                                   self.child_collection.uid})
         response= self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ApiBulkPermissionsTestCase(KpiTestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='admin')
+        self.admin_password = 'pass'
+        self.someuser = User.objects.get(username='someuser')
+        self.anotheruser = User.objects.get(username='anotheruser')
+
+        self.login(self.admin.username, self.admin_password)
+        self.admin_asset = self.create_asset('admin_asset')
+        self.admin_collection = self.create_collection('admin_collection')
+        self.add_to_collection(self.admin_asset, self.admin_collection)
+
+    def _bulk_data(self, permissions):
+        return {
+            'content_object': reverse(
+                'collection-detail', args=(self.admin_collection.uid,)),
+            'users': [
+                reverse('user-detail', args=(user.username,))
+                for user in (self.someuser, self.anotheruser)
+            ],
+            'permissions': permissions,
+        }
+
+    def test_bulk_assign_and_remove(self):
+        response = self.client.post(
+            reverse('objectpermission-bulk-assign'),
+            self._bulk_data(['change_collection']),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Granting change implies granting view
+        self.assertEqual(len(response.data), 4)
+        for user in (self.someuser, self.anotheruser):
+            self.assertTrue(user.has_perm('change_asset', self.admin_asset))
+
+        response = self.client.post(
+            reverse('objectpermission-bulk-remove'),
+            self._bulk_data(['view_collection']),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # Revoking view implies revoking change
+        for user in (self.someuser, self.anotheruser):
+            self.assertFalse(user.has_perm('view_asset', self.admin_asset))
+            self.assertFalse(
+                user.has_perm('change_collection', self.admin_collection))
+
+    def test_bulk_assign_requires_share_permission(self):
+        self.client.logout()
+        self.login('someuser', 'someuser')
+        response = self.client.post(
+            reverse('objectpermission-bulk-assign'),
+            self._bulk_data(['view_collection']),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ..models import Asset
+from ..utils.artifact_cache import (
+    SIZE_FILE_NAME,
+    FileSystemArtifactCache,
+    read_artifact,
+    reset_artifact_cache,
+)
+
+
+class ArtifactCacheTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.asset = Asset.objects.create(content={'survey': [
+            {'type': 'text', 'label': 'Question 1', 'name': 'q1'},
+        ]})
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        reset_artifact_cache()
+
+    def _build(self):
+        self.builds += 1
+        return 'artifact {}'.format(self.builds)
+
+    def test_artifacts_are_reused_until_a_new_version(self):
+        with override_settings(EXPORT_ARTIFACT_CACHE_OPTIONS={
+                'directory': self.directory, 'max_size': 1024 * 1024}):
+            reset_artifact_cache()
+            self.assertEqual(
+                read_artifact(self.asset, 'test', self._build), 'artifact 1')
+            self.assertEqual(
+                read_artifact(self.asset, 'test', self._build), 'artifact 1')
+            # Saving without changing the content keeps the artifacts
+            self.asset.save()
+            self.assertEqual(
+                read_artifact(self.asset, 'test', self._build), 'artifact 1')
+            self.asset.content['survey'][0]['label'] = 'Changed'
+            self.asset.save()
+            self.assertEqual(
+                read_artifact(self.asset, 'test', self._build), 'artifact 2')
+        self.assertEqual(self.builds, 2)
+
+    def test_least_recently_used_artifacts_are_evicted(self):
+        cache = FileSystemArtifactCache(self.directory, max_size=20)
+        for version_id in range(3):
+            artifact_file = tempfile.TemporaryFile()
+            artifact_file.write('x' * 10)
+            artifact_file.seek(0)
+            cache.store('a1', version_id, 'test', artifact_file)
+            # Use distinct, old modification times, since file systems may
+            # only record whole seconds
+            os.utime(cache._path('a1', version_id, 'test'),
+                     (version_id, version_id))
+        self.assertIsNone(cache.open('a1', 0, 'test'))
+        with cache.open('a1', 2, 'test') as artifact_file:
+            self.assertEqual(artifact_file.read(), 'x' * 10)
+
+    def test_total_size_is_tracked(self):
+        cache = FileSystemArtifactCache(self.directory, max_size=100)
+        size_path = os.path.join(self.directory, SIZE_FILE_NAME)
+        for version_id in range(2):
+            artifact_file = tempfile.TemporaryFile()
+            artifact_file.write('x' * 10)
+            artifact_file.seek(0)
+            cache.store('a1', version_id, 'test', artifact_file)
+        with open(size_path) as size_file:
+            self.assertEqual(size_file.read(), '20')
+        # Invalidation leaves the total too high until it is recounted
+        cache.invalidate('a1')
+        cache.evict()
+        with open(size_path) as size_file:
+            self.assertEqual(size_file.read(), '0')
@@ -0,0 +1,55 @@
+import copy
+
+from django.test import TestCase
+
+from ..utils.asset_content_analyzer import AssetContentAnalyzer
+
+
+def _summary(survey):
+    return AssetContentAnalyzer(survey=survey).summary
+
+
+class IncrementalSummaryTests(TestCase):
+    def setUp(self):
+        self.survey = [
+            {'type': 'start', 'name': 'start', '$kuid': 'k0'},
+            {'type': 'text', 'name': 'q1', 'label::English': 'Q1',
+             'label': 'Q1', '$kuid': 'k1'},
+            {'type': 'geopoint', 'name': 'q2', 'label': 'Q2', '$kuid': 'k2'},
+            {'type': 'integer', 'name': 'q3', 'label': 'Q3', '$kuid': 'k3'},
+        ]
+        self.summary = _summary(self.survey)
+
+    def _assertMatchesFullSummary(self, survey, previous_rows, changed_rows):
+        summary = AssetContentAnalyzer.update_summary(
+            self.summary, survey, previous_rows, changed_rows)
+        expected = _summary(survey)
+        for key in ('row_count', 'geo', 'labels'):
+            self.assertEqual(summary[key], expected[key])
+        for key in ('languages', 'columns'):
+            self.assertEqual(sorted(summary[key]), sorted(expected[key]))
+
+    def test_edited_row(self):
+        survey = copy.deepcopy(self.survey)
+        survey[3]['label'] = 'Edited'
+        survey[3]['label::French'] = 'Q3'
+        self._assertMatchesFullSummary(
+            survey, {'k3': self.survey[3]}, {'k3': survey[3]})
+
+    def test_added_rows(self):
+        survey = copy.deepcopy(self.survey)
+        added = [
+            {'type': 'text', 'name': 'q%d' % i, 'label': 'Q%d' % i,
+             'hint::English': 'Hint', '$kuid': 'a%d' % i}
+            for i in range(4, 8)
+        ]
+        survey[1:1] = added
+        self._assertMatchesFullSummary(
+            survey, {}, dict((row['$kuid'], row) for row in added))
+
+    def test_removed_geo_row(self):
+        survey = copy.deepcopy(self.survey)
+        removed = survey.pop(2)
+        self._assertMatchesFullSummary(survey, {'k2': removed}, {})
+        self.assertFalse(AssetContentAnalyzer.update_summary(
+            self.summary, survey, {'k2': removed}, {})['geo'])
@@ -1,11 +1,32 @@
+import copy
+import datetime
 import json
+import tempfile
+import threading
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
 
 from .test_api_asset_snapshots import TestAssetSnapshotList
 from ..models import Asset
 from ..models import AssetSnapshot
+from ..models.asset import validate_xform, xform_validation_cache_key
+from ..tasks import validate_asset_snapshot
+from ..utils.instrumentation import get_counters
+from ..utils.xform_compiler import (
+    LOCK_KEY,
+    RESULT_KEY,
+    XFormCompiler,
+    _load_result,
+    _store_result,
+)
+from ..utils.asset_snapshot_purge import (
+    plan_asset_snapshot_purge,
+    purge_asset_snapshots,
+)
 
 
 class AssetSnapshotsTestCase(TestCase):
@@ -41,3 +62,195 @@ class CreateAssetSnapshots(AssetSnapshotsTestCase):
                 source=json.loads(TestAssetSnapshotList.form_source))
         self.assertGreater(len(asset_snapshot.uid), 0)
         self.assertEqual(asset_snapshot_count + 1, AssetSnapshot.objects.count())
+
+    def test_snapshots_with_identical_source_share_xml(self):
+        self.assertEqual(len(self.asset_snapshot.source_hash), 40)
+        # Break the stored XML so that reuse is detectable
+        AssetSnapshot.objects.filter(pk=self.asset_snapshot.pk).update(
+            xml='<cached/>')
+        clone = Asset.objects.create(content=self.asset.content,
+                                     owner=self.user)
+        clone_snapshot = AssetSnapshot.objects.create(asset=clone)
+        self.assertEqual(clone_snapshot.source_hash,
+                         self.asset_snapshot.source_hash)
+        self.assertEqual(clone_snapshot.xml, '<cached/>')
+
+    @override_settings(ASSET_SNAPSHOT_VALIDATION=False)
+    def test_unvalidated_snapshot_skips_filesystem(self):
+        def no_temporary_files(*args, **kwargs):
+            raise AssertionError('A temporary file was created')
+        named_temporary_file = tempfile.NamedTemporaryFile
+        tempfile.NamedTemporaryFile = no_temporary_files
+        try:
+            asset_snapshot = AssetSnapshot.objects.create(
+                source=json.loads(TestAssetSnapshotList.form_source))
+        finally:
+            tempfile.NamedTemporaryFile = named_temporary_file
+        self.assertEqual(asset_snapshot.details['status'], 'success')
+        self.assertFalse(asset_snapshot.details['validated'])
+        self.assertIn('<h:html', asset_snapshot.xml)
+
+    def test_validation_is_cached(self):
+        xml = self.asset_snapshot.xml
+        cache.delete(xform_validation_cache_key(xml))
+        counters = get_counters()
+        misses = counters.get('xform_validation.cache_miss', 0)
+        hits = counters.get('xform_validation.cache_hit', 0)
+        for i in range(2):
+            warnings = []
+            validate_xform(xml, warnings)
+        counters = get_counters()
+        self.assertEqual(counters['xform_validation.cache_miss'], misses + 1)
+        self.assertEqual(counters['xform_validation.cache_hit'], hits + 1)
+
+    def test_deferred_validation(self):
+        with override_settings(ASSET_SNAPSHOT_VALIDATION=False):
+            asset_snapshot = AssetSnapshot.objects.create(
+                source=json.loads(TestAssetSnapshotList.form_source))
+        # Pretend validation was deferred
+        asset_snapshot.details['validation'] = 'pending'
+        AssetSnapshot.objects.filter(pk=asset_snapshot.pk).update(
+            details=asset_snapshot.details)
+        validate_asset_snapshot(asset_snapshot.uid)
+        details = AssetSnapshot.objects.get(pk=asset_snapshot.pk).details
+        self.assertNotIn('validation', details)
+        self.assertTrue(details['validated'])
+        self.assertEqual(details['status'], 'success')
+
+
+class AssetExportTests(AssetSnapshotsTestCase):
+
+    def test_get_export_reuses_snapshot(self):
+        export = self.asset.get_export()
+        self.assertEqual(export.asset_version_id, self.asset.version_id)
+        snapshot_count = AssetSnapshot.objects.count()
+        self.assertEqual(self.asset.get_export().pk, export.pk)
+        self.assertEqual(AssetSnapshot.objects.count(), snapshot_count)
+
+    def test_get_export_regenerate(self):
+        export = self.asset.get_export()
+        regenerated = self.asset.get_export(regenerate=True)
+        self.assertNotEqual(regenerated.pk, export.pk)
+        self.assertFalse(AssetSnapshot.objects.filter(pk=export.pk).exists())
+        self.assertTrue(regenerated.xml)
+
+    def test_get_export_follows_form_title(self):
+        export = self.asset.get_export()
+        self.asset.name = 'A new title'
+        self.asset.save()
+        renamed_export = self.asset.get_export()
+        self.assertNotEqual(renamed_export.pk, export.pk)
+        self.assertIn('A new title', renamed_export.xml)
+
+
+class PurgeAssetSnapshots(AssetSnapshotsTestCase):
+
+    def _create_preview(self, hours_old):
+        snapshot = AssetSnapshot.objects.create(
+            source=json.loads(TestAssetSnapshotList.form_source))
+        AssetSnapshot.objects.filter(pk=snapshot.pk).update(
+            date_created=timezone.now() - datetime.timedelta(hours=hours_old))
+        return snapshot
+
+    @override_settings(KOBO_SURVEY_PREVIEW_EXPIRATION=24,
+                       ASSET_SNAPSHOT_KEEP_LATEST=2,
+                       ASSET_SNAPSHOT_MAX_COUNT=0)
+    def test_purge_policies(self):
+        old_preview = self._create_preview(hours_old=25)
+        new_preview = self._create_preview(hours_old=1)
+        versioned = [self.asset_snapshot] + [
+            AssetSnapshot.objects.create(asset=self.asset) for i in range(2)]
+        plan = plan_asset_snapshot_purge()
+        self.assertEqual(plan['expired_previews'], [old_preview.pk])
+        self.assertEqual(plan['superseded_versions'], [versioned[0].pk])
+        self.assertEqual(plan['least_recently_used'], [])
+        deleted = purge_asset_snapshots()
+        self.assertEqual(deleted['expired_previews'], 1)
+        self.assertEqual(deleted['superseded_versions'], 1)
+        self.assertEqual(
+            set(AssetSnapshot.objects.values_list('pk', flat=True)),
+            set([new_preview.pk, versioned[1].pk, versioned[2].pk])
+        )
+
+    @override_settings(ASSET_SNAPSHOT_KEEP_LATEST=0,
+                       ASSET_SNAPSHOT_MAX_COUNT=2)
+    def test_purge_least_recently_used_in_batches(self):
+        snapshots = [self.asset_snapshot] + [
+            AssetSnapshot.objects.create(asset=self.asset) for i in range(3)]
+        AssetSnapshot.objects.filter(pk=snapshots[0].pk).update(
+            date_accessed=timezone.now() + datetime.timedelta(hours=1))
+        self.assertEqual(plan_asset_snapshot_purge()['least_recently_used'],
+                         [snapshots[1].pk, snapshots[2].pk])
+        deleted = purge_asset_snapshots(batch_size=1, max_batches=1)
+        self.assertEqual(deleted['least_recently_used'], 1)
+        self.assertFalse(
+            AssetSnapshot.objects.filter(pk=snapshots[1].pk).exists())
+        self.assertEqual(AssetSnapshot.objects.count(), 3)
+
+
+class XFormCompilerTests(TestCase):
+    source = {
+        'survey': [{'type': 'text', 'name': 'q1', 'label': 'Question 1'}],
+        'settings': [{'id_string': 'compiled', 'form_title': 'Compiled'}],
+    }
+    args = (None, u'default', u'xform_id_string')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_pool_matches_inline(self):
+        inline_xml, inline_warnings = XFormCompiler(processes=0).compile(
+            None, copy.deepcopy(self.source), *self.args)
+        self.assertIn('<h:title>Compiled</h:title>', inline_xml)
+        # Nothing listens at this address, so the compiler uses its own pool
+        compiler = XFormCompiler(
+            processes=1, address=tempfile.mktemp(suffix='.sock'))
+        try:
+            pool_xml, pool_warnings = compiler.compile(
+                'key', copy.deepcopy(self.source), *self.args)
+        finally:
+            compiler.close()
+        self.assertEqual(pool_xml, inline_xml)
+        self.assertEqual(pool_warnings, inline_warnings)
+        # The lock was released
+        self.assertIsNone(cache.get(LOCK_KEY.format('key')))
+
+    def test_concurrent_requests_share_compilation(self):
+        compiler = XFormCompiler(processes=0)
+        # Pretend another process is compiling the same source
+        cache.add(LOCK_KEY.format('key'), True)
+        deduplicated = get_counters().get('xform_compiler.deduplicated', 0)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            compiler.compile('key', self.source, *self.args)))
+        waiter.start()
+        _store_result(RESULT_KEY.format('key'), (u'<shared/>', ['warning']))
+        waiter.join()
+        self.assertEqual(results, [(u'<shared/>', ['warning'])])
+        self.assertEqual(get_counters()['xform_compiler.deduplicated'],
+                         deduplicated + 1)
+
+    def test_failure_is_shared(self):
+        compiler = XFormCompiler(processes=0)
+        broken_source = {'survey': [{'type': 'no such type', 'name': 'q1'}]}
+        with self.assertRaises(Exception) as context:
+            compiler.compile('broken', broken_source, *self.args)
+        error_class = context.exception.__class__
+        # Another process waiting for the same compilation raises the same
+        # error instead of compiling again
+        cache.add(LOCK_KEY.format('broken'), True)
+        compilations = get_counters()['xform_compiler.compilations']
+        with self.assertRaises(error_class):
+            compiler.compile('broken', broken_source, *self.args)
+        self.assertEqual(get_counters()['xform_compiler.compilations'],
+                         compilations)
+
+    def test_large_result_is_chunked(self):
+        xml = u'<h:html>{}</h:html>'.format(u'\u00e9' * 1000)
+        result_key = RESULT_KEY.format('large')
+        _store_result(result_key, (xml, []), chunk_size=100)
+        self.assertEqual(cache.get(result_key)[1], 21)
+        self.assertEqual(_load_result(result_key), (xml, []))
+        # A missing piece means there is no result
+        cache.delete('{}:{}'.format(result_key, 3))
+        self.assertIsNone(_load_result(result_key))
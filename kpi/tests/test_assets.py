@@ -1,12 +1,21 @@
+import copy
+import datetime
 import re
 
 from django.contrib.auth.models import User, AnonymousUser
 from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from reversion import revisions as reversion
 
 from kpi.models import Asset
 from kpi.models import Collection
+from kpi.models.asset_version import DELTA_MARKER, rewrite_versions
 from kpi.models.object_permission import get_all_objects_for_user
+from kpi.utils.asset_content_analyzer import AssetContentAnalyzer
+from kpi.utils.asset_summaries import summarize_asset_chunk
+from kpi.utils.asset_version_compaction import compact_asset_versions
 
 
 class AssetsTestCase(TestCase):
@@ -29,6 +38,118 @@ class CreateAssetVersions(AssetsTestCase):
         self.asset.save()
         self.assertEqual(len(self.asset.versions()), 2)
 
+    def test_current_version_id_follows_new_versions(self):
+        first_version_id = self.asset.versions().first().pk
+        self.assertEqual(self.asset.current_version_id, first_version_id)
+        self.asset.content['survey'][0]['type'] = 'integer'
+        self.asset.save()
+        latest_version_id = self.asset.versions().first().pk
+        self.assertNotEqual(latest_version_id, first_version_id)
+        self.assertEqual(self.asset.current_version_id, latest_version_id)
+        asset = Asset.objects.get(pk=self.asset.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(asset.version_id, latest_version_id)
+
+    def test_only_content_changes_create_versions(self):
+        self.asset.name = 'Renamed'
+        self.asset.save()
+        self.assertEqual(self.asset.versions().count(), 1)
+        self.asset.content['survey'][0]['type'] = 'integer'
+        self.asset.save()
+        self.asset.save()
+        self.assertEqual(self.asset.versions().count(), 2)
+        asset = Asset.objects.get(pk=self.asset.pk)
+        asset.save()
+        self.assertEqual(asset.versions().count(), 2)
+
+    def test_unchanged_content_is_not_normalized_again(self):
+        self.assertTrue(self.asset._content_is_normalized())
+        self.asset.content['survey'].append({'name': 'no_type'})
+        self.assertFalse(self.asset._content_is_normalized())
+        self.asset.save()
+        # The row without a type is dropped, which leaves the content as it
+        # was, so there is no new version
+        self.assertEqual(len(self.asset.content['survey']), 2)
+        self.assertEqual(self.asset.versions().count(), 1)
+        self.assertTrue(self.asset._content_is_normalized())
+
+    def test_content_saved_before_hashing_is_normalized(self):
+        # As left by older code: no `$kuid`s, summary or content hash
+        Asset.objects.filter(pk=self.asset.pk).update(content={'survey': [
+            {'type': 'text', 'label': 'Question 1', 'name': 'q1'},
+            {'type': 'integer', 'label': 'Question 2', 'name': 'q2'},
+        ]}, summary={}, content_hash='')
+        asset = Asset.objects.get(pk=self.asset.pk)
+        self.assertFalse(asset._content_is_normalized())
+        asset.save()
+        self.assertTrue(
+            all('$kuid' in row for row in asset.content['survey']))
+        self.assertEqual(asset.summary['row_count'], 2)
+        # Assigning `$kuid`s changed the content
+        self.assertEqual(asset.versions().count(), 2)
+        asset = Asset.objects.get(pk=asset.pk)
+        self.assertTrue(asset._content_is_normalized())
+
+    def test_content_without_hash_keeps_its_version_if_unchanged(self):
+        Asset.objects.filter(pk=self.asset.pk).update(content_hash='')
+        asset = Asset.objects.get(pk=self.asset.pk)
+        asset.save()
+        self.assertEqual(asset.content_hash, self.asset.content_hash)
+        self.assertEqual(asset.versions().count(), 1)
+
+    def test_instantiation_does_not_load_content(self):
+        with self.assertNumQueries(1):
+            asset = Asset.objects.only('pk', 'uid').get(pk=self.asset.pk)
+        self.assertIn('content', asset.get_deferred_fields())
+
+    @override_settings(ASSET_VERSION_DELTA_STORAGE=True,
+                       ASSET_VERSION_KEYFRAME_INTERVAL=3)
+    def test_versions_stored_as_deltas_are_reconstructed(self):
+        asset = Asset.objects.create(owner=self.user, content={'survey': [
+            {'type': 'text', 'label': 'Question %d' % i, 'name': 'q%d' % i}
+            for i in range(20)
+        ]})
+        expected_contents = [copy.deepcopy(asset.content)]
+        for i in range(4):
+            asset.content['survey'][i]['label'] = 'Edited'
+            asset.save()
+            expected_contents.append(copy.deepcopy(asset.content))
+        versions = list(asset.versions().order_by('pk'))
+        self.assertEqual([version.is_keyframe for version in versions],
+                         [True, False, False, True, False])
+        self.assertEqual(
+            [version.object_version.object.content for version in versions],
+            expected_contents
+        )
+        # Converting back to complete versions changes nothing visible
+        rewrite_versions(asset.versions(), keyframe_interval=1)
+        versions = list(asset.versions().order_by('pk'))
+        self.assertTrue(all(version.is_keyframe for version in versions))
+        self.assertEqual(
+            [version.object_version.object.content for version in versions],
+            expected_contents
+        )
+
+    @override_settings(ASSET_VERSION_DELTA_STORAGE=True,
+                       ASSET_VERSION_KEYFRAME_INTERVAL=3)
+    def test_reverting_a_delta_through_reversion_restores_content(self):
+        asset = Asset.objects.create(owner=self.user, content={'survey': [
+            {'type': 'text', 'label': 'Question %d' % i, 'name': 'q%d' % i}
+            for i in range(20)
+        ]})
+        asset.content['survey'][0]['label'] = 'Edited'
+        asset.save()
+        edited_content = copy.deepcopy(asset.content)
+        asset.content['survey'][1]['label'] = 'Edited again'
+        asset.save()
+        # Plain reversion Versions, not AssetVersions
+        delta_version = reversion.get_for_object(asset)[1]
+        self.assertIn(DELTA_MARKER, delta_version.serialized_data)
+        self.assertEqual(delta_version.field_dict['content'], edited_content)
+        delta_version.revert()
+        asset = Asset.objects.get(pk=asset.pk)
+        self.assertEqual(asset.content, edited_content)
+
     def test_asset_can_be_owned(self):
         self.assertEqual(self.asset.owner, self.user)
 
@@ -49,6 +170,104 @@ class CreateAssetVersions(AssetsTestCase):
         self.assertEqual(anon_asset.owner, None)
 
 
+class CompactAssetVersions(AssetsTestCase):
+    def _edit(self, label):
+        self.asset.content['survey'][0]['label'] = label
+        self.asset.save()
+        return self.asset.version_id
+
+    def test_runs_of_undeployed_versions_are_collapsed(self):
+        first = self.asset.version_id
+        second = self._edit('Second')
+        deployed = self._edit('Deployed')
+        self.asset.connect_deployment(backend='mock')
+        fourth = self._edit('Fourth')
+        fifth = self._edit('Fifth')
+        current = self._edit('Current')
+        # Nothing is old enough yet
+        stats = compact_asset_versions()
+        self.assertEqual(stats['versions_removed'], 0)
+        version_count = self.asset.versions().count()
+        stats = compact_asset_versions(
+            min_age=datetime.timedelta(0),
+            now=timezone.now() + datetime.timedelta(days=1)
+        )
+        self.assertEqual(stats['versions_removed'], version_count - 4)
+        self.assertGreater(stats['characters_reclaimed'], 0)
+        self.assertEqual(
+            list(self.asset.versions().order_by('pk').values_list(
+                'pk', flat=True)),
+            [second, deployed, fifth, current]
+        )
+        self.assertEqual(self.asset.version_id, current)
+
+    def test_deltas_survive_removal_of_their_keyframe(self):
+        self.asset.content['survey'].extend([
+            {'type': 'text', 'label': 'Question %d' % i, 'name': 'q%d' % i}
+            for i in range(3, 20)
+        ])
+        keyframe = self._edit('Keyframe')
+        with self.settings(ASSET_VERSION_DELTA_STORAGE=True,
+                           ASSET_VERSION_KEYFRAME_INTERVAL=10):
+            delta = self._edit('Delta')
+            self._edit('Current')
+        self.assertFalse(self.asset.versions().get(pk=delta).is_keyframe)
+        compact_asset_versions(
+            min_age=datetime.timedelta(0),
+            now=timezone.now() + datetime.timedelta(days=1)
+        )
+        self.assertFalse(self.asset.versions().filter(pk=keyframe).exists())
+        version = self.asset.versions().get(pk=delta)
+        self.assertTrue(version.is_keyframe)
+        self.assertEqual(
+            version.object_version.object.content['survey'][0]['label'],
+            'Delta'
+        )
+
+
+class SummarizeAssets(AssetsTestCase):
+    def test_saving_updates_summary_from_changed_rows(self):
+        asset = Asset.objects.get(pk=self.asset.pk)
+        asset.content['survey'][0]['label'] = 'Edited'
+        asset.content['survey'].append(
+            {'type': 'geopoint', 'label::French': 'Lieu', 'name': 'q3'})
+        asset.save()
+        expected = AssetContentAnalyzer(survey=asset.content['survey']).summary
+        for key in ('row_count', 'geo', 'labels'):
+            self.assertEqual(asset.summary[key], expected[key])
+        for key in ('languages', 'columns'):
+            self.assertEqual(sorted(asset.summary[key]), sorted(expected[key]))
+        # The stored summary is updated rather than recomputed, as shown by
+        # an error planted in it surviving the next change
+        planted_summary = dict(asset.summary, row_count=100)
+        Asset.objects.filter(pk=asset.pk).update(summary=planted_summary)
+        asset = Asset.objects.get(pk=asset.pk)
+        asset.content['survey'][1]['label'] = 'Edited'
+        asset.save()
+        self.assertEqual(asset.summary['row_count'], 100)
+
+    def test_only_stale_summaries_are_written(self):
+        summary = self.asset.summary
+        version_count = self.asset.versions().count()
+        date_modified = self.asset.date_modified
+        Asset.objects.filter(pk=self.asset.pk).update(summary={})
+        self.assertEqual(
+            summarize_asset_chunk(self.asset.pk, self.asset.pk, dry_run=True),
+            (1, 1)
+        )
+        self.assertEqual(Asset.objects.get(pk=self.asset.pk).summary, {})
+        self.assertEqual(
+            summarize_asset_chunk(self.asset.pk, self.asset.pk), (1, 1))
+        asset = Asset.objects.get(pk=self.asset.pk)
+        self.assertEqual(asset.summary['row_count'], summary['row_count'])
+        self.assertEqual(
+            sorted(asset.summary['columns']), sorted(summary['columns']))
+        self.assertEqual(asset.date_modified, date_modified)
+        self.assertEqual(asset.versions().count(), version_count)
+        self.assertEqual(
+            summarize_asset_chunk(self.asset.pk, self.asset.pk), (1, 0))
+
+
 class AssetContentTests(AssetsTestCase):
     def _wrap_field(self, field_name, value):
         return {'survey': [
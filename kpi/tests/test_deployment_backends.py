@@ -1,7 +1,11 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import datetime
+
 from django.test import TestCase
+from django.utils import timezone
+from kpi.deployment_backends.mock_backend import MockDeploymentBackend
 from kpi.models.asset import Asset
 
 class CreateDeployment(TestCase):
@@ -48,3 +52,25 @@ class MockDeployment(TestCase):
 
         self.asset.deployment.set_active(False)
         self.assertEqual(self.asset._deployment_data['active'], False)
+
+    def test_deployment_events_are_recorded(self):
+        events = self.asset.deployment_events.all()
+        self.assertEqual(events.count(), 1)
+        self.assertEqual(events[0].backend, 'mock')
+        self.assertEqual(events[0].version_id, self.asset.version_id)
+        self.assertEqual(events[0].active, False)
+        self.asset.deployment.set_active(True)
+        self.assertEqual(events.count(), 2)
+        self.assertEqual(events.last().active, True)
+        # Nothing changed, so nothing is recorded
+        self.asset.deployment.set_active(True)
+        self.assertEqual(events.count(), 2)
+
+    def test_event_timestamp_comes_from_backend(self):
+        class TimestampedDeploymentBackend(MockDeploymentBackend):
+            timestamp = '2016-03-01T12:30:00Z'
+        TimestampedDeploymentBackend(self.asset).set_active(True)
+        self.assertEqual(
+            self.asset.deployment_events.last().timestamp,
+            datetime.datetime(2016, 3, 1, 12, 30, tzinfo=timezone.utc)
+        )
@@ -0,0 +1,14 @@
+from django.test import TestCase
+
+from ..utils.export_benchmark import ExportBenchmark
+
+
+class ExportBenchmarkTestCase(TestCase):
+    def test_benchmark_runs(self):
+        results = ExportBenchmark(
+            rows=6, languages=2, choices=2, repeat=1, measure_memory=False
+        ).run()
+        self.assertEqual(list(results['results'].keys()), ['xls', 'xlsx'])
+        for result in results['results'].values():
+            self.assertGreater(result['bytes'], 0)
+            self.assertGreaterEqual(result['min_seconds'], 0)
@@ -0,0 +1,22 @@
+from django.test import TestCase
+
+from ..utils.permission_benchmark import PermissionBenchmark
+
+
+class PermissionBenchmarkTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def test_benchmark_runs(self):
+        results = PermissionBenchmark(
+            depth=2, fan_out=2, assets_per_collection=1, collaborators=2,
+            deny_rules=1, repeat=1
+        ).run()
+        self.assertEqual(results['tree']['collections'], 3)
+        self.assertEqual(results['tree']['assets'], 3)
+        self.assertEqual(set(results['results'].keys()), set([
+            'assign_perm', 'remove_perm', 'recalculate_descendants_perms',
+            'get_objects_for_user', 'KpiObjectPermissionsFilter',
+        ]))
+        for timing in results['results'].values():
+            self.assertGreater(timing['queries'], 0)
+            self.assertGreaterEqual(timing['min_seconds'], 0)
@@ -1,11 +1,29 @@
-from django.contrib.auth.models import Permission
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Permission
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings, CaptureQueriesContext
 
 from ..models.asset import Asset
 from ..models.collection import Collection
 from ..models.object_permission import get_all_objects_for_user
+from ..models.object_permission import get_objects_for_user
+from ..models.object_permission import UserObjectAccess, ACCESS_BITS
+from ..models.object_permission import ObjectPermission
+from ..models.object_permission import get_anonymous_user
+from ..models.object_permission import get_database_user_id
+from ..models.object_permission import clear_anonymous_user_cache
+from ..models.object_permission import is_anonymous_user_id
+from ..models.object_permission import permission_recalculation_cache_key
+from ..tasks import recalculate_tree_permissions
+from ..utils.commit_hooks import activate_commit_hooks
+from ..utils.commit_hooks import deactivate_commit_hooks
+from ..utils.instrumentation import get_counters
+from ..utils.permission_cache import activate_permission_cache
+from ..utils.permission_cache import deactivate_permission_cache
 
 
 class BasePermissionsTestCase(TestCase):
@@ -190,3 +208,247 @@ class PermissionsTestCase(BasePermissionsTestCase):
         self.assertIn(self.admin_collection, admin_collections)
         self.assertNotIn(self.admin_asset, someuser_assets)
         self.assertNotIn(self.admin_collection, someuser_collections)
+
+    def test_access_index_follows_inherited_permissions(self):
+        self.admin_collection.assets.add(self.admin_asset)
+        view_asset = self._get_perm_name('view_', self.admin_asset)
+        change_asset = self._get_perm_name('change_', self.admin_asset)
+        self.assertNotIn(self.admin_asset, get_objects_for_user(
+            self.someuser, view_asset))
+        self.admin_collection.assign_perm(self.someuser, 'change_collection')
+        access = UserObjectAccess.objects.get_for_object(
+            self.admin_asset, user=self.someuser)
+        self.assertEqual(
+            access.permissions, ACCESS_BITS['view'] | ACCESS_BITS['change'])
+        self.assertIn(self.admin_asset, get_objects_for_user(
+            self.someuser, [view_asset, change_asset]))
+        # Denying view on the asset itself also denies change
+        self.admin_asset.remove_perm(self.someuser, 'view_asset')
+        self.assertFalse(UserObjectAccess.objects.filter_for_object(
+            self.admin_asset, user=self.someuser).exists())
+        self.assertNotIn(self.admin_asset, get_objects_for_user(
+            self.someuser, view_asset))
+        self.assertIn(self.admin_collection, get_objects_for_user(
+            self.someuser, 'view_collection', Collection))
+
+    def _snapshot_inherited_perms(self):
+        perms = set(ObjectPermission.objects.filter(
+            inherited=True).values_list(
+                'content_type_id', 'object_id', 'user_id', 'permission_id',
+                'deny'
+            )
+        )
+        access = set(UserObjectAccess.objects.values_list(
+            'content_type_id', 'object_id', 'user_id', 'permissions'))
+        return perms, access
+
+    def test_set_based_recalculation_matches_python(self):
+        anotheruser = User.objects.get(username='anotheruser')
+        child_collection = Collection.objects.create(
+            owner=self.someuser, parent=self.admin_collection)
+        grandchild_collection = Collection.objects.create(
+            owner=self.admin, parent=child_collection)
+        grandchild_collection.assets.add(self.admin_asset)
+        child_collection.assets.create(content={}, owner=anotheruser)
+        self.admin_collection.assign_perm(anotheruser, 'change_collection')
+        self.admin_collection.assign_perm(
+            get_anonymous_user(), 'view_collection')
+        child_collection.remove_perm(anotheruser, 'change_collection')
+
+        with override_settings(SET_BASED_PERMISSION_RECALCULATION=False):
+            Collection.objects.get(
+                pk=self.admin_collection.pk).recalculate_descendants_perms()
+        expected = self._snapshot_inherited_perms()
+        ObjectPermission.objects.filter(inherited=True).delete()
+        UserObjectAccess.objects.all().delete()
+        with override_settings(SET_BASED_PERMISSION_RECALCULATION=True):
+            root = Collection.objects.get(pk=self.admin_collection.pk)
+            root._recalculate_inherited_perms()
+            root.recalculate_descendants_perms()
+        self.assertEqual(self._snapshot_inherited_perms(), expected)
+
+    def test_recalculation_only_writes_changes(self):
+        child_collection = Collection.objects.create(
+            owner=self.admin, parent=self.admin_collection)
+        child_collection.assets.add(self.admin_asset)
+        self.admin_collection.assign_perm(self.someuser, 'view_collection')
+        for set_based in (False, True):
+            with override_settings(
+                    SET_BASED_PERMISSION_RECALCULATION=set_based):
+                root = Collection.objects.get(pk=self.admin_collection.pk)
+                uids = set(ObjectPermission.objects.filter(
+                    inherited=True).values_list('uid', flat=True))
+                stats = root.recalculate_descendants_perms()
+                self.assertEqual(stats['inserted'], 0)
+                self.assertEqual(stats['deleted'], 0)
+                self.assertGreater(stats['kept'], 0)
+                self.assertEqual(set(ObjectPermission.objects.filter(
+                    inherited=True).values_list('uid', flat=True)), uids)
+                # Removing a permission deletes only the stale rows
+                root.remove_perm(self.someuser, 'view_collection')
+                self.assertFalse(self.someuser.has_perm(
+                    'view_asset', self.admin_asset))
+                self.assertTrue(uids.issuperset(ObjectPermission.objects.filter(
+                    inherited=True).values_list('uid', flat=True)))
+                root.assign_perm(self.someuser, 'view_collection')
+                self.assertTrue(self.someuser.has_perm(
+                    'view_asset', self.admin_asset))
+
+    def test_permission_cache(self):
+        self.admin_collection.assets.add(self.admin_asset)
+        permission_cache = activate_permission_cache()
+        try:
+            permission_cache.prime(
+                [self.admin_collection, self.admin_asset], self.someuser)
+            with self.assertNumQueries(0):
+                self.assertFalse(
+                    self.someuser.has_perm('view_asset', self.admin_asset))
+                self.assertTrue(
+                    self.admin.has_perm('delete_asset', self.admin_asset))
+            # Changing permissions must not leave stale answers behind
+            self.admin_collection.assign_perm(
+                get_anonymous_user(), 'view_collection')
+            self.assertTrue(
+                self.someuser.has_perm('view_asset', self.admin_asset))
+            self.assertFalse(
+                self.someuser.has_perm('change_asset', self.admin_asset))
+            self.admin_collection.assign_perm(
+                self.someuser, 'change_collection')
+            for perm in ('view_asset', 'change_asset', 'share_asset',
+                         'delete_asset'):
+                self.assertEqual(
+                    self.someuser.has_perm(perm, self.admin_asset),
+                    self.admin_asset.has_perm(self.someuser, perm)
+                )
+        finally:
+            deactivate_permission_cache()
+
+    def test_recalculation_issues_no_metadata_queries(self):
+        child_collection = Collection.objects.create(
+            owner=self.someuser, parent=self.admin_collection)
+        child_collection.assets.add(self.admin_asset)
+        self.admin_collection.assign_perm(self.someuser, 'view_collection')
+        root = Collection.objects.get(pk=self.admin_collection.pk)
+        with CaptureQueriesContext(connection) as context:
+            root._recalculate_inherited_perms()
+            root.recalculate_descendants_perms()
+        for query in context.captured_queries:
+            self.assertNotIn('auth_permission', query['sql'])
+            self.assertNotIn('django_content_type', query['sql'])
+
+    def test_permission_checks_issue_no_metadata_queries(self):
+        self.admin_asset.assign_perm(self.someuser, 'change_asset')
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(
+                self.admin_asset.has_perm(self.someuser, 'change_asset'))
+            self.admin_asset.remove_perm(self.someuser, 'change_asset')
+            self.assertFalse(
+                self.admin_asset.has_perm(self.someuser, 'change_asset'))
+        for query in context.captured_queries:
+            self.assertNotIn('auth_permission', query['sql'])
+            self.assertNotIn('django_content_type', query['sql'])
+
+    def test_async_recalculation_is_coalesced(self):
+        child_collection = Collection.objects.create(
+            owner=self.admin, parent=self.admin_collection)
+        child_collection.assets.add(self.admin_asset)
+        cache_key = permission_recalculation_cache_key(
+            Collection, self.admin_collection.tree_id)
+        with override_settings(ASYNC_PERMISSION_RECALCULATION=True,
+                               CELERY_ALWAYS_EAGER=False):
+            # Pretend a recalculation of this tree is already waiting
+            cache.set(cache_key, True)
+            # Hold the tasks as CommitHookMiddleware would during a request
+            activate_commit_hooks()
+            try:
+                self.admin_collection.assign_perm(
+                    self.someuser, 'view_collection')
+                self.admin_collection.assign_perm(
+                    self.someuser, 'change_collection')
+                self.assertTrue(self.someuser.has_perm(
+                    'change_collection', self.admin_collection))
+                self.assertFalse(self.someuser.has_perm(
+                    'view_asset', self.admin_asset))
+            finally:
+                deactivate_commit_hooks()
+            self.assertTrue(cache.get(cache_key))
+            recalculate_tree_permissions(
+                'kpi', 'collection', self.admin_collection.tree_id)
+        self.assertIsNone(cache.get(cache_key))
+        self.assertTrue(self.someuser.has_perm(
+            'change_collection', child_collection))
+        self.assertTrue(self.someuser.has_perm(
+            'change_asset', self.admin_asset))
+
+    def test_async_recalculation_runs_synchronously_outside_requests(self):
+        self.admin_collection.assets.add(self.admin_asset)
+        with override_settings(ASYNC_PERMISSION_RECALCULATION=True,
+                               CELERY_ALWAYS_EAGER=False):
+            # Nothing would send the task once the test's transaction
+            # commits
+            self.admin_collection.assign_perm(
+                self.someuser, 'view_collection')
+            self.assertTrue(self.someuser.has_perm(
+                'view_asset', self.admin_asset))
+
+    def test_async_recalculation_runs_synchronously_when_eager(self):
+        self.admin_collection.assets.add(self.admin_asset)
+        with override_settings(ASYNC_PERMISSION_RECALCULATION=True,
+                               CELERY_ALWAYS_EAGER=True):
+            self.admin_collection.assign_perm(
+                self.someuser, 'view_collection')
+            self.assertTrue(self.someuser.has_perm(
+                'view_asset', self.admin_asset))
+
+    def test_trivial_saves_skip_recalculation(self):
+        self.admin_collection.assign_perm(self.someuser, 'view_collection')
+        skipped = get_counters().get('permission_recalculation.skipped', 0)
+        self.admin_asset.content['survey'][0]['label'] = 'Renamed question'
+        with CaptureQueriesContext(connection) as context:
+            self.admin_asset.save()
+        for query in context.captured_queries:
+            self.assertNotIn('kpi_objectpermission', query['sql'])
+        self.assertEqual(
+            get_counters()['permission_recalculation.skipped'], skipped + 1)
+        self.assertFalse(
+            self.someuser.has_perm('view_asset', self.admin_asset))
+        # Moving the asset into a shared collection is not trivial
+        self.admin_asset.parent = self.admin_collection
+        self.admin_asset.save()
+        self.assertTrue(
+            self.someuser.has_perm('view_asset', self.admin_asset))
+        self.assertEqual(
+            get_counters()['permission_recalculation.skipped'], skipped + 1)
+
+
+class AnonymousUserCacheTestCase(TransactionTestCase):
+    ''' The anonymous user is only cached outside of transactions, which
+    TestCase always uses '''
+    def setUp(self):
+        clear_anonymous_user_cache()
+
+    def test_anonymous_user_is_cached(self):
+        anonymous_user = get_anonymous_user()
+        self.assertTrue(is_anonymous_user_id(anonymous_user.pk))
+        anonymous_user.first_name = 'Modified'
+        with self.assertNumQueries(0):
+            cached_user = get_anonymous_user()
+        self.assertEqual(cached_user.pk, anonymous_user.pk)
+        self.assertEqual(cached_user.username, anonymous_user.username)
+        self.assertNotEqual(cached_user.first_name, 'Modified')
+        self.assertIsNot(cached_user, anonymous_user)
+
+    def test_deleting_anonymous_user_clears_cache(self):
+        get_anonymous_user().delete()
+        self.assertFalse(User.objects.filter(
+            pk=settings.ANONYMOUS_USER_ID).exists())
+        get_anonymous_user()
+        self.assertTrue(User.objects.filter(
+            pk=settings.ANONYMOUS_USER_ID).exists())
+
+    def test_database_user_id_needs_no_query(self):
+        user = User.objects.create(username='someone')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_database_user_id(AnonymousUser()),
+                             settings.ANONYMOUS_USER_ID)
+            self.assertEqual(get_database_user_id(user), user.pk)
@@ -0,0 +1,14 @@
+from django.test import TestCase
+
+from ..utils.save_benchmark import SaveBenchmark
+
+
+class SaveBenchmarkTestCase(TestCase):
+    def test_benchmark_runs(self):
+        results = SaveBenchmark(
+            rows=6, languages=2, choices=2, repeat=2).run()['results']
+        self.assertEqual(list(results.keys()), [
+            'create', 'save_unchanged', 'reload_and_save', 'edit_one_row'])
+        self.assertEqual(results['save_unchanged']['versions_created'], 0)
+        self.assertEqual(results['reload_and_save']['versions_created'], 0)
+        self.assertEqual(results['edit_one_row']['versions_created'], 2)
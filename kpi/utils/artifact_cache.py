@@ -0,0 +1,248 @@
+'''
+A cache of exported files, e.g. XLS downloads, keyed by asset uid, version
+id, and format. Exports depend only on the content of an asset, so a new
+version makes the old artifacts useless; `Asset.save()` invalidates them.
+The backend is chosen by settings.EXPORT_ARTIFACT_CACHE_BACKEND.
+'''
+
+import contextlib
+import fcntl
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .instrumentation import increment_counter
+
+TEMPORARY_FILE_PREFIX = '.tmp'
+# Holds the running total size of the cached artifacts
+SIZE_FILE_NAME = '.size'
+# Eviction frees this fraction of `max_size` beyond what is necessary, so
+# that it isn't needed again by the next few stores
+EVICTION_HEADROOM = 0.1
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+class BaseArtifactCache(object):
+    def open(self, uid, version_id, format_name):
+        ''' Return a file open for reading, or None if nothing is cached '''
+        raise NotImplementedError()
+
+    def store(self, uid, version_id, format_name, artifact_file):
+        ''' Save the rest of `artifact_file`, which is left at its end '''
+        raise NotImplementedError()
+
+    def invalidate(self, uid):
+        ''' Forget every artifact of the asset '''
+        raise NotImplementedError()
+
+
+class DummyArtifactCache(BaseArtifactCache):
+    ''' Never caches anything '''
+    def __init__(self, **options):
+        pass
+
+    def open(self, uid, version_id, format_name):
+        return None
+
+    def store(self, uid, version_id, format_name, artifact_file):
+        pass
+
+    def invalidate(self, uid):
+        pass
+
+
+class FileSystemArtifactCache(BaseArtifactCache):
+    ''' Stores each artifact as `<directory>/<uid>/<version id>.<format>`.
+    When the files add up to more than `max_size` bytes, the least recently
+    used are deleted; reading a file marks it as used by touching it. The
+    total size is kept in `<directory>/.size`, so storing an artifact only
+    looks at every file when something has to be evicted. Invalidation
+    doesn't update the total, which therefore errs on the high side until
+    the next eviction recounts it '''
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _path(self, uid, version_id=None, format_name=None):
+        # Asset uids are generated by KpiUidField and safe as file names
+        path = os.path.join(self.directory, uid)
+        if version_id is None:
+            return path
+        return os.path.join(path, u'{}.{}'.format(version_id, format_name))
+
+    def open(self, uid, version_id, format_name):
+        path = self._path(uid, version_id, format_name)
+        try:
+            artifact_file = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted since being opened, which doesn't affect reading
+            pass
+        return artifact_file
+
+    def store(self, uid, version_id, format_name, artifact_file):
+        directory = self._path(uid)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        # Write to a temporary file and rename it so that readers never see
+        # a partial artifact
+        path = self._path(uid, version_id, format_name)
+        descriptor, temporary_path = tempfile.mkstemp(
+            prefix=TEMPORARY_FILE_PREFIX, dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                shutil.copyfileobj(artifact_file, temporary_file)
+                size = temporary_file.tell()
+            os.rename(temporary_path, path)
+        except (IOError, OSError):
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        with self._locked_size_file() as size_file:
+            total_size = self._read_total_size(size_file)
+            if total_size is not None:
+                total_size += size
+                if total_size <= self.max_size:
+                    self._write_total_size(size_file, total_size)
+                    return
+            self._evict(size_file)
+
+    def invalidate(self, uid):
+        shutil.rmtree(self._path(uid), ignore_errors=True)
+
+    @contextlib.contextmanager
+    def _locked_size_file(self):
+        ''' Open the file that holds the total size, excluding every other
+        process until the block ends '''
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        with open(os.path.join(self.directory, SIZE_FILE_NAME), 'a+') as \
+                size_file:
+            fcntl.flock(size_file, fcntl.LOCK_EX)
+            try:
+                yield size_file
+            finally:
+                fcntl.flock(size_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_total_size(size_file):
+        ''' Return the recorded total, or None if it is unknown '''
+        size_file.seek(0)
+        try:
+            return int(size_file.read())
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _write_total_size(size_file, total_size):
+        size_file.seek(0)
+        size_file.truncate()
+        size_file.write(str(total_size))
+        size_file.flush()
+
+    def evict(self):
+        ''' Delete the least recently used artifacts until the rest fit
+        within `max_size`, with some room to spare, and record their total
+        size '''
+        with self._locked_size_file() as size_file:
+            self._evict(size_file)
+
+    def _evict(self, size_file):
+        artifacts = []
+        total_size = 0
+        for directory, subdirectories, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if file_name.startswith(TEMPORARY_FILE_PREFIX):
+                    # Still being written
+                    continue
+                if file_name == SIZE_FILE_NAME and \
+                        directory == self.directory:
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                artifacts.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+        if total_size > self.max_size:
+            target_size = self.max_size * (1 - EVICTION_HEADROOM)
+            artifacts.sort()
+            for mtime, size, path in artifacts:
+                if total_size <= target_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total_size -= size
+                increment_counter('export_artifact_cache.evictions')
+        self._write_total_size(size_file, total_size)
+
+
+def get_artifact_cache():
+    ''' Return the process-wide artifact cache configured in settings '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache_class = import_string(
+                settings.EXPORT_ARTIFACT_CACHE_BACKEND)
+            _cache = cache_class(**settings.EXPORT_ARTIFACT_CACHE_OPTIONS)
+        return _cache
+
+
+def reset_artifact_cache():
+    ''' Discard the cache object so that the next call to
+    `get_artifact_cache()` reads the settings again '''
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def open_artifact(asset, format_name, build):
+    ''' Return a file containing the artifact of the given format for the
+    current version of `asset`, calling `build()` to create it when it is
+    not cached. `build()` must return a file positioned at the beginning '''
+    cache = get_artifact_cache()
+    version_id = asset.version_id
+    artifact_file = cache.open(asset.uid, version_id, format_name)
+    if artifact_file is not None:
+        increment_counter('export_artifact_cache.hit')
+        return artifact_file
+    increment_counter('export_artifact_cache.miss')
+    artifact_file = build()
+    try:
+        cache.store(asset.uid, version_id, format_name, artifact_file)
+    except (IOError, OSError):
+        # Failing to cache, e.g. because of a concurrent invalidation or a
+        # full disk, must not fail the export
+        increment_counter('export_artifact_cache.store_error')
+    except:
+        artifact_file.close()
+        raise
+    artifact_file.seek(0)
+    return artifact_file
+
+
+def read_artifact(asset, format_name, build):
+    ''' Like `open_artifact()`, but `build()` returns a byte string, which
+    is also what this returns '''
+    with open_artifact(
+            asset, format_name, lambda: io.BytesIO(build())) as artifact_file:
+        return artifact_file.read()
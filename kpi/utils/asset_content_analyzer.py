@@ -7,66 +7,119 @@ import pyxform
 GEO_TYPES = ['gps', 'geopoint', 'geoshape', 'geotrace',]
 _unlisted_meta_types = ['username']
 META_QUESTION_TYPES = pyxform.constants.XLSFORM_METADATA_TYPES | set(_unlisted_meta_types)
+# Only this many labels are summarized
+SUMMARY_LABEL_COUNT = 5
+
+_END_TYPE_PATTERN = re.compile('^end')
+_MEDIA_COLUMN_PATTERN = re.compile('^media\:')
+_TRANSLATED_COLUMN_PATTERN = re.compile('.*\:\:?(.+)')
 
 class AssetContentAnalyzer(object):
+    ''' Summarize the survey passed as a keyword argument, or rows passed
+    one at a time to `add_row()` followed by a call to `get_summary()` '''
     def __init__(self, *args, **kwargs):
         self.survey = kwargs.get('survey')
         self.settings = kwargs.get('settings', False)
         self.choices = kwargs.get('choices', [])
+        self._rows_added = 0
+        self._row_count = 0
+        self._geo = False
+        self._labels = []
+        self._metas = set()
+        self._types = set()
+        self._summary_errors = []
+        self._keys = set()
+        for row in self.survey or []:
+            self.add_row(row)
         self.summary = self.get_summary()
 
     def _get_languages_from_column_names(self, cols):
         langs = set()
         for col in cols:
-            media_mtch = re.match('^media\:', col)
-            mtch = re.match('.*\:\:?(.+)', col)
-            if mtch and not media_mtch:
+            if _MEDIA_COLUMN_PATTERN.match(col):
+                continue
+            mtch = _TRANSLATED_COLUMN_PATTERN.match(col)
+            if mtch:
                 langs.add(mtch.groups()[0])
         return list(langs)
 
-    def get_summary(self):
-        row_count = 0
-        languages = set()
-        geo = False
-        labels = []
-        metas = set()
-        types = set()
-        summary_errors = []
-        keys = set()
-        if not self.survey:
-            return {}
+    def add_row(self, row):
+        self._rows_added += 1
+        # pyxform's csv_to_dict() returns an OrderedDict, so we have to be
+        # more tolerant than `type(row) == dict`
+        if not isinstance(row, dict):
+            return
+        _type = row.get('type')
+        _label = row.get('label')
+        if _type in GEO_TYPES:
+            self._geo = True
+        if isinstance(_type, dict):
+            self._summary_errors.append(['invalidtype', str(_type)])
+            _type = _type.keys()[0]
 
-        for row in self.survey:
-            # pyxform's csv_to_dict() returns an OrderedDict, so we have to be
-            # more tolerant than `type(row) == dict`
-            if isinstance(row, dict):
-                _type = row.get('type')
-                _label = row.get('label')
-                if _type in GEO_TYPES:
-                    geo = True
-                if isinstance(_type, dict):
-                    summary_errors.append(['invalidtype', str(_type)])
-                    _type = _type.keys()[0]
-
-                if not _type:
-                    summary_errors.append(row)
-                    continue
-                if re.match('^end', _type):
-                    continue
-                if _type in META_QUESTION_TYPES:
-                    metas.add(_type)
-                    continue
-                row_count += 1
-                types.add(_type)
-                if _label != None and len(_label) > 0:
-                    labels.append(_label)
-                keys = keys | set(row.keys())
+        if not _type:
+            self._summary_errors.append(row)
+            return
+        if _END_TYPE_PATTERN.match(_type):
+            return
+        if _type in META_QUESTION_TYPES:
+            self._metas.add(_type)
+            return
+        self._row_count += 1
+        self._types.add(_type)
+        if _label != None and len(_label) > 0 and \
+                len(self._labels) < SUMMARY_LABEL_COUNT:
+            self._labels.append(_label)
+        self._keys.update(row.keys())
 
+    def get_summary(self):
+        if not self._rows_added:
+            return {}
         summary = {
-            'row_count': row_count,
-            'languages': self._get_languages_from_column_names(keys),
-            'geo': geo,
-            'labels': labels[0:5],
-            'columns': list(keys),
+            'row_count': self._row_count,
+            'languages': self._get_languages_from_column_names(self._keys),
+            'geo': self._geo,
+            'labels': self._labels,
+            'columns': list(self._keys),
         }
         return summary
+
+    @classmethod
+    def update_summary(cls, summary, survey, previous_rows, changed_rows):
+        ''' Return the summary of `survey`, given its `summary` before some
+        rows changed. `previous_rows` and `changed_rows` map `$kuid`s to
+        those rows before and after the change; a row is missing from
+        `previous_rows` if it was added and from `changed_rows` if it was
+        removed. Only the rows needed for `labels` are read from `survey`,
+        unless the change removes a geographic question or a column, which
+        other rows may still have, or `summary` is empty; then the whole
+        survey is analyzed again '''
+        if not summary:
+            return cls(survey=survey).summary
+        before = cls()
+        for row in previous_rows.itervalues():
+            before.add_row(row)
+        after = cls()
+        for row in changed_rows.itervalues():
+            after.add_row(row)
+        if before._geo and not after._geo:
+            return cls(survey=survey).summary
+        if before._keys - after._keys:
+            return cls(survey=survey).summary
+        columns = set(summary['columns'])
+        columns.update(after._keys)
+        labels = cls()
+        for row in survey or []:
+            if len(labels._labels) == SUMMARY_LABEL_COUNT:
+                break
+            labels.add_row(row)
+        if not labels._rows_added:
+            return {}
+        return {
+            'row_count':
+                summary['row_count'] - before._row_count + after._row_count,
+            'languages': labels._get_languages_from_column_names(columns),
+            'geo': summary['geo'] or after._geo,
+            'labels': labels._labels,
+            'columns': list(columns),
+        }
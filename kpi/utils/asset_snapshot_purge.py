@@ -0,0 +1,104 @@
+import datetime
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import AssetSnapshot
+
+
+def expired_preview_snapshot_ids(now=None):
+    ''' Source-only snapshots, e.g. Enketo previews, created more than
+    settings.KOBO_SURVEY_PREVIEW_EXPIRATION hours ago '''
+    if now is None:
+        now = timezone.now()
+    expiration = now - datetime.timedelta(
+        hours=settings.KOBO_SURVEY_PREVIEW_EXPIRATION)
+    return list(AssetSnapshot.objects.filter(
+        asset_version_id=None, date_created__lt=expiration
+    ).values_list('pk', flat=True))
+
+
+def superseded_snapshot_ids(keep_latest=None):
+    ''' Versioned snapshots beyond the newest `keep_latest` of each asset '''
+    if keep_latest is None:
+        keep_latest = settings.ASSET_SNAPSHOT_KEEP_LATEST
+    if keep_latest <= 0:
+        return []
+    versioned = AssetSnapshot.objects.exclude(asset=None).exclude(
+        asset_version_id=None)
+    crowded_asset_ids = versioned.values('asset').annotate(
+        snapshot_count=Count('pk')
+    ).filter(snapshot_count__gt=keep_latest).values_list('asset', flat=True)
+    snapshot_ids = []
+    for asset_id in crowded_asset_ids:
+        snapshot_ids.extend(versioned.filter(asset_id=asset_id).order_by(
+            '-date_created', '-pk').values_list('pk', flat=True)[keep_latest:])
+    return snapshot_ids
+
+
+def least_recently_used_snapshot_ids(max_count=None, exclude_ids=()):
+    ''' The least recently accessed snapshots in excess of `max_count`,
+    disregarding those in `exclude_ids`, which are about to be purged
+    anyway '''
+    if max_count is None:
+        max_count = settings.ASSET_SNAPSHOT_MAX_COUNT
+    if max_count <= 0:
+        return []
+    exclude_ids = set(exclude_ids)
+    excess = AssetSnapshot.objects.count() - len(exclude_ids) - max_count
+    if excess <= 0:
+        return []
+    snapshot_ids = []
+    candidates = AssetSnapshot.objects.order_by(
+        'date_accessed', 'pk').values_list('pk', flat=True)
+    for snapshot_id in candidates[:excess + len(exclude_ids)]:
+        if snapshot_id in exclude_ids:
+            continue
+        snapshot_ids.append(snapshot_id)
+        if len(snapshot_ids) == excess:
+            break
+    return snapshot_ids
+
+
+def plan_asset_snapshot_purge(now=None):
+    ''' Decide what to purge without deleting anything. Returns an
+    OrderedDict of `{policy name: [snapshot primary keys]}`; no snapshot is
+    listed under more than one policy '''
+    plan = OrderedDict()
+    planned_ids = set()
+    for policy, snapshot_ids in (
+            ('expired_previews', expired_preview_snapshot_ids(now)),
+            ('superseded_versions', superseded_snapshot_ids()),
+    ):
+        plan[policy] = [snapshot_id for snapshot_id in snapshot_ids
+                        if snapshot_id not in planned_ids]
+        planned_ids.update(plan[policy])
+    plan['least_recently_used'] = least_recently_used_snapshot_ids(
+        exclude_ids=planned_ids)
+    return plan
+
+
+def purge_asset_snapshots(batch_size=None, max_batches=None, now=None):
+    ''' Delete the snapshots chosen by plan_asset_snapshot_purge(),
+    `batch_size` at a time, stopping after `max_batches` batches so that
+    one run never holds the table for long; whatever remains is left for
+    the next run. Returns an OrderedDict of `{policy name: number of
+    snapshots deleted}` '''
+    if batch_size is None:
+        batch_size = settings.ASSET_SNAPSHOT_PURGE_BATCH_SIZE
+    if max_batches is None:
+        max_batches = settings.ASSET_SNAPSHOT_PURGE_MAX_BATCHES
+    plan = plan_asset_snapshot_purge(now)
+    deleted = OrderedDict((policy, 0) for policy in plan)
+    batch_count = 0
+    for policy, snapshot_ids in plan.iteritems():
+        for i in range(0, len(snapshot_ids), batch_size):
+            if max_batches and batch_count >= max_batches:
+                return deleted
+            batch = snapshot_ids[i:i + batch_size]
+            AssetSnapshot.objects.filter(pk__in=batch).delete()
+            deleted[policy] += len(batch)
+            batch_count += 1
+    return deleted
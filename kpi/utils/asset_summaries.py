@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+from django.db.models import Case, TextField, Value, When
+
+from ..models import Asset
+from .asset_content_analyzer import AssetContentAnalyzer
+
+# Each asset adds three parameters to an UPDATE; keep them below the SQLite
+# limit of 999
+UPDATE_BATCH_SIZE = 300
+
+
+def asset_pk_chunks(chunk_size):
+    ''' Yield `(first pk, last pk)` for consecutive chunks of `chunk_size`
+    assets, streaming the primary keys from the database '''
+    pks = Asset.objects.order_by('pk').values_list('pk', flat=True)
+    first_pk = last_pk = None
+    count = 0
+    for pk in pks.iterator():
+        if first_pk is None:
+            first_pk = pk
+        last_pk = pk
+        count += 1
+        if count == chunk_size:
+            yield first_pk, last_pk
+            first_pk = None
+            count = 0
+    if first_pk is not None:
+        yield first_pk, last_pk
+
+
+def _comparable_summary(summary):
+    ''' `columns` and `languages` come from sets, so their order means
+    nothing '''
+    if not summary:
+        return summary
+    comparable = dict(summary)
+    for key in ('columns', 'languages'):
+        if key in comparable:
+            comparable[key] = sorted(comparable[key])
+    return comparable
+
+
+def summarize_asset_chunk(first_pk, last_pk, dry_run=False):
+    ''' Recompute the summaries of the assets with primary keys from
+    `first_pk` to `last_pk` and write the ones that changed in a single
+    UPDATE per `UPDATE_BATCH_SIZE` assets. Unlike `Asset.save()`, this
+    touches nothing else: the content and `date_modified` are left alone,
+    no versions are created, and neither permissions nor the search index
+    are updated. Returns the number of assets examined and the number whose
+    summaries changed '''
+    summary_field = Asset._meta.get_field('summary')
+    assets = Asset.objects.filter(
+        pk__gte=first_pk, pk__lte=last_pk
+    ).order_by('pk').only('pk', 'content', 'summary')
+    examined = 0
+    changed = {}
+    for asset in assets.iterator():
+        examined += 1
+        if asset.content is None:
+            summary = {}
+        else:
+            summary = AssetContentAnalyzer(
+                survey=asset.content.get('survey')).summary
+        if _comparable_summary(summary) != \
+                _comparable_summary(asset.summary):
+            changed[asset.pk] = summary
+    if changed and not dry_run:
+        changed_pks = sorted(changed)
+        with transaction.atomic():
+            for i in range(0, len(changed_pks), UPDATE_BATCH_SIZE):
+                batch = changed_pks[i:i + UPDATE_BATCH_SIZE]
+                Asset.objects.filter(pk__in=batch).update(summary=Case(
+                    *[When(pk=pk, then=Value(summary_field.get_db_prep_value(
+                        changed[pk], connection))) for pk in batch],
+                    output_field=TextField()
+                ))
+    return examined, len(changed)
+
+
+def _summarize_asset_chunk(args):
+    ''' Unpack the arguments for `multiprocessing.Pool.imap()` '''
+    return summarize_asset_chunk(*args)
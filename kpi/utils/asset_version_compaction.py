@@ -0,0 +1,161 @@
+import datetime
+import itertools
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from reversion.models import Revision, Version
+
+from ..models import Asset, AssetDeploymentEvent, AssetSnapshot
+from ..models.asset_version import (
+    DELTA_MARKER,
+    expand_serialized_data,
+    get_delta_reference,
+)
+
+# Keep `pk__in` lookups below the SQLite limit on query parameters
+CHUNK_SIZE = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def _asset_versions():
+    return Version.objects.filter(
+        content_type=ContentType.objects.get_for_model(Asset))
+
+
+def protected_version_ids(asset_ids):
+    ''' Versions of the given assets that compaction must never remove: the
+    current version of each asset, and any version that has been deployed
+    or has snapshots '''
+    protected = set(Asset.objects.filter(pk__in=asset_ids).exclude(
+        current_version_id=None).values_list('current_version_id', flat=True))
+    protected.update(AssetDeploymentEvent.objects.filter(
+        asset_id__in=asset_ids).exclude(version_id=None).values_list(
+            'version_id', flat=True))
+    protected.update(AssetSnapshot.objects.filter(
+        asset_id__in=asset_ids).exclude(asset_version_id=None).values_list(
+            'asset_version_id', flat=True))
+    return protected
+
+
+def collapsible_version_ids(versions, protected_ids, cutoff):
+    ''' Given `(pk, date created)` for the versions of one asset, oldest
+    first, return the pks of the versions to remove. Every run of
+    consecutive versions created before `cutoff` that are not in
+    `protected_ids` is collapsed into the newest version of the run '''
+    collapsible_ids = []
+    run = []
+    for version_id, date_created in versions:
+        if version_id in protected_ids or date_created >= cutoff:
+            collapsible_ids.extend(run[:-1])
+            run = []
+        else:
+            run.append(version_id)
+    collapsible_ids.extend(run[:-1])
+    return collapsible_ids
+
+
+def _expand_dependent_deltas(versions, doomed_ids):
+    ''' Store in full any surviving version whose content is a delta
+    against a keyframe that is about to be removed. Returns the number of
+    characters this adds '''
+    added_length = 0
+    keyframe_contents = {}
+    dependents = versions.exclude(pk__in=doomed_ids).filter(
+        serialized_data__contains=DELTA_MARKER
+    ).values_list('pk', 'serialized_data')
+    for version_id, serialized_data in dependents:
+        reference = get_delta_reference(serialized_data)
+        if reference is None or reference['keyframe'] not in doomed_ids:
+            continue
+        expanded = expand_serialized_data(serialized_data, keyframe_contents)
+        Version.objects.filter(pk=version_id).update(serialized_data=expanded)
+        added_length += len(expanded) - len(serialized_data)
+    return added_length
+
+
+def compact_asset_batch(asset_ids, cutoff, dry_run=False):
+    ''' Collapse the old versions of the given assets. Returns the number of
+    versions removed and the number of characters of serialized data
+    reclaimed '''
+    versions = _asset_versions().filter(object_id_int__in=asset_ids)
+    protected_ids = protected_version_ids(asset_ids)
+    rows = versions.order_by('object_id_int', 'pk').values_list(
+        'object_id_int', 'pk', 'revision__date_created')
+    doomed_ids = set()
+    for asset_id, asset_rows in itertools.groupby(rows, lambda row: row[0]):
+        doomed_ids.update(collapsible_version_ids(
+            ((pk, date_created) for _, pk, date_created in asset_rows),
+            protected_ids,
+            cutoff
+        ))
+    if not doomed_ids:
+        return 0, 0
+    reclaimed_length = 0
+    revision_ids = set()
+    for chunk in _chunks(doomed_ids):
+        doomed = Version.objects.filter(pk__in=chunk)
+        reclaimed_length += doomed.aggregate(
+            length=Sum(Length('serialized_data')))['length'] or 0
+        revision_ids.update(doomed.values_list('revision_id', flat=True))
+    if dry_run:
+        return len(doomed_ids), reclaimed_length
+    reclaimed_length -= _expand_dependent_deltas(versions, doomed_ids)
+    for chunk in _chunks(doomed_ids):
+        Version.objects.filter(pk__in=chunk).delete()
+    for chunk in _chunks(revision_ids):
+        # Remove revisions that no longer contain any versions
+        Revision.objects.filter(pk__in=chunk, version=None).delete()
+    return len(doomed_ids), reclaimed_length
+
+
+def compact_asset_versions(min_age=None, batch_size=None, dry_run=False,
+                           now=None):
+    ''' Collapse runs of versions older than `min_age` (a timedelta) for
+    every asset, `batch_size` assets per transaction. Returns an
+    OrderedDict of statistics '''
+    if min_age is None:
+        min_age = datetime.timedelta(
+            days=settings.ASSET_VERSION_COMPACTION_MIN_AGE_DAYS)
+    if batch_size is None:
+        batch_size = settings.ASSET_VERSION_COMPACTION_BATCH_SIZE
+    if now is None:
+        now = timezone.now()
+    cutoff = now - min_age
+    # Only assets with at least two old versions have anything to collapse
+    candidate_asset_ids = _asset_versions().filter(
+        revision__date_created__lt=cutoff
+    ).values('object_id_int').annotate(
+        old_versions=Count('pk')
+    ).filter(old_versions__gt=1).order_by('object_id_int').values_list(
+        'object_id_int', flat=True)
+    stats = OrderedDict([
+        ('assets', 0),
+        ('versions_removed', 0),
+        ('characters_reclaimed', 0),
+    ])
+    last_asset_id = None
+    while True:
+        batch = candidate_asset_ids
+        if last_asset_id is not None:
+            batch = batch.filter(object_id_int__gt=last_asset_id)
+        asset_ids = list(batch[:batch_size])
+        if not asset_ids:
+            break
+        with transaction.atomic():
+            removed, reclaimed = compact_asset_batch(
+                asset_ids, cutoff, dry_run)
+        stats['assets'] += len(asset_ids)
+        stats['versions_removed'] += removed
+        stats['characters_reclaimed'] += reclaimed
+        last_asset_id = asset_ids[-1]
+    return stats
@@ -0,0 +1,49 @@
+'''
+Run code once the current transaction has committed, e.g. to send a Celery
+task that must see the changes. Django 1.9 and later provide
+`transaction.on_commit()`. Before that, callbacks registered inside a
+transaction are held until CommitHookMiddleware runs them at the end of the
+request, after ATOMIC_REQUESTS or any `atomic()` block in the view has been
+committed, and dropped if the request raised an exception.
+'''
+
+import threading
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+def activate_commit_hooks():
+    ''' Start holding callbacks for the current thread, e.g. at the
+    beginning of a request '''
+    _local.callbacks = []
+
+
+def deactivate_commit_hooks(run=True):
+    ''' Stop holding callbacks, calling the ones held unless `run=False` '''
+    callbacks = getattr(_local, 'callbacks', None) or []
+    _local.callbacks = None
+    if run:
+        for callback in callbacks:
+            callback()
+
+
+def on_commit(callback):
+    ''' Call `callback` once the current transaction, if any, commits.
+    Returns False without calling it if that cannot be arranged, i.e.
+    inside a transaction on Django 1.8 but outside a request, in which case
+    the caller must do without '''
+    django_on_commit = getattr(transaction, 'on_commit', None)
+    if django_on_commit is not None:
+        django_on_commit(callback)
+        return True
+    if not transaction.get_connection().in_atomic_block:
+        # Autocommit: the changes are already visible to everyone
+        callback()
+        return True
+    callbacks = getattr(_local, 'callbacks', None)
+    if callbacks is None:
+        return False
+    callbacks.append(callback)
+    return True
@@ -0,0 +1,99 @@
+'''
+Compact, JSON-serializable differences between two JSON-compatible values,
+used to store asset versions as deltas. A delta is one of:
+
+    {'v': new value}                            replace the value outright
+    {'d': {'set': {key: value, ...},            dictionaries: add or replace
+           'unset': [key, ...],                 keys, remove keys, and patch
+           'patch': {key: delta, ...}}}         values with nested deltas
+    {'l': [[start, end, [item, ...]], ...       lists: splice the old list,
+           [index, delta], ...]}                or patch an item in place
+
+List operations refer to positions in the old list and are listed in
+ascending order. `make_delta()` returns None when the values are equal.
+'''
+
+import copy
+import difflib
+import json
+
+
+def _item_key(item):
+    return json.dumps(item, sort_keys=True)
+
+
+def _dict_delta(old, new):
+    delta = {}
+    set_keys = {}
+    patch = {}
+    for key, value in new.iteritems():
+        if key not in old:
+            set_keys[key] = value
+        elif old[key] != value:
+            patch[key] = make_delta(old[key], value)
+    unset = [key for key in old if key not in new]
+    if set_keys:
+        delta['set'] = set_keys
+    if unset:
+        delta['unset'] = unset
+    if patch:
+        delta['patch'] = patch
+    return {'d': delta}
+
+
+def _list_delta(old, new):
+    operations = []
+    matcher = difflib.SequenceMatcher(
+        None, map(_item_key, old), map(_item_key, new), autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        if tag == 'replace' and i2 - i1 == j2 - j1:
+            # Edited items, e.g. a relabeled question, are patched in place
+            for offset in range(i2 - i1):
+                operations.append([
+                    i1 + offset, make_delta(old[i1 + offset], new[j1 + offset])
+                ])
+        else:
+            operations.append([i1, i2, new[j1:j2]])
+    return {'l': operations}
+
+
+def make_delta(old, new):
+    ''' Return a delta that turns `old` into `new`, or None if they are
+    equal '''
+    if old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        return _dict_delta(old, new)
+    if isinstance(old, list) and isinstance(new, list):
+        return _list_delta(old, new)
+    return {'v': new}
+
+
+def apply_delta(old, delta):
+    ''' Return the result of applying `delta` to `old`, which is not
+    modified '''
+    if delta is None:
+        return copy.deepcopy(old)
+    if 'v' in delta:
+        return copy.deepcopy(delta['v'])
+    if 'd' in delta:
+        delta = delta['d']
+        new = copy.deepcopy(old)
+        for key in delta.get('unset', ()):
+            del new[key]
+        for key, value in delta.get('patch', {}).iteritems():
+            new[key] = apply_delta(old[key], value)
+        new.update(copy.deepcopy(delta.get('set', {})))
+        return new
+    new = copy.deepcopy(old)
+    # Work backwards so that earlier positions remain valid
+    for operation in reversed(delta['l']):
+        if len(operation) == 2:
+            index, item_delta = operation
+            new[index] = apply_delta(old[index], item_delta)
+        else:
+            start, end, items = operation
+            new[start:end] = copy.deepcopy(items)
+    return new
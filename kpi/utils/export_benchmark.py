@@ -0,0 +1,134 @@
+'''
+Benchmarks for exporting assets as spreadsheets. A synthetic survey with
+many questions and translations is exported in each format, timing the
+export and measuring how much the peak memory use of a freshly forked
+process grows while doing it. Used by the `benchmark_exports` management
+command and by `test_export_benchmark`; the results are plain dictionaries
+so that they can be dumped as JSON and compared across commits.
+'''
+
+import multiprocessing
+import resource
+from collections import OrderedDict
+from timeit import default_timer
+
+from formpack.utils.expand_content import expand_content
+
+from ..models.asset import Asset
+
+# {format name: `xlsx` argument for `Asset.to_xls_io()`}
+FORMATS = OrderedDict([('xls', False), ('xlsx', True)])
+
+
+def _export(asset, xlsx):
+    ''' Export the asset and return the size of the file in bytes '''
+    with asset.to_xls_io(xlsx=xlsx) as xls_io:
+        xls_io.seek(0, 2)
+        return xls_io.tell()
+
+
+def _report_peak_memory_increase(asset, xlsx, queue):
+    start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    _export(asset, xlsx)
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start)
+
+
+def _translated(row, column, text, languages):
+    for i in range(languages):
+        row[u'{}::Language {}'.format(column, i)] = u'{} ({})'.format(text, i)
+    return row
+
+
+def synthetic_survey_content(rows, languages, choices):
+    ''' Return the content of a survey with `rows` questions, each labeled
+    and hinted in `languages` languages; every third question is a
+    select_one with `choices` translated choices '''
+    survey = []
+    choice_rows = []
+    for i in range(rows):
+        row = {'name': 'q{}'.format(i)}
+        if i % 3:
+            row['type'] = 'text'
+        else:
+            list_name = 'list_{}'.format(i)
+            row['type'] = 'select_one {}'.format(list_name)
+            for c in range(choices):
+                choice_rows.append(_translated({
+                    'list_name': list_name,
+                    'name': 'c{}'.format(c),
+                }, 'label', u'Choice {}'.format(c), languages))
+        _translated(row, 'label', u'Question {}'.format(i), languages)
+        _translated(row, 'hint', u'Hint for question {}'.format(i), languages)
+        survey.append(row)
+    return {
+        'survey': survey,
+        'choices': choice_rows,
+        'settings': [{'id_string': 'benchmark'}],
+    }
+
+
+class ExportBenchmark(object):
+    ''' Export the survey built by `synthetic_survey_content()`, repeating
+    every export `repeat` times. Nothing is saved to the database '''
+    def __init__(self, rows=3000, languages=40, choices=5, repeat=3,
+                 measure_memory=True):
+        self.rows = rows
+        self.languages = languages
+        self.choices = choices
+        self.repeat = repeat
+        self.measure_memory = measure_memory
+
+    def options(self):
+        return OrderedDict([
+            ('rows', self.rows),
+            ('languages', self.languages),
+            ('choices', self.choices),
+            ('repeat', self.repeat),
+        ])
+
+    def build_asset(self):
+        content = synthetic_survey_content(
+            self.rows, self.languages, self.choices)
+        expand_content(content)
+        return Asset(name='Export benchmark', asset_type='survey',
+                     content=content)
+
+    def _peak_memory_increase(self, asset, xlsx):
+        ''' Export in a child process so that each measurement starts from
+        the same peak. Returns kilobytes on Linux '''
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_report_peak_memory_increase, args=(asset, xlsx, queue))
+        process.start()
+        increase = queue.get()
+        process.join()
+        return increase
+
+    def _measure(self, asset, xlsx):
+        timings = []
+        for i in range(self.repeat):
+            start = default_timer()
+            size = _export(asset, xlsx)
+            timings.append(default_timer() - start)
+        result = OrderedDict([
+            ('min_seconds', min(timings)),
+            ('mean_seconds', sum(timings) / len(timings)),
+            ('max_seconds', max(timings)),
+            ('bytes', size),
+        ])
+        if self.measure_memory:
+            result['peak_memory_increase_kb'] = self._peak_memory_increase(
+                asset, xlsx)
+        return result
+
+    def run(self):
+        ''' Build the survey and time each export format. Returns a
+        dictionary suitable for serializing as JSON '''
+        asset = self.build_asset()
+        results = OrderedDict()
+        for format_name, xlsx in FORMATS.iteritems():
+            results[format_name] = self._measure(asset, xlsx)
+        return OrderedDict([
+            ('options', self.options()),
+            ('results', results),
+        ])
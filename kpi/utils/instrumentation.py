@@ -0,0 +1,36 @@
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def increment_counter(name, amount=1):
+    ''' Add `amount` to the process-wide counter called `name` '''
+    with _lock:
+        _counters[name] += amount
+
+
+def get_counters():
+    ''' Return a snapshot of all counters as a dictionary '''
+    with _lock:
+        return dict(_counters)
+
+
+def set_gauge(name, value):
+    ''' Record the current value of something that goes up and down, e.g.
+    the length of a queue '''
+    with _lock:
+        _gauges[name] = value
+
+
+def get_gauges():
+    with _lock:
+        return dict(_gauges)
+
+
+def reset_counters():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,190 @@
+'''
+Benchmarks for the object permission engine. A synthetic collection tree is
+generated and the common permission operations are timed against it, along
+with the number of database queries each one issues. Used by the
+`benchmark_permissions` management command and by
+`test_permission_benchmark`; the results are plain dictionaries so that they
+can be dumped as JSON and compared across commits and database backends.
+'''
+
+import random
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ..filters import KpiObjectPermissionsFilter
+from ..models.asset import Asset
+from ..models.collection import Collection
+from ..models.object_permission import get_objects_for_user
+
+USERNAME_PREFIX = 'permission_benchmark_'
+BENCHMARK_CONTENT = {'survey': [
+    {'type': 'text', 'label': 'Question 1', 'name': 'q1', 'kuid': 'abc'},
+]}
+
+
+class _ListView(object):
+    ''' The only thing KpiObjectPermissionsFilter needs from a view '''
+    action = 'list'
+
+
+class PermissionBenchmark(object):
+    ''' Build a tree `depth` collections deep, where every collection has
+    `fan_out` child collections and `assets_per_collection` assets. Each of
+    the `collaborators` is granted view or change access somewhere in the
+    tree, and `deny_rules` of those grants are then revoked further down,
+    creating deny permissions. Every operation is repeated `repeat` times.
+    Expects to run inside a transaction that the caller rolls back. '''
+    def __init__(self, depth=3, fan_out=3, assets_per_collection=2,
+                 collaborators=5, deny_rules=2, repeat=3, seed=0):
+        self.depth = depth
+        self.fan_out = fan_out
+        self.assets_per_collection = assets_per_collection
+        self.collaborators = collaborators
+        self.deny_rules = deny_rules
+        self.repeat = repeat
+        self.random = random.Random(seed)
+
+    def options(self):
+        return OrderedDict([
+            ('depth', self.depth),
+            ('fan_out', self.fan_out),
+            ('assets_per_collection', self.assets_per_collection),
+            ('collaborators', self.collaborators),
+            ('deny_rules', self.deny_rules),
+            ('repeat', self.repeat),
+        ])
+
+    def _create_user(self, name):
+        return User.objects.create(username=USERNAME_PREFIX + name)
+
+    def build_tree(self):
+        ''' Create the users, collections, and assets. Returns the root
+        collection '''
+        self.owner = self._create_user('owner')
+        # A user without any access, for the assign/remove timings
+        self.subject = self._create_user('subject')
+        self.collaborator_users = [
+            self._create_user('collaborator_{}'.format(i))
+            for i in range(self.collaborators)
+        ]
+        self.root = Collection.objects.create(
+            name='Benchmark root', owner=self.owner)
+        self.collection_list = [self.root]
+        self.asset_list = []
+        level = [self.root]
+        for depth in range(self.depth):
+            next_level = []
+            for parent in level:
+                for i in range(self.assets_per_collection):
+                    self.asset_list.append(Asset.objects.create(
+                        name='Benchmark asset', content=BENCHMARK_CONTENT,
+                        owner=self.owner, parent=parent
+                    ))
+                if depth == self.depth - 1:
+                    continue
+                for i in range(self.fan_out):
+                    next_level.append(Collection.objects.create(
+                        name='Benchmark collection', owner=self.owner,
+                        parent=parent
+                    ))
+            self.collection_list.extend(next_level)
+            level = next_level
+        grants = []
+        for user in self.collaborator_users:
+            collection = self.random.choice(self.collection_list)
+            codename = self.random.choice(
+                ['view_collection', 'change_collection'])
+            collection.assign_perm(user, codename)
+            grants.append((user, collection, codename))
+        for user, collection, codename in self.random.sample(
+                grants, min(self.deny_rules, len(grants))):
+            descendants = list(collection.get_descendants())
+            if not descendants:
+                continue
+            self.random.choice(descendants).remove_perm(user, codename)
+        return self.root
+
+    def _measure(self, operation, setup=None):
+        ''' Call `operation` `self.repeat` times, calling `setup` (untimed)
+        beforehand each time. Returns the timings in seconds and the number
+        of queries issued by the slowest run '''
+        timings = []
+        queries = []
+        for i in range(self.repeat):
+            if setup is not None:
+                setup()
+            with CaptureQueriesContext(connection) as context:
+                start = default_timer()
+                operation()
+                timings.append(default_timer() - start)
+            queries.append(len(context.captured_queries))
+        return OrderedDict([
+            ('min_seconds', min(timings)),
+            ('mean_seconds', sum(timings) / len(timings)),
+            ('max_seconds', max(timings)),
+            ('queries', max(queries)),
+        ])
+
+    @override_settings(ASYNC_PERMISSION_RECALCULATION=False)
+    def run(self):
+        ''' Build the tree and time each operation. Returns a dictionary
+        suitable for serializing as JSON. Recalculation always happens
+        synchronously so that it is included in the timings '''
+        build_start = default_timer()
+        self.build_tree()
+        build_seconds = default_timer() - build_start
+        root = self.root
+        subject = self.subject
+        collaborator = self.collaborator_users[0] if \
+            self.collaborator_users else subject
+        request = Request(APIRequestFactory().get('/'))
+        request.user = collaborator
+        view = _ListView()
+        permissions_filter = KpiObjectPermissionsFilter()
+
+        def remove_if_assigned():
+            if subject.has_perm('view_collection', root):
+                root.remove_perm(subject, 'view_collection')
+
+        def assign_if_removed():
+            if not subject.has_perm('view_collection', root):
+                root.assign_perm(subject, 'view_collection')
+
+        results = OrderedDict()
+        results['assign_perm'] = self._measure(
+            lambda: root.assign_perm(subject, 'view_collection'),
+            setup=remove_if_assigned
+        )
+        results['remove_perm'] = self._measure(
+            lambda: root.remove_perm(subject, 'view_collection'),
+            setup=assign_if_removed
+        )
+        results['recalculate_descendants_perms'] = self._measure(
+            root.recalculate_descendants_perms)
+        results['get_objects_for_user'] = self._measure(
+            lambda: list(get_objects_for_user(
+                collaborator, 'view_asset', Asset)))
+        results['KpiObjectPermissionsFilter'] = self._measure(
+            lambda: list(permissions_filter.filter_queryset(
+                request, Asset.objects.all(), view)))
+        return OrderedDict([
+            ('vendor', connection.vendor),
+            ('options', self.options()),
+            ('settings', OrderedDict([
+                ('SET_BASED_PERMISSION_RECALCULATION',
+                 settings.SET_BASED_PERMISSION_RECALCULATION),
+            ])),
+            ('tree', OrderedDict([
+                ('collections', len(self.collection_list)),
+                ('assets', len(self.asset_list)),
+                ('build_seconds', build_seconds),
+            ])),
+            ('results', results),
+        ])
@@ -0,0 +1,134 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .permission_registry import permission_registry
+
+_local = threading.local()
+
+
+def activate_permission_cache():
+    ''' Start caching permissions for the current thread, e.g. at the
+    beginning of a request '''
+    _local.cache = PermissionCache()
+    return _local.cache
+
+
+def deactivate_permission_cache():
+    _local.cache = None
+
+
+def get_permission_cache():
+    ''' Return the active PermissionCache, or None if caching is not active
+    for the current thread '''
+    return getattr(_local, 'cache', None)
+
+
+def invalidate_permission_cache():
+    ''' Forget everything the active cache knows, if any. Changing the
+    permissions of one object can affect all of its descendants, so there's
+    no attempt to be selective '''
+    cache = get_permission_cache()
+    if cache is not None:
+        cache.clear()
+
+
+class PermissionCache(object):
+    ''' Holds the effective, explicitly assigned permissions of a few users
+    on a set of objects so that has_perm() can be answered from memory. Load
+    a whole page of objects at once with prime(); objects that were not
+    primed are loaded individually the first time they are checked. The
+    anonymous user is always loaded along with the requesting user, since
+    public access is checked whenever a user-specific test fails. '''
+    def __init__(self):
+        # {(content_type_id, object_id): {user_id: set(codenames)}}
+        self._perms = {}
+        # {(content_type_id, object_id): (owner_id, editors_can_change)}
+        self._objects = {}
+        self._user_ids = set()
+
+    def clear(self):
+        self._perms.clear()
+        self._objects.clear()
+        self._user_ids.clear()
+
+    @staticmethod
+    def _key(obj):
+        return permission_registry.get_content_type_id(obj), obj.pk
+
+    def prime(self, objects, user_obj):
+        ''' Load the effective permissions of `user_obj` and the anonymous
+        user on every object in `objects` with one query per content type '''
+        # Avoid a circular import
+        from ..models.object_permission import ObjectPermission
+        user_ids = set([settings.ANONYMOUS_USER_ID])
+        if user_obj is not None and user_obj.pk is not None:
+            user_ids.add(user_obj.pk)
+        if not user_ids.issubset(self._user_ids):
+            # Objects loaded earlier lack this user's permissions
+            self._perms.clear()
+            self._objects.clear()
+            self._user_ids.update(user_ids)
+        pks_by_content_type = defaultdict(list)
+        for obj in objects:
+            if not hasattr(obj, 'has_perm'):
+                continue
+            key = self._key(obj)
+            if key in self._perms:
+                continue
+            self._perms[key] = defaultdict(set)
+            self._objects[key] = (
+                obj.owner_id, obj.editors_can_change_permissions)
+            pks_by_content_type[key[0]].append(obj.pk)
+        for content_type_id, pks in pks_by_content_type.iteritems():
+            grants = set()
+            denies = set()
+            for object_id, user_id, permission_id, deny in \
+                    ObjectPermission.objects.filter(
+                        content_type_id=content_type_id,
+                        object_id__in=pks,
+                        user_id__in=self._user_ids
+                    ).values_list(
+                        'object_id', 'user_id', 'permission_id', 'deny'
+                    ):
+                codename = permission_registry.get_codename(permission_id)
+                if deny:
+                    denies.add((object_id, user_id, codename))
+                else:
+                    grants.add((object_id, user_id, codename))
+            for object_id, user_id, codename in grants.difference(denies):
+                self._perms[(content_type_id, object_id)][user_id].add(
+                    codename)
+
+    def _has_perm_for_user(self, key, user_id, codename):
+        perms = self._perms[key].get(user_id, ())
+        owner_id, editors_can_change_permissions = self._objects[key]
+        # Mirror the calculated permissions of
+        # ObjectPermissionMixin._get_effective_perms()
+        if codename.startswith('share_'):
+            return editors_can_change_permissions and (
+                codename.replace('share_', 'change_', 1) in perms)
+        if codename.startswith('delete_'):
+            return owner_id is not None and user_id == owner_id
+        return codename in perms
+
+    def has_perm(self, user_obj, perm, obj):
+        ''' Answer ObjectPermissionMixin.has_perm() from memory. Expects
+        `user_obj` to be a real User, i.e. not AnonymousUser '''
+        # Avoid a circular import
+        from ..models.object_permission import is_anonymous_user_id, perm_parse
+        if user_obj.is_active and user_obj.is_superuser:
+            return True
+        if user_obj.pk not in self._user_ids or \
+                self._key(obj) not in self._perms:
+            self.prime([obj], user_obj)
+        key = self._key(obj)
+        app_label, codename = perm_parse(perm, obj)
+        if not is_anonymous_user_id(user_obj.pk) and \
+                self._has_perm_for_user(key, user_obj.pk, codename):
+            return True
+        # Does the public have access?
+        fq_permission = '{}.{}'.format(app_label, codename)
+        return fq_permission in settings.ALLOWED_ANONYMOUS_PERMISSIONS and \
+            self._has_perm_for_user(key, settings.ANONYMOUS_USER_ID, codename)
@@ -0,0 +1,137 @@
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+
+
+class PermissionRegistry(object):
+    ''' A process-wide map of `auth.Permission` and `ContentType` primary
+    keys, loaded with a single query the first time it's needed, so that
+    permission checks and recalculation do not have to look up metadata in
+    the database over and over. The `MAPPED_PARENT_PERMISSIONS` of every
+    model are translated into primary keys up front. Call clear() whenever
+    permissions or content types change, e.g. after migrating. '''
+    def __init__(self):
+        self._loaded = False
+
+    def clear(self):
+        self._loaded = False
+
+    def load(self):
+        self._permission_ids = {}
+        self._codenames = {}
+        self._content_type_ids = {}
+        self._permission_content_type_ids = {}
+        self._ids_by_content_type = {}
+        for permission_id, codename, content_type_id, app_label, model in \
+                Permission.objects.values_list(
+                    'pk', 'codename', 'content_type_id',
+                    'content_type__app_label', 'content_type__model'
+                ):
+            self._permission_ids[(app_label, codename)] = permission_id
+            self._codenames[permission_id] = codename
+            self._content_type_ids[(app_label, model)] = content_type_id
+            self._permission_content_type_ids[permission_id] = content_type_id
+            self._ids_by_content_type.setdefault(
+                content_type_id, {})[codename] = permission_id
+        # {(app_label, model_name): {parent_permission_id: permission_id}}
+        self._mapped_parent_permissions = {}
+        for model in apps.get_models():
+            mapped = getattr(model, 'MAPPED_PARENT_PERMISSIONS', None)
+            if mapped is None:
+                continue
+            app_label = model._meta.app_label
+            translations = {}
+            for parent_codename, codename in mapped.iteritems():
+                try:
+                    translations[self._permission_ids[
+                        (app_label, parent_codename)]] = \
+                            self._permission_ids[(app_label, codename)]
+                except KeyError:
+                    # The permissions have not been created yet
+                    continue
+            self._mapped_parent_permissions[
+                (app_label, model._meta.model_name)] = translations
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get_permission_id(self, app_label, codename):
+        ''' Return the primary key of a permission. Raises
+        Permission.DoesNotExist if there is no such permission '''
+        self._ensure_loaded()
+        key = (app_label, codename)
+        if key not in self._permission_ids:
+            # The permission may have been created since we loaded
+            self.load()
+        try:
+            return self._permission_ids[key]
+        except KeyError:
+            raise Permission.DoesNotExist(
+                'Permission {}.{} does not exist.'.format(app_label, codename))
+
+    def get_codename(self, permission_id):
+        self._ensure_loaded()
+        if permission_id not in self._codenames:
+            self.load()
+        try:
+            return self._codenames[permission_id]
+        except KeyError:
+            raise Permission.DoesNotExist(
+                'Permission {} does not exist.'.format(permission_id))
+
+    def get_permission_content_type_id(self, permission_id):
+        ''' Return the primary key of the content type that a permission
+        belongs to '''
+        self._ensure_loaded()
+        if permission_id not in self._permission_content_type_ids:
+            self.load()
+        try:
+            return self._permission_content_type_ids[permission_id]
+        except KeyError:
+            raise Permission.DoesNotExist(
+                'Permission {} does not exist.'.format(permission_id))
+
+    def get_content_type_id(self, model):
+        ''' Return the primary key of the content type for a model class or
+        instance. Historical models used by migrations are supported '''
+        self._ensure_loaded()
+        key = (model._meta.app_label, model._meta.model_name)
+        try:
+            return self._content_type_ids[key]
+        except KeyError:
+            # Models without any permissions are not loaded by load()
+            content_type_id = ContentType.objects.get_by_natural_key(*key).pk
+            self._content_type_ids[key] = content_type_id
+            return content_type_id
+
+    def get_permission_ids(self, content_type_id):
+        ''' Return a dictionary of `{codename: permission_id}` for every
+        permission of the given content type '''
+        self._ensure_loaded()
+        return self._ids_by_content_type.get(content_type_id, {})
+
+    def get_permission_id_by_prefix(self, content_type_id, prefix):
+        ''' Return the primary key of the permission whose codename starts
+        with `prefix`, e.g. `change_`, for the given content type '''
+        for codename, permission_id in self.get_permission_ids(
+                content_type_id).iteritems():
+            if codename.startswith(prefix):
+                return permission_id
+        raise Permission.DoesNotExist(
+            'No permission starting with {} exists for content type '
+            '{}.'.format(prefix, content_type_id)
+        )
+
+    def translate_parent_permission(self, model, parent_permission_id):
+        ''' Translate a permission on the parent of `model` according to
+        `model.MAPPED_PARENT_PERMISSIONS`. Returns None if the permission is
+        not inherited by `model` '''
+        self._ensure_loaded()
+        return self._mapped_parent_permissions.get(
+            (model._meta.app_label, model._meta.model_name), {}
+        ).get(parent_permission_id)
+
+
+permission_registry = PermissionRegistry()
@@ -0,0 +1,91 @@
+'''
+Benchmarks for saving large assets. The survey built by
+`export_benchmark.synthetic_survey_content()` is saved in the ways the form
+builder saves: creation, autosaves without changes, a save after reloading,
+and a save after editing a single question. Used by the
+`benchmark_asset_save` management command and by `test_save_benchmark`.
+'''
+
+import copy
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..models.asset import Asset
+from .export_benchmark import synthetic_survey_content
+
+
+class SaveBenchmark(object):
+    ''' Repeat every kind of save `repeat` times. Expects to run inside a
+    transaction that the caller rolls back '''
+    def __init__(self, rows=3000, languages=10, choices=5, repeat=3):
+        self.rows = rows
+        self.languages = languages
+        self.choices = choices
+        self.repeat = repeat
+
+    def options(self):
+        return OrderedDict([
+            ('rows', self.rows),
+            ('languages', self.languages),
+            ('choices', self.choices),
+            ('repeat', self.repeat),
+        ])
+
+    def _measure(self, operation, asset=None):
+        ''' Call `operation` `self.repeat` times. Returns the timings in
+        seconds, the number of queries issued by the slowest run, and how
+        many versions of `asset` were created '''
+        timings = []
+        queries = []
+        version_count = asset.versions().count() if asset else 0
+        for i in range(self.repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = default_timer()
+                operation(i)
+                timings.append(default_timer() - start)
+            queries.append(len(context.captured_queries))
+        result = OrderedDict([
+            ('min_seconds', min(timings)),
+            ('mean_seconds', sum(timings) / len(timings)),
+            ('max_seconds', max(timings)),
+            ('queries', max(queries)),
+        ])
+        if asset:
+            result['versions_created'] = \
+                asset.versions().count() - version_count
+        return result
+
+    def run(self):
+        ''' Time each kind of save. Returns a dictionary suitable for
+        serializing as JSON '''
+        content = synthetic_survey_content(
+            self.rows, self.languages, self.choices)
+        asset = Asset.objects.create(
+            name='Save benchmark', asset_type='survey',
+            content=copy.deepcopy(content)
+        )
+
+        def edit_one_row(i):
+            asset.content['survey'][i]['label'] = u'Edited {}'.format(i)
+            asset.save()
+
+        results = OrderedDict()
+        results['create'] = self._measure(
+            lambda i: Asset.objects.create(
+                name='Save benchmark', asset_type='survey',
+                content=copy.deepcopy(content)
+            )
+        )
+        results['save_unchanged'] = self._measure(
+            lambda i: asset.save(), asset)
+        results['reload_and_save'] = self._measure(
+            lambda i: Asset.objects.get(pk=asset.pk).save(), asset)
+        results['edit_one_row'] = self._measure(edit_one_row, asset)
+        return OrderedDict([
+            ('vendor', connection.vendor),
+            ('options', self.options()),
+            ('results', results),
+        ])
@@ -0,0 +1,88 @@
+'''
+Writers for XLSForm spreadsheets, given as an ordered mapping of
+`{sheet name: [{column name: cell value}, ...]}`. XLSX is written with
+XlsxWriter in constant-memory mode, which flushes each row to disk as soon
+as it is complete; XLS, written with xlwt, remains for compatibility with
+consumers that cannot read XLSX.
+'''
+
+import itertools
+import re
+import tempfile
+from collections import OrderedDict
+
+XLS_MAX_COLUMNS = 256
+XLSX_MAX_COLUMNS = 16384
+# Open exported files in chunks of this many bytes when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def sheet_columns(rows):
+    ''' Every column name used by `rows`, in order of first appearance '''
+    return list(OrderedDict.fromkeys(itertools.chain.from_iterable(rows)))
+
+
+def _exported_sheets(sheets):
+    ''' pyxform.xls2json_backends adds "_header" items for each sheet, which
+    are not exported '''
+    for sheet_name, rows in sheets.iteritems():
+        if not re.match(r'.*_header$', sheet_name):
+            yield sheet_name, rows, sheet_columns(rows)
+
+
+def write_xls(sheets, output):
+    ''' Write `sheets` to the file-like `output` as XLS '''
+    import xlwt
+    workbook = xlwt.Workbook()
+    for sheet_name, rows, columns in _exported_sheets(sheets):
+        if len(columns) > XLS_MAX_COLUMNS:
+            raise ValueError(u'The `{}` sheet has {} columns, more than the '
+                             u'XLS format allows'.format(
+                                 sheet_name, len(columns)))
+        sheet = workbook.add_sheet(sheet_name)
+        for ci, column in enumerate(columns):
+            sheet.write(0, ci, column)
+        for ri, row in enumerate(rows, 1):
+            for ci, column in enumerate(columns):
+                value = row.get(column)
+                if value:
+                    sheet.write(ri, ci, value)
+    workbook.save(output)
+
+
+def write_xlsx(sheets, output):
+    ''' Write `sheets` to `output`, a file name or a seekable file-like
+    object, as XLSX '''
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(output, {
+        # Rows must be written in order, which they are
+        'constant_memory': True,
+        # Cell values are user content, not formulas or links
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    for sheet_name, rows, columns in _exported_sheets(sheets):
+        if len(columns) > XLSX_MAX_COLUMNS:
+            raise ValueError(u'The `{}` sheet has {} columns, more than the '
+                             u'XLSX format allows'.format(
+                                 sheet_name, len(columns)))
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, columns)
+        for ri, row in enumerate(rows, 1):
+            for ci, column in enumerate(columns):
+                value = row.get(column)
+                if value:
+                    sheet.write(ri, ci, value)
+    workbook.close()
+
+
+def export_spreadsheet(sheets, xlsx=False):
+    ''' Return a temporary file, positioned at the beginning, that contains
+    `sheets` as XLSX or XLS. The file is deleted when closed '''
+    output = tempfile.TemporaryFile()
+    if xlsx:
+        write_xlsx(sheets, output)
+    else:
+        write_xls(sheets, output)
+    output.seek(0)
+    return output
@@ -0,0 +1,322 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import increment_counter, set_gauge
+
+LOCK_KEY = 'xform_compiler:lock:{}'
+RESULT_KEY = 'xform_compiler:result:{}'
+CHUNK_KEY = '{}:{}'
+# Seconds between checks for a result
+POLL_INTERVAL = 0.25
+# Seconds to keep a result for the processes that were waiting for it
+RESULT_TIMEOUT = 60
+# Seconds to keep a failure, so that the processes waiting for the same
+# compilation raise its error instead of each compiling again
+FAILURE_TIMEOUT = 10
+# Seconds a lock outlives the process holding it, which renews it for as
+# long as it is compiling
+LOCK_TIMEOUT = 30
+# The XML is cached in pieces of at most this many bytes, well under the
+# 1 MB that memcached allows for each item
+CHUNK_SIZE = 512 * 1024
+
+
+def compile_xform(source, default_name, default_language, default_id_string):
+    ''' Turn an XLSForm-style `source` into XForm XML with pyxform. Returns
+    the XML and the list of warnings. Runs in a pool process, so everything
+    passed in and out must be picklable '''
+    import pyxform
+    warnings = []
+    dict_repr = pyxform.xls2json.workbook_to_json(
+        source, default_name, default_language, warnings)
+
+    for k in (u'name', u'id_string', u'sms_keyword'):
+        dict_repr.setdefault(k, default_id_string)
+        if not isinstance(dict_repr[k], basestring):
+            dict_repr[k]= default_id_string
+
+    survey = pyxform.builder.create_survey_element_from_dict(dict_repr)
+    return survey._to_pretty_xml(), warnings
+
+
+def parse_address(address):
+    ''' Turn `host:port` into a (host, port) tuple. Anything else is taken
+    as the path of a Unix socket '''
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _authkey():
+    return hashlib.sha256(
+        'xform_compiler:' + settings.SECRET_KEY.encode('utf-8')).digest()
+
+
+class _PoolCompiler(object):
+    ''' Shared by every client of the compiler server '''
+    def __init__(self, processes, timeout):
+        self.pool = multiprocessing.Pool(processes)
+        self.timeout = timeout
+
+    def compile(self, *args):
+        return self.pool.apply_async(compile_xform, args).get(self.timeout)
+
+
+class _CompilerServer(BaseManager):
+    pass
+
+
+class _CompilerClient(BaseManager):
+    pass
+
+_CompilerClient.register('get_compiler')
+
+
+def serve(address, processes, timeout):
+    ''' Compile XForms for every process on this host that connects to
+    `address`, in a single pool of `processes` worker processes. Never
+    returns; see the run_xform_compiler management command '''
+    address = parse_address(address)
+    if not isinstance(address, tuple) and os.path.exists(address):
+        # Left behind by a server that didn't shut down cleanly
+        os.unlink(address)
+    compiler = _PoolCompiler(processes, timeout)
+    _CompilerServer.register('get_compiler', callable=lambda: compiler)
+    manager = _CompilerServer(address=address, authkey=_authkey())
+    manager.get_server().serve_forever()
+
+
+def _describe(error):
+    try:
+        return unicode(error)
+    except UnicodeDecodeError:
+        return str(error).decode('utf-8', 'replace')
+
+
+def _store_failure(result_key, error):
+    ''' Leave the class and message of `error` for the processes waiting for
+    the same compilation '''
+    try:
+        cache.set(result_key, ('error', error.__class__, _describe(error)),
+                  FAILURE_TIMEOUT)
+    except Exception:
+        # The class can't be pickled, e.g. because it isn't defined at the
+        # top level of a module
+        cache.set(result_key, ('error', RuntimeError, _describe(error)),
+                  FAILURE_TIMEOUT)
+
+
+def _raise_failure(error_class, message):
+    try:
+        error = error_class(message)
+    except Exception:
+        error = RuntimeError(message)
+    raise error
+
+
+def _store_result(result_key, result, chunk_size=CHUNK_SIZE):
+    ''' Cache the XML in pieces small enough for any cache backend, and
+    then the warnings along with the number of pieces '''
+    xml, warnings = result
+    data = xml.encode('utf-8')
+    chunks = [data[i:i + chunk_size]
+              for i in range(0, len(data), chunk_size)] or ['']
+    cache.set_many(dict(
+        (CHUNK_KEY.format(result_key, i), chunk)
+        for i, chunk in enumerate(chunks)
+    ), RESULT_TIMEOUT)
+    cache.set(result_key, ('ok', len(chunks), warnings), RESULT_TIMEOUT)
+
+
+def _load_result(result_key):
+    ''' Return the cached XML and warnings, or None if there are none.
+    Raises the error of a cached failure '''
+    entry = cache.get(result_key)
+    if entry is None:
+        return None
+    if entry[0] == 'error':
+        _raise_failure(*entry[1:])
+    chunk_count, warnings = entry[1:]
+    chunk_keys = [CHUNK_KEY.format(result_key, i)
+                  for i in range(chunk_count)]
+    chunks = cache.get_many(chunk_keys)
+    if len(chunks) != chunk_count:
+        # Some pieces have been evicted
+        return None
+    xml = ''.join(chunks[k] for k in chunk_keys).decode('utf-8')
+    # Callers may modify the warnings
+    return xml, list(warnings)
+
+
+class _LockRenewer(threading.Thread):
+    ''' Keeps renewing a lock until stopped, so that it can expire soon
+    after its holder dies however long a compilation takes '''
+    def __init__(self, lock_key):
+        super(_LockRenewer, self).__init__()
+        self.daemon = True
+        self.lock_key = lock_key
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(LOCK_TIMEOUT / 3.0):
+            cache.set(self.lock_key, True, LOCK_TIMEOUT)
+
+
+class XFormCompiler(object):
+    ''' Compiles XForms in a bounded pool of processes, so that a burst of
+    snapshot requests does not tie up every web worker running pyxform.
+    The pool belongs to the server listening at `address`, normally one
+    per host, which both the web and the Celery processes use; see
+    serve(). A process that can't reach it uses a pool of its own with
+    the same number of `processes`, or compiles inline if it can't have
+    children, as in a Celery worker.
+
+    Concurrent requests with the same key, normally
+    AssetSnapshot.source_hash, share a single compilation even across
+    processes, provided they share the cache (see settings.CACHES): one
+    compiles and leaves its result, or its error, in the cache for the
+    others. Metrics go to kpi.utils.instrumentation under
+    `xform_compiler.*` '''
+    def __init__(self, processes=2, timeout=None, address=None):
+        self.processes = processes
+        self.timeout = timeout or 60 * 60
+        self.address = address
+        self._remote = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._queue_depth = 0
+
+    def _get_remote(self):
+        if not self.address:
+            return None
+        with self._lock:
+            if self._remote is None:
+                manager = _CompilerClient(
+                    address=parse_address(self.address), authkey=_authkey())
+                try:
+                    manager.connect()
+                except (EnvironmentError, EOFError,
+                        multiprocessing.AuthenticationError):
+                    increment_counter('xform_compiler.server_unavailable')
+                    return None
+                self._remote = manager.get_compiler()
+            return self._remote
+
+    def _get_pool(self):
+        if self.processes <= 0 or multiprocessing.current_process().daemon:
+            return None
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            return self._pool
+
+    def _change_queue_depth(self, amount):
+        with self._lock:
+            self._queue_depth += amount
+            set_gauge('xform_compiler.queue_depth', self._queue_depth)
+
+    def _execute(self, args):
+        remote = self._get_remote()
+        if remote is not None:
+            try:
+                return remote.compile(*args)
+            except (EnvironmentError, EOFError):
+                # The server went away; reconnect next time
+                with self._lock:
+                    self._remote = None
+                increment_counter('xform_compiler.server_unavailable')
+        pool = self._get_pool()
+        if pool is None:
+            return compile_xform(*args)
+        # `get()` without a timeout can't be interrupted in Python 2
+        return pool.apply_async(compile_xform, args).get(self.timeout)
+
+    def _run(self, args):
+        self._change_queue_depth(1)
+        start = default_timer()
+        try:
+            return self._execute(args)
+        finally:
+            self._change_queue_depth(-1)
+            increment_counter('xform_compiler.compilations')
+            increment_counter(
+                'xform_compiler.compile_seconds', default_timer() - start)
+
+    def compile(self, key, source, default_name, default_language,
+                default_id_string):
+        ''' Return the XML and warnings for `source`; see compile_xform().
+        If another process or thread is already compiling the same `key`,
+        wait for its result, or raise its error, instead of compiling
+        again. Pass `key=None` to always compile '''
+        args = (source, default_name, default_language, default_id_string)
+        if key is None:
+            return self._run(args)
+        lock_key = LOCK_KEY.format(key)
+        result_key = RESULT_KEY.format(key)
+        deadline = default_timer() + self.timeout
+        waited = False
+        while not cache.add(lock_key, True, LOCK_TIMEOUT):
+            # Someone else is compiling
+            if not waited:
+                increment_counter('xform_compiler.deduplicated')
+                waited = True
+            result = _load_result(result_key)
+            if result is not None:
+                return result
+            if default_timer() > deadline:
+                raise RuntimeError(
+                    'Timed out waiting for another XForm compilation')
+            time.sleep(POLL_INTERVAL)
+        renewer = _LockRenewer(lock_key)
+        renewer.start()
+        try:
+            # The lock is ours, but a previous holder may have finished
+            # between our checks
+            result = _load_result(result_key) if waited else None
+            if result is None:
+                try:
+                    result = self._run(args)
+                except Exception, e:
+                    _store_failure(result_key, e)
+                    raise
+                _store_result(result_key, result)
+        finally:
+            renewer.stopped.set()
+            renewer.join()
+            cache.delete(lock_key)
+        xml, warnings = result
+        return xml, list(warnings)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+
+_compiler = None
+_compiler_lock = threading.Lock()
+
+
+def get_xform_compiler():
+    ''' Return the process-wide XFormCompiler, configured by
+    settings.XFORM_COMPILER_PROCESSES, XFORM_COMPILER_ADDRESS and
+    XFORM_COMPILER_TIMEOUT '''
+    global _compiler
+    with _compiler_lock:
+        if _compiler is None:
+            _compiler = XFormCompiler(
+                processes=settings.XFORM_COMPILER_PROCESSES,
+                timeout=settings.XFORM_COMPILER_TIMEOUT,
+                address=settings.XFORM_COMPILER_ADDRESS,
+            )
+        return _compiler
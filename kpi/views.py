@@ -6,10 +6,12 @@ import datetime
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.db.models import Q
 from django.forms import model_to_dict
 from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import StreamingHttpResponse
 from django.utils.http import is_safe_url
 from django.shortcuts import get_object_or_404, resolve_url
 from django.template.response import TemplateResponse
@@ -27,6 +29,7 @@ from rest_framework import (
 )
 from rest_framework.decorators import api_view
 from rest_framework.decorators import detail_route
+from rest_framework.decorators import list_route
 from rest_framework.decorators import authentication_classes
 from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
@@ -49,7 +52,11 @@ from .models import (
     OneTimeAuthenticationKey,
     UserCollectionSubscription,
     )
-from .models.object_permission import get_anonymous_user, get_objects_for_user
+from .models.object_permission import (
+    get_anonymous_user,
+    get_database_user_id,
+    get_objects_for_user,
+)
 from .models.authorized_application import ApplicationTokenAuthentication
 from .model_utils import disable_auto_field_update
 from .permissions import (
@@ -62,7 +69,8 @@ from .renderers import (
     SSJsonRenderer,
     XFormRenderer,
     AssetSnapshotXFormRenderer,
-    XlsRenderer,)
+    XlsRenderer,
+    XlsxRenderer,)
 from .serializers import (
     AssetSerializer, AssetListSerializer,
     AssetSnapshotSerializer,
@@ -72,12 +80,15 @@ from .serializers import (
     TagSerializer, TagListSerializer,
     ImportTaskSerializer, ImportTaskListSerializer,
     ObjectPermissionSerializer,
+    BulkObjectPermissionSerializer,
     AuthorizedApplicationUserSerializer,
     OneTimeAuthenticationKeySerializer,
     DeploymentSerializer,
     UserCollectionSubscriptionSerializer,)
+from .utils.artifact_cache import read_artifact
 from .utils.gravatar_url import gravatar_url
 from .utils.ss_structure_to_mdtable import ss_structure_to_mdtable
+from .utils.permission_cache import get_permission_cache
 from .tasks import import_in_background
 from deployment_backends.backends import DEPLOYMENT_BACKENDS
 
@@ -133,6 +144,21 @@ class NoUpdateModelViewSet(
     pass
 
 
+class PermissionCachePrimingMixin(object):
+    '''
+    Load the requesting user's permissions on an entire page of objects at
+    once, so that checking each object afterwards does not hit the database
+    '''
+    def paginate_queryset(self, queryset):
+        page = super(PermissionCachePrimingMixin, self).paginate_queryset(
+            queryset)
+        permission_cache = get_permission_cache()
+        if page is not None and permission_cache is not None:
+            # The anonymous user's permissions are always loaded
+            permission_cache.prime(page, self.request.user)
+        return page
+
+
 class ObjectPermissionViewSet(NoUpdateModelViewSet):
     queryset = ObjectPermission.objects.all()
     serializer_class = ObjectPermissionSerializer
@@ -169,7 +195,49 @@ class ObjectPermissionViewSet(NoUpdateModelViewSet):
             instance.permission.codename
         )
 
-class CollectionViewSet(viewsets.ModelViewSet):
+    def _get_bulk_data(self):
+        serializer = BulkObjectPermissionSerializer(
+            data=self.request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        # Make sure the requesting user has the share_ permission on
+        # the affected object
+        affected_object = serializer.validated_data['content_object']
+        if not self._requesting_user_can_share(affected_object):
+            raise exceptions.PermissionDenied()
+        return serializer.validated_data
+
+    @list_route(methods=['post'])
+    def bulk_assign(self, request, *args, **kwargs):
+        '''
+        Assign every permission in `permissions` to every user in `users` on
+        `content_object`, recalculating descendants only once
+        '''
+        data = self._get_bulk_data()
+        try:
+            new_permissions = data['content_object'].assign_perms_bulk(
+                data['users'], data['permissions'], deny=data['deny'])
+        except ValidationError as e:
+            raise exceptions.ValidationError(e.messages)
+        serializer = ObjectPermissionSerializer(
+            new_permissions, many=True, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @list_route(methods=['post'])
+    def bulk_remove(self, request, *args, **kwargs):
+        '''
+        Revoke every permission in `permissions` from every user in `users`
+        on `content_object`, recalculating descendants only once
+        '''
+        data = self._get_bulk_data()
+        try:
+            data['content_object'].remove_perms_bulk(
+                data['users'], data['permissions'])
+        except ValidationError as e:
+            raise exceptions.ValidationError(e.messages)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class CollectionViewSet(PermissionCachePrimingMixin,
+                        viewsets.ModelViewSet):
     # Filtering handled by KpiObjectPermissionsFilter.filter_queryset()
     queryset = Collection.objects.select_related(
         'owner', 'parent'
@@ -265,12 +333,8 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (SearchFilter,)
 
     def get_queryset(self, *args, **kwargs):
+        # get_objects_for_user() handles AnonymousUser
         user = self.request.user
-        # Check if the user is anonymous. The
-        # django.contrib.auth.models.AnonymousUser object doesn't work for
-        # queries.
-        if user.is_anonymous():
-            user = get_anonymous_user()
 
         def _get_tags_on_items(content_type_name, avail_items):
             '''
@@ -501,6 +565,7 @@ class AssetSnapshotViewSet(NoUpdateModelViewSet):
         It is useful for debugging pyxform transformations
         '''
         snapshot = self.get_object()
+        snapshot.record_access()
         response_data = copy.copy(snapshot.details)
         options = {
             'linenos': True,
@@ -514,6 +579,7 @@ class AssetSnapshotViewSet(NoUpdateModelViewSet):
     @detail_route(renderer_classes=[renderers.TemplateHTMLRenderer])
     def preview(self, request, *args, **kwargs):
         snapshot = self.get_object()
+        snapshot.record_access()
         if snapshot.details.get('status') == 'success':
             preview_url = "{}{}?form={}".format(
                               settings.ENKETO_SERVER,
@@ -539,7 +605,7 @@ def change_redirect_to_form_assign(data):
     return data
 
 
-class AssetViewSet(viewsets.ModelViewSet):
+class AssetViewSet(PermissionCachePrimingMixin, viewsets.ModelViewSet):
     """
     * Assign a asset to a collection <span class='label label-warning'>partially implemented</span>
     * Run a partial update of a asset <span class='label label-danger'>TODO</span>
@@ -565,8 +631,20 @@ class AssetViewSet(viewsets.ModelViewSet):
                         SSJsonRenderer,
                         XFormRenderer,
                         XlsRenderer,
+                        XlsxRenderer,
                         )
 
+    def retrieve(self, request, *args, **kwargs):
+        if isinstance(request.accepted_renderer, XlsRenderer):
+            # Send spreadsheets as they are read from disk instead of
+            # holding the whole file in memory
+            renderer = request.accepted_renderer
+            return StreamingHttpResponse(
+                renderer.stream(self.get_object()),
+                content_type=renderer.media_type
+            )
+        return super(AssetViewSet, self).retrieve(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.action == 'list':
             return AssetListSerializer
@@ -646,8 +724,10 @@ class AssetViewSet(viewsets.ModelViewSet):
     @detail_route(renderer_classes=[renderers.StaticHTMLRenderer])
     def table_view(self, request, *args, **kwargs):
         sa = self.get_object()
-        md_table = ss_structure_to_mdtable(sa.to_ss_structure())
-        return Response(md_table.strip())
+        md_table = read_artifact(
+            sa, 'mdtable', lambda: ss_structure_to_mdtable(
+                sa.to_ss_structure()).strip().encode('utf-8'))
+        return Response(md_table.decode('utf-8'))
 
     @detail_route(renderer_classes=[renderers.StaticHTMLRenderer])
     def xls(self, request, *args, **kwargs):
@@ -656,7 +736,7 @@ class AssetViewSet(viewsets.ModelViewSet):
     @detail_route(renderer_classes=[renderers.TemplateHTMLRenderer])
     def xform(self, request, *args, **kwargs):
         asset = self.get_object()
-        export = asset.get_export(regenerate=True)
+        export = asset.get_export()
         # TODO-- forward to AssetSnapshotViewset.xform
         response_data = copy.copy(export.details)
         options = {
@@ -786,13 +866,9 @@ class UserCollectionSubscriptionViewSet(viewsets.ModelViewSet):
     lookup_field = 'uid'
 
     def get_queryset(self):
-        user = self.request.user
-        # Check if the user is anonymous. The
-        # django.contrib.auth.models.AnonymousUser object doesn't work for
-        # queries.
-        if user.is_anonymous():
-            user = get_anonymous_user()
-        criteria = {'user': user}
+        # The django.contrib.auth.models.AnonymousUser object doesn't work for
+        # queries
+        criteria = {'user_id': get_database_user_id(self.request.user)}
         if 'collection__uid' in self.request.query_params:
             criteria['collection__uid'] = self.request.query_params[
                 'collection__uid']